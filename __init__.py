@@ -2,31 +2,100 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_bootstrap import Bootstrap
 from flask_login import LoginManager
+from flask_mail import Mail
 from config import Config
+from app.database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 bootstrap = Bootstrap()
 login_manager = LoginManager()
 login_manager.login_view = 'main.login'
+mail = Mail()
 
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__)
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
 
+    # Pool settings and the read replica must be set before the engines exist
+    from app import database
+    database.configure(app)
     db.init_app(app)
     bootstrap.init_app(app)
     login_manager.init_app(app)
+    mail.init_app(app)
 
     with app.app_context():
         # Import models
         from app import models
 
-        # Create tables
-        db.create_all()
+        # SQLite pragmas for every new connection
+        database.init_app(app, db)
+
+        # Create tables, then bring existing ones up to date (or leave it
+        # to `flask db-upgrade`, see SCHEMA_SETUP_ON_START)
+        if app.config['SCHEMA_SETUP_ON_START']:
+            db.create_all()
+        from app import migrations, query_plans
+        migrations.init_app(app)
+        query_plans.init_app(app)
+
+        # Incrementally maintained dashboard counters, event ratings and
+        # per-event sales rollups
+        from app import analytics, ratings, stats
+        stats.init_app(app)
+        ratings.init_app(app)
+        analytics.init_app(app)
+
+        # Password hashing settings and the verification pool
+        from app import passwords
+        passwords.init_app(app)
+
+        # Page cache for anonymous traffic, user cache for logged-in users
+        from app import cache, user_cache
+        cache.init_app(app)
+        user_cache.init_app(app)
+
+        # Background jobs (ticket issuance, emails)
+        from app import jobs, tickets
+        jobs.init_app(app)
+        tickets.init_app(app)
+
+        # Checkout: ticket holds, their expiry sweep, payments and waitlists
+        from app import booking, payments, waitlist
+        booking.init_app(app)
+        payments.init_app(app)
+        waitlist.init_app(app)
+
+        # Event image uploads and their resized variants
+        from app import images
+        images.init_app(app)
+
+        # Background weather enrichment for event pages
+        from app import weather
+        weather.init_app(app)
+
+        # Bulk CSV / JSON Lines import and export
+        from app import transfer
+        transfer.init_app(app)
+
+        # Request latency, SQL and template timings, /metrics, profiling
+        from app import instrumentation
+        instrumentation.init_app(app)
+
+        # Full-text search index for the events catalog
+        from app import search
+        search.init_app(app)
 
         # Import and register blueprints
         from app.routes import main as main_blueprint
         app.register_blueprint(main_blueprint)
+        from app.api import api as api_blueprint
+        app.register_blueprint(api_blueprint)
+
+        # Warm up in a prefork parent, see app.preload
+        if app.config['PRELOAD']:
+            from app import preload
+            preload.preload(app)
 
     return app
@@ -0,0 +1,185 @@
+# Per-event sales analytics for organizers.
+#
+# Confirmed bookings are rolled up per event into hourly and daily buckets
+# in event_sales_stat by Booking mapper hooks, in the same transaction as
+# the booking (the same way app.stats keeps the site-wide daily rollup).
+# Charts and the JSON API read a bounded range of buckets for one event,
+# so their cost doesn't grow with the number of bookings.
+# Bulk inserts skip the hooks; run `flask analytics-reconcile` after them.
+
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import case, delete, event as sa_event, func, insert, inspect, literal, select
+
+from app import db
+from app.models import Booking, EventSalesStat
+from app.stats import increment
+
+PERIODS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+# Default and largest number of buckets the API returns
+DEFAULT_BUCKETS = {'hour': 48, 'day': 30}
+MAX_BUCKETS = {'hour': 24 * 14, 'day': 366}
+
+
+def init_app(app):
+    app.cli.add_command(reconcile_command)
+
+
+def bucket_start(moment, period):
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _record(conn, booking, sign):
+    moment = booking.booking_date or datetime.utcnow()
+    deltas = {'bookings': sign,
+              'tickets': sign * (booking.tickets_count or 1),
+              'revenue': sign * (booking.total_amount or 0.0)}
+    for period in PERIODS:
+        increment(conn, EventSalesStat,
+                  {'event_id': booking.event_id, 'period': period,
+                   'bucket': bucket_start(moment, period)}, deltas)
+
+
+@sa_event.listens_for(Booking, 'after_insert')
+def _booking_inserted(mapper, connection, target):
+    if target.status == 'confirmed':
+        _record(connection, target, 1)
+
+
+@sa_event.listens_for(Booking, 'after_update')
+def _booking_updated(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+    was_confirmed = 'confirmed' in (history.deleted or ())
+    if target.status == 'confirmed' and not was_confirmed:
+        _record(connection, target, 1)
+    elif was_confirmed and target.status != 'confirmed':
+        _record(connection, target, -1)
+
+
+@sa_event.listens_for(Booking, 'after_delete')
+def _booking_deleted(mapper, connection, target):
+    if target.status == 'confirmed':
+        _record(connection, target, -1)
+
+
+def series(event_id, period='day', buckets=None, until=None):
+    # The last `buckets` buckets up to `until`, oldest first, with empty
+    # buckets filled in
+    step = PERIODS[period]
+    buckets = max(1, min(buckets or DEFAULT_BUCKETS[period], MAX_BUCKETS[period]))
+    end = bucket_start(until or datetime.utcnow(), period)
+    start = end - step * (buckets - 1)
+
+    rows = db.session.execute(
+        select(EventSalesStat.bucket, EventSalesStat.bookings,
+               EventSalesStat.tickets, EventSalesStat.revenue)
+        .where(EventSalesStat.event_id == event_id,
+               EventSalesStat.period == period,
+               EventSalesStat.bucket >= start,
+               EventSalesStat.bucket <= end)).all()
+    found = {row.bucket: row for row in rows}
+
+    points = []
+    for i in range(buckets):
+        bucket = start + step * i
+        row = found.get(bucket)
+        points.append({'bucket': bucket.isoformat(),
+                       'bookings': row.bookings if row else 0,
+                       'tickets': row.tickets if row else 0,
+                       'revenue': round(row.revenue, 2) if row else 0.0})
+    return points
+
+
+def sell_through(event):
+    sold = (event.capacity or 0) - (event.available_tickets or 0)
+    percent = 100.0 * sold / event.capacity if event.capacity else 0.0
+    return sold, round(percent, 1)
+
+
+def summaries(events, now=None):
+    # {event id: totals} for the organizer dashboard, one query for all events
+    now = now or datetime.utcnow()
+    ids = [event.id for event in events]
+    if not ids:
+        return {}
+    last_day = bucket_start(now, 'hour') - timedelta(hours=23)
+    last_week = bucket_start(now, 'day') - timedelta(days=6)
+    daily = EventSalesStat.period == 'day'
+    hourly = EventSalesStat.period == 'hour'
+
+    def total(column, condition):
+        return func.coalesce(func.sum(case((condition, column), else_=0)), 0)
+
+    # Every daily bucket (lifetime revenue) plus the last 24 hourly ones
+    rows = db.session.execute(
+        select(EventSalesStat.event_id,
+               total(EventSalesStat.revenue, daily),
+               total(EventSalesStat.tickets,
+                     daily & (EventSalesStat.bucket >= last_week)),
+               total(EventSalesStat.tickets,
+                     hourly & (EventSalesStat.bucket >= last_day)))
+        .where(EventSalesStat.event_id.in_(ids),
+               daily | (EventSalesStat.bucket >= last_day))
+        .group_by(EventSalesStat.event_id)).all()
+    totals = {row[0]: row[1:] for row in rows}
+
+    result = {}
+    for event in events:
+        revenue, week, day = totals.get(event.id, (0.0, 0, 0))
+        sold, percent = sell_through(event)
+        result[event.id] = {
+            'capacity': event.capacity,
+            'sold': sold,
+            'sell_through': percent,
+            'revenue': round(revenue or 0.0, 2),
+            'tickets_last_24h': day or 0,
+            'tickets_last_7d': week or 0,
+        }
+    return result
+
+
+def event_report(event, period='day', buckets=None):
+    report = summaries([event])[event.id]
+    report.update(event_id=event.id, title=event.title, period=period,
+                  series=series(event.id, period, buckets))
+    return report
+
+
+def reconcile_connection(conn):
+    if conn.dialect.name == 'sqlite':
+        # Same text format SQLAlchemy stores DateTime in, so the hooks'
+        # upserts hit these rows
+        buckets = {
+            'hour': func.strftime('%Y-%m-%d %H:00:00.000000', Booking.booking_date),
+            'day': func.strftime('%Y-%m-%d 00:00:00.000000', Booking.booking_date),
+        }
+    else:
+        buckets = {period: func.date_trunc(period, Booking.booking_date)
+                   for period in PERIODS}
+
+    conn.execute(delete(EventSalesStat))
+    for period, bucket in buckets.items():
+        rollup = (select(Booking.event_id, literal(period), bucket,
+                         func.count(),
+                         func.coalesce(func.sum(Booking.tickets_count), 0),
+                         func.coalesce(func.sum(Booking.total_amount), 0.0))
+                  .where(Booking.status == 'confirmed')
+                  .group_by(Booking.event_id, bucket))
+        conn.execute(insert(EventSalesStat).from_select(
+            ['event_id', 'period', 'bucket', 'bookings', 'tickets', 'revenue'],
+            rollup))
+
+
+@click.command('analytics-reconcile')
+@with_appcontext
+def reconcile_command():
+    """Rebuild the per-event hourly and daily sales rollups."""
+    with db.engine.begin() as conn:
+        reconcile_connection(conn)
+    click.echo('Event sales rollups rebuilt.')
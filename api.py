@@ -0,0 +1,394 @@
+# Versioned JSON API (/api/v1) for the catalog and the user's bookings.
+#
+# Responses are built from plain column selects, never ORM objects, and
+# ?fields=a,b,c trims them further. Event resources carry an ETag derived
+# from Event.updated_at (plus the event counter for the catalog, so
+# deletions change it too); a conditional GET is answered with 304 after a
+# single indexed query, before the resource itself is loaded. Lists use the
+# same keyset cursors as the HTML catalog.
+#
+# Booking creates a hold (see app.booking) that the client confirms by
+# paying for it; while an event has a waitlist, its tickets go there
+# first. Authentication is the site's session cookie. Writes only accept
+# JSON bodies, which browsers won't send cross-site without a CORS
+# preflight.
+
+import hashlib
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from types import SimpleNamespace
+
+from flask import Blueprint, abort, current_app, jsonify, request
+from flask_login import current_user
+from sqlalchemy import func, select
+from werkzeug.exceptions import HTTPException
+
+from app import db, search, waitlist
+from app.booking import BookingError, HoldExpired, SoldOut, hold_tickets
+from app.cache import normalized_args
+from app.images import event_image_url
+from app.models import Booking, Event, StatCounter
+from app.pagination import keyset_rows
+from app.payments import PaymentDeclined, PaymentError, pay_for_booking
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+EVENT_FIELDS = {
+    'id': Event.id,
+    'title': Event.title,
+    'description': Event.description,
+    'date': Event.date,
+    'time': Event.time,
+    'location': Event.location,
+    'address': Event.address,
+    'category': Event.category,
+    'price': Event.price,
+    'capacity': Event.capacity,
+    'available_tickets': Event.available_tickets,
+    'status': Event.status,
+    'organizer_id': Event.organizer_id,
+    'rating': Event.rating_avg,
+    'review_count': Event.review_count,
+    'updated_at': Event.updated_at,
+}
+# Fields computed in Python: name: (columns needed, function of the row)
+EVENT_COMPUTED = {
+    'image_url': ((Event.image, Event.image_variants), event_image_url),
+}
+EVENT_LIST_FIELDS = ('id', 'title', 'date', 'time', 'location', 'category',
+                     'price', 'available_tickets', 'rating', 'review_count',
+                     'image_url')
+EVENT_DETAIL_FIELDS = tuple(EVENT_FIELDS) + tuple(EVENT_COMPUTED)
+
+BOOKING_FIELDS = {
+    'id': Booking.id,
+    'booking_number': Booking.booking_number,
+    'event_id': Booking.event_id,
+    'event_title': Event.title,
+    'event_date': Event.date,
+    'tickets_count': Booking.tickets_count,
+    'total_amount': Booking.total_amount,
+    'status': Booking.status,
+    'booking_date': Booking.booking_date,
+    'expires_at': Booking.expires_at,
+}
+
+
+@api.errorhandler(HTTPException)
+def _error(e):
+    response = jsonify(error=e.description)
+    response.status_code = e.code
+    return response
+
+
+def login_required(view):
+    # flask_login's version redirects to the login page
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not current_user.is_authenticated:
+            abort(401, 'Login required.')
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def _json_body():
+    if not request.is_json:
+        abort(415, 'Send the request body as application/json.')
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        abort(400, 'Invalid JSON body.')
+    return data
+
+
+# Field selection
+
+def requested_fields(available, default):
+    raw = request.args.get('fields')
+    if not raw:
+        return list(default)
+    names = ['id']
+    for name in raw.split(','):
+        name = name.strip()
+        if name and name not in names:
+            names.append(name)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        abort(400, f'Unknown fields: {", ".join(unknown)}.')
+    return names
+
+
+def columns_for(names, fields, computed=None):
+    # Labelled columns to select for the fields, plus whatever the computed
+    # ones need (labelled by column name)
+    columns = {}
+    for name in names:
+        if computed and name in computed:
+            for column in computed[name][0]:
+                columns.setdefault(column.key, column.label(column.key))
+        else:
+            columns[name] = fields[name].label(name)
+    return list(columns.values())
+
+
+def records(rows, columns):
+    # keyset_rows hands back plain tuples, give the values their names again
+    keys = [column.key for column in columns]
+    return [SimpleNamespace(**dict(zip(keys, row))) for row in rows]
+
+
+def serialize(row, names, computed=None):
+    item = {}
+    for name in names:
+        if computed and name in computed:
+            value = computed[name][1](row)
+        else:
+            value = getattr(row, name)
+        item[name] = value.isoformat() if isinstance(value, datetime) else value
+    return item
+
+
+# Conditional requests
+
+def make_etag(*parts):
+    # The query string is part of the representation (fields, filters)
+    raw = repr((parts, normalized_args())).encode()
+    return hashlib.sha1(raw).hexdigest()
+
+
+def _http_time(moment):
+    # Last-Modified has whole seconds and our timestamps are naive UTC
+    return moment.replace(microsecond=0, tzinfo=timezone.utc)
+
+
+def _set_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _http_time(last_modified)
+    # Caches may store the response but must revalidate it every time
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag, last_modified=None):
+    # A 304 response if the client's copy is still current, else None.
+    # If-None-Match wins over If-Modified-Since when both are sent.
+    if request.if_none_match:
+        fresh = request.if_none_match.contains(etag)
+    elif request.if_modified_since and last_modified is not None:
+        fresh = _http_time(last_modified) <= request.if_modified_since
+    else:
+        fresh = False
+    if not fresh:
+        return None
+    return _set_validators(current_app.response_class(status=304),
+                           etag, last_modified)
+
+
+def catalog_version():
+    # Changes whenever any event is created, updated or deleted
+    events = (select(StatCounter.value).where(StatCounter.name == 'events')
+              .scalar_subquery())
+    return tuple(db.session.execute(
+        select(func.max(Event.updated_at), events)).one())
+
+
+def per_page_arg():
+    per_page = min(
+        request.args.get('per_page', current_app.config['EVENTS_PER_PAGE'], type=int),
+        current_app.config['EVENTS_MAX_PER_PAGE'])
+    return max(per_page, 1)
+
+
+# Events
+
+@api.route('/events')
+def events():
+    # Deleting an event leaves max(updated_at) alone, so the catalog has an
+    # ETag but no Last-Modified
+    etag = make_etag('events', *catalog_version())
+    response = not_modified(etag)
+    if response is not None:
+        return response
+
+    names = requested_fields(EVENT_FIELDS.keys() | EVENT_COMPUTED.keys(),
+                             EVENT_LIST_FIELDS)
+    columns = columns_for(names, EVENT_FIELDS, EVENT_COMPUTED)
+    query = db.session.query(*columns).filter(Event.status == 'active')
+
+    # Same filters and ordering as main.events
+    search_query = request.args.get('q', '').strip()
+    rank = None
+    if search_query:
+        query, rank = search.apply_search(query, search_query)
+
+    category = request.args.get('category', '')
+    if category:
+        query = query.filter(Event.category == category)
+
+    date = request.args.get('date', '')
+    if date:
+        try:
+            day = datetime.strptime(date, '%Y-%m-%d')
+        except ValueError:
+            abort(400, 'date must be YYYY-MM-DD.')
+        query = query.filter(Event.date >= day, Event.date < day + timedelta(days=1))
+
+    min_rating = request.args.get('min_rating', type=float)
+    if min_rating:
+        query = query.filter(Event.rating_avg >= min_rating)
+
+    keys = [(Event.date, False), (Event.id, False)]
+    if request.args.get('sort') == 'rating':
+        keys.insert(0, (Event.rating_avg, True))
+    elif rank is not None:
+        keys.insert(0, (rank, False))
+
+    rows, next_cursor = keyset_rows(query, keys, request.args.get('after'),
+                                    per_page_arg())
+    response = jsonify(events=[serialize(row, names, EVENT_COMPUTED)
+                               for row in records(rows, columns)],
+                       next_cursor=next_cursor)
+    return _set_validators(response, etag)
+
+
+@api.route('/events/<int:event_id>')
+def event_detail(event_id):
+    updated_at = db.session.scalar(
+        select(Event.updated_at).where(Event.id == event_id))
+    if updated_at is None:
+        abort(404, 'Event not found.')
+    etag = make_etag('event', event_id, updated_at)
+    response = not_modified(etag, updated_at)
+    if response is not None:
+        return response
+
+    names = requested_fields(EVENT_FIELDS.keys() | EVENT_COMPUTED.keys(),
+                             EVENT_DETAIL_FIELDS)
+    row = db.session.execute(
+        select(*columns_for(names, EVENT_FIELDS, EVENT_COMPUTED))
+        .where(Event.id == event_id)).one_or_none()
+    if row is None:
+        abort(404, 'Event not found.')
+    return _set_validators(jsonify(serialize(row, names, EVENT_COMPUTED)),
+                           etag, updated_at)
+
+
+@api.route('/events/<int:event_id>/bookings', methods=['POST'])
+@login_required
+def book_event(event_id):
+    data = _json_body()
+    tickets_count = data.get('tickets', 1)
+    max_tickets = current_app.config['MAX_TICKETS_PER_BOOKING']
+    if (not isinstance(tickets_count, int) or isinstance(tickets_count, bool)
+            or not 1 <= tickets_count <= max_tickets):
+        abort(400, f'tickets must be a number from 1 to {max_tickets}.')
+
+    # hold_tickets only needs the id and price
+    event = db.session.execute(
+        select(Event.id, Event.price, Event.organizer_id)
+        .where(Event.id == event_id)).one_or_none()
+    if event is None:
+        abort(404, 'Event not found.')
+    if event.organizer_id == current_user.id:
+        abort(403, 'You cannot book your own event.')
+
+    if waitlist.has_waiting(event_id):
+        abort(409, 'Tickets for this event go to the waitlist first.')
+
+    # A pending booking holding the tickets until it's paid for
+    try:
+        booking = hold_tickets(event, current_user.id, tickets_count)
+    except SoldOut as e:
+        abort(409, str(e))
+    except BookingError as e:
+        abort(503, str(e))
+
+    return jsonify(booking=_booking(booking.id, list(BOOKING_FIELDS))), 201
+
+
+@api.route('/events/<int:event_id>/waitlist', methods=['POST'])
+@login_required
+def join_waitlist(event_id):
+    data = _json_body()
+    tickets_count = data.get('tickets', 1)
+    max_tickets = current_app.config['MAX_TICKETS_PER_BOOKING']
+    if (not isinstance(tickets_count, int) or isinstance(tickets_count, bool)
+            or not 1 <= tickets_count <= max_tickets):
+        abort(400, f'tickets must be a number from 1 to {max_tickets}.')
+
+    event = db.session.get(Event, event_id)
+    if event is None:
+        abort(404, 'Event not found.')
+    if event.organizer_id == current_user.id:
+        abort(403, 'You cannot book your own event.')
+    try:
+        entry = waitlist.join(event, current_user.id, tickets_count)
+    except BookingError as e:
+        abort(409, str(e))
+
+    if entry.status == 'promoted':
+        return jsonify(status='promoted',
+                       booking=_booking(entry.booking_id, list(BOOKING_FIELDS))), 201
+    return jsonify(status='waiting', position=waitlist.position(entry)), 201
+
+
+# Bookings
+
+def _bookings_query(columns):
+    return (db.session.query(*columns)
+            .select_from(Booking).join(Event, Event.id == Booking.event_id)
+            .filter(Booking.user_id == current_user.id))
+
+
+def _booking(booking_id, names):
+    row = (_bookings_query(columns_for(names, BOOKING_FIELDS))
+           .filter(Booking.id == booking_id).one())
+    return serialize(row, names)
+
+
+@api.route('/me/bookings/<int:booking_id>/payment', methods=['POST'])
+@login_required
+def pay_booking(booking_id):
+    data = _json_body()
+    token = data.get('token')
+    if not isinstance(token, str) or not token:
+        abort(400, 'token is required.')
+    payment_method = data.get('method', 'card')
+    if not isinstance(payment_method, str):
+        abort(400, 'method must be a string.')
+
+    booking = db.session.get(Booking, booking_id)
+    if booking is None or booking.user_id != current_user.id:
+        abort(404, 'Booking not found.')
+    try:
+        pay_for_booking(booking, token, payment_method[:50])
+    except HoldExpired as e:
+        abort(410, str(e))
+    except PaymentDeclined as e:
+        # Werkzeug has no exception for 402 Payment Required
+        return jsonify(error=str(e)), 402
+    except PaymentError as e:
+        abort(503, str(e))
+    except BookingError as e:
+        abort(409, str(e))
+
+    return jsonify(booking=_booking(booking_id, list(BOOKING_FIELDS)))
+
+
+@api.route('/me/bookings')
+@login_required
+def my_bookings():
+    names = requested_fields(BOOKING_FIELDS, BOOKING_FIELDS)
+    columns = columns_for(names, BOOKING_FIELDS)
+    keys = [(Booking.booking_date, True), (Booking.id, True)]
+    rows, next_cursor = keyset_rows(_bookings_query(columns), keys,
+                                    request.args.get('after'), per_page_arg())
+    response = jsonify(bookings=[serialize(row, names)
+                                 for row in records(rows, columns)],
+                       next_cursor=next_cursor)
+    # Bookings have no modification time, so the ETag is a hash of the body:
+    # a revalidation still runs the query but skips sending it again
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
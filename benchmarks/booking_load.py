@@ -0,0 +1,120 @@
+# Concurrent booking load test.
+#
+# Starts N workers that all try to book the same event until it sells out,
+# then checks that no tickets were oversold and reports bookings/sec.
+#
+#   python -m benchmarks.booking_load --workers 32 --capacity 2000
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.common import make_app
+
+
+def seed(app, workers, capacity):
+    from app import db
+    from app.models import User, Event
+
+    with app.app_context():
+        organizer = User(email='organizer@bench.local', name='Organizer',
+                         role='organizer')
+        organizer.set_password('bench')
+        db.session.add(organizer)
+        users = [User(email=f'user{i}@bench.local', name=f'User {i}')
+                 for i in range(workers)]
+        db.session.add_all(users)
+        db.session.flush()
+        event = Event(title='Flash sale', date=datetime.utcnow(), price=10.0,
+                      capacity=capacity, available_tickets=capacity,
+                      organizer_id=organizer.id, status='active')
+        db.session.add(event)
+        db.session.commit()
+        return event.id, [u.id for u in users]
+
+
+def worker(db_path, event_id, user_id, max_tickets, seed_value):
+    import random
+    from app import db
+    from app.booking import book_tickets, SoldOut
+    from app.models import Event
+
+    app, _ = make_app(db_path)
+    rng = random.Random(seed_value)
+    booked = errors = 0
+    with app.app_context():
+        event = db.session.get(Event, event_id)
+        db.session.expunge(event)
+        while True:
+            try:
+                book_tickets(event, user_id, rng.randint(1, max_tickets))
+                booked += 1
+            except SoldOut:
+                # Smaller requests may still fit, stop only when nothing is left
+                db.session.remove()
+                left = db.session.get(Event, event_id).available_tickets
+                db.session.remove()
+                if left == 0:
+                    break
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    return booked, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--capacity', type=int, default=1000)
+    parser.add_argument('--max-tickets', type=int, default=3,
+                        help='each booking asks for 1..N tickets')
+    parser.add_argument('--db', help='SQLite file to use (default: temp file)')
+    args = parser.parse_args(argv)
+
+    app, db_path = make_app(args.db)
+    event_id, user_ids = seed(app, args.workers, args.capacity)
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.workers) as pool:
+        results = pool.starmap(worker, [
+            (db_path, event_id, user_id, args.max_tickets, i)
+            for i, user_id in enumerate(user_ids)])
+    elapsed = time.perf_counter() - started
+
+    from app import db
+    from app.models import Event, Booking
+    with app.app_context():
+        event = db.session.get(Event, event_id)
+        sold = db.session.query(
+            db.func.coalesce(db.func.sum(Booking.tickets_count), 0)).filter(
+            Booking.event_id == event_id).scalar()
+        bookings = Booking.query.filter_by(event_id=event_id).count()
+        available = event.available_tickets
+
+    errors = sum(e for _, e in results)
+    print(f'workers:        {args.workers}')
+    print(f'capacity:       {args.capacity}')
+    print(f'bookings:       {bookings}')
+    print(f'tickets sold:   {sold}')
+    print(f'available left: {available}')
+    print(f'lock errors:    {errors}')
+    print(f'elapsed:        {elapsed:.2f}s')
+    print(f'bookings/sec:   {bookings / elapsed:.1f}')
+
+    if args.db is None:
+        os.remove(db_path)
+
+    if sold + available != args.capacity or available < 0 or sold > args.capacity:
+        print('FAIL: tickets oversold or lost')
+        return 1
+    print('OK: no oversell')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
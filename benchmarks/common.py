@@ -0,0 +1,67 @@
+# Helpers shared by the benchmark scripts
+
+import os
+import tempfile
+
+from app import create_app
+from config import Config
+
+
+def make_app(db_path=None, **overrides):
+    # Build an app bound to a throwaway SQLite file unless a path is given
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(suffix='.db', prefix='eventhub-bench-')
+        os.close(fd)
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(db_path),
+        'SECRET_KEY': Config.SECRET_KEY or 'benchmark',
+        'WTF_CSRF_ENABLED': False,
+    }
+    settings.update(overrides)
+    config_class = type('BenchmarkConfig', (Config,), settings)
+    return create_app(config_class), db_path
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def seed_events(app, count, chunk_size=5000):
+    # Bulk insert `count` active events owned by one organizer
+    from datetime import datetime, timedelta
+
+    from app import db, search, stats
+    from app.models import User, Event
+
+    categories = ['concert', 'conference', 'workshop', 'sports', 'festival',
+                  'other']
+    start = datetime(2030, 1, 1)
+    with app.app_context():
+        organizer = User(email='catalog@bench.local', name='Catalog',
+                         role='organizer')
+        db.session.add(organizer)
+        db.session.commit()
+        for offset in range(0, count, chunk_size):
+            rows = [{
+                'title': f'Event {i}',
+                'description': f'Benchmark event number {i} with some text',
+                'date': start + timedelta(minutes=7 * i),
+                'time': '20:00',
+                'location': f'City {i % 50}',
+                'category': categories[i % len(categories)],
+                'price': float(i % 80),
+                'capacity': 100,
+                'available_tickets': 100,
+                'organizer_id': organizer.id,
+                'status': 'active',
+                'created_at': start,
+            } for i in range(offset, min(offset + chunk_size, count))]
+            db.session.execute(db.insert(Event), rows)
+            db.session.commit()
+        # Bulk inserts skip the mapper hooks, so refresh derived data
+        if search.is_enabled():
+            search.rebuild()
+        stats.reconcile()
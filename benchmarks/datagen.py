@@ -0,0 +1,192 @@
+# Seeded synthetic data for benchmarks.
+#
+# Builds attendees, organizers, events, bookings and reviews with bulk
+# inserts, so millions of bookings take minutes rather than hours. The same
+# seed and counts always give the same data. Every account's password is
+# "bench"; emails are user<i>@example.com, organizer<i>@example.com and
+# admin@example.com. Popular events get far more bookings than the long
+# tail, and no event is ever oversold.
+#
+# Bulk inserts skip the mapper hooks, so the search index, stats, rating
+# aggregates and sales rollups are rebuilt at the end.
+#
+#   python -m benchmarks.datagen --db bench.db --scale medium
+#   python -m benchmarks.datagen --db big.db --bookings 2000000
+
+import argparse
+import random
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta
+
+from benchmarks.common import make_app
+
+SCALES = {
+    'small': {'users': 500, 'organizers': 20, 'events': 1000,
+              'bookings': 10000, 'reviews': 2000},
+    'medium': {'users': 20000, 'organizers': 200, 'events': 20000,
+               'bookings': 200000, 'reviews': 50000},
+    'large': {'users': 200000, 'organizers': 2000, 'events': 100000,
+              'bookings': 2000000, 'reviews': 500000},
+}
+CATEGORIES = ['concert', 'conference', 'workshop', 'sports', 'festival', 'other']
+CITIES = ['Berlin', 'Paris', 'London', 'Madrid', 'Rome', 'Vienna', 'Prague',
+          'Lisbon', 'Amsterdam', 'Warsaw', 'Dublin', 'Oslo']
+WORDS = ['live', 'night', 'summer', 'open', 'air', 'jazz', 'rock', 'tech',
+         'data', 'design', 'marathon', 'cup', 'folk', 'electronic', 'classic']
+CHUNK_SIZE = 5000
+NOW = datetime(2030, 1, 1)
+
+
+def _popular(rng, count):
+    # Skewed towards low indexes: a few events sell most tickets
+    return min(int(count * rng.random() ** 3), count - 1)
+
+
+def _booking_choices(seed, events, bookings):
+    # (event index, tickets, status) per booking; replayable from the seed.
+    # No pending bookings: those are holds with an expiry on the real clock
+    # (see app.booking), and hold_sweep/waitlist seed their own.
+    rng = random.Random(f'{seed}:bookings')
+    for _ in range(bookings):
+        status = 'confirmed' if rng.random() < 0.9 else 'cancelled'
+        yield _popular(rng, events), rng.randint(1, 4), status
+
+
+def _insert(conn, table, rows):
+    if rows:
+        conn.execute(table.insert(), rows)
+
+
+def generate(app, users, organizers, events, bookings, reviews, seed=42,
+             chunk_size=CHUNK_SIZE, progress=None):
+    from app import db, search, stats
+    from app.models import Booking, Event, Review, User
+    from app.analytics import reconcile_connection as reconcile_sales
+    from app.ratings import reconcile_connection as reconcile_ratings
+
+    def report(message):
+        if progress is not None:
+            progress(message)
+
+    rng = random.Random(seed)
+    with app.app_context():
+        template = User(email='template@example.com')
+        template.set_password('bench')
+        password_hash = template.password_hash
+
+        with db.engine.begin() as conn:
+            # Users: admin, then organizers, then attendees
+            accounts = ([('admin@example.com', 'Admin', 'admin')]
+                        + [(f'organizer{i}@example.com', f'Organizer {i}', 'organizer')
+                           for i in range(organizers)]
+                        + [(f'user{i}@example.com', f'User {i}', 'attendee')
+                           for i in range(users)])
+            first_user = (conn.execute(db.select(db.func.max(User.id))).scalar() or 0) + 1
+            for offset in range(0, len(accounts), chunk_size):
+                _insert(conn, User.__table__, [{
+                    'email': email, 'name': name, 'role': role,
+                    'password_hash': password_hash,
+                    'phone': f'+49{rng.randrange(10 ** 9, 10 ** 10)}',
+                    'created_at': NOW - timedelta(days=rng.uniform(0, 720)),
+                } for email, name, role in accounts[offset:offset + chunk_size]])
+            organizer_ids = range(first_user + 1, first_user + 1 + organizers)
+            attendee_ids = range(first_user + 1 + organizers,
+                                 first_user + 1 + organizers + users)
+            report(f'{len(accounts)} users')
+
+            # Tickets sold per event, so capacity can cover them
+            sold = array('l', [0]) * events
+            for index, tickets, status in _booking_choices(seed, events, bookings):
+                if status == 'confirmed':
+                    sold[index] += tickets
+
+            first_event = (conn.execute(db.select(db.func.max(Event.id))).scalar() or 0) + 1
+            for offset in range(0, events, chunk_size):
+                rows = []
+                for i in range(offset, min(offset + chunk_size, events)):
+                    capacity = max(rng.choice((50, 100, 250, 1000, 5000)), sold[i])
+                    date = NOW + timedelta(days=rng.uniform(-180, 365))
+                    rows.append({
+                        'title': ' '.join(rng.sample(WORDS, 3)).title() + f' {i}',
+                        'description': ' '.join(rng.choices(WORDS, k=30)),
+                        'date': date,
+                        'time': f'{date:%H:%M}',
+                        'location': rng.choice(CITIES),
+                        'category': rng.choice(CATEGORIES),
+                        'price': float(rng.choice((0, 10, 25, 49, 99, 150))),
+                        'capacity': capacity,
+                        'available_tickets': capacity - sold[i],
+                        'organizer_id': rng.choice(organizer_ids),
+                        'status': 'active' if rng.random() < 0.95 else 'cancelled',
+                        'created_at': date - timedelta(days=rng.uniform(7, 120)),
+                    })
+                _insert(conn, Event.__table__, rows)
+            report(f'{events} events')
+
+            prices = dict(conn.execute(db.select(Event.id, Event.price)
+                                       .where(Event.id >= first_event)).all())
+            first_booking = (conn.execute(db.select(db.func.max(Booking.id))).scalar() or 0) + 1
+            booking_rng = random.Random(f'{seed}:booking-rows')
+            rows = []
+            for n, (index, tickets, status) in enumerate(
+                    _booking_choices(seed, events, bookings)):
+                event_id = first_event + index
+                rows.append({
+                    'booking_number': f'BK{first_booking + n:010d}',
+                    'event_id': event_id,
+                    'user_id': booking_rng.choice(attendee_ids),
+                    'tickets_count': tickets,
+                    'total_amount': prices[event_id] * tickets,
+                    'booking_date': NOW - timedelta(days=booking_rng.uniform(0, 180)),
+                    'status': status,
+                })
+                if len(rows) >= chunk_size:
+                    _insert(conn, Booking.__table__, rows)
+                    rows = []
+            _insert(conn, Booking.__table__, rows)
+            report(f'{bookings} bookings')
+
+            for offset in range(0, reviews, chunk_size):
+                _insert(conn, Review.__table__, [{
+                    'event_id': first_event + _popular(rng, events),
+                    'user_id': rng.choice(attendee_ids),
+                    'rating': rng.choices((1, 2, 3, 4, 5), (1, 1, 3, 5, 6))[0],
+                    'comment': ' '.join(rng.choices(WORDS, k=12)),
+                    'created_at': NOW - timedelta(days=rng.uniform(0, 180)),
+                } for _ in range(offset, min(offset + chunk_size, reviews))])
+            report(f'{reviews} reviews')
+
+            reconcile_ratings(conn)
+            reconcile_sales(conn)
+
+        if search.is_enabled():
+            search.rebuild()
+        stats.reconcile()
+        report('search index, stats, ratings and sales rollups rebuilt')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', required=True, help='SQLite file to create or extend.')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    for name in SCALES['small']:
+        parser.add_argument(f'--{name}', type=int, help=f'Override the number of {name}.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    counts = dict(SCALES[args.scale])
+    counts.update({name: getattr(args, name) for name in counts
+                   if getattr(args, name) is not None})
+
+    app, _ = make_app(args.db)
+    started = time.perf_counter()
+    generate(app, seed=args.seed, **counts,
+             progress=lambda message: print(
+                 f'{time.perf_counter() - started:8.1f}s  {message}'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+# Memory and time-to-first-byte of the /events catalog.
+#
+# Compares rendering the whole catalog in one page, the default keyset page
+# and the streamed mode at several catalog sizes.
+#
+#   python -m benchmarks.events_catalog --sizes 1000 10000 100000
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+from benchmarks.common import make_app, seed_events
+
+
+def measure(client, url):
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(url, buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks, b'')
+    ttfb = time.perf_counter() - started
+    size = len(first) + sum(len(chunk) for chunk in chunks)
+    total = time.perf_counter() - started
+    response.close()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ttfb, total, peak, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[1000, 10000, 100000])
+    args = parser.parse_args(argv)
+
+    print(f"{'events':>8} {'mode':>8} {'ttfb ms':>10} {'total ms':>10} "
+          f"{'peak MiB':>10} {'bytes':>12}")
+    for size in args.sizes:
+        app, db_path = make_app(EVENTS_MAX_PER_PAGE=size)
+        seed_events(app, size)
+        client = app.test_client()
+        modes = [
+            ('all', f'/events?per_page={size}'),
+            ('page', '/events'),
+            ('stream', '/events?stream=1'),
+        ]
+        client.get('/events')  # warm up templates and the connection pool
+        for mode, url in modes:
+            ttfb, total, peak, length = measure(client, url)
+            print(f'{size:>8} {mode:>8} {ttfb * 1000:>10.1f} '
+                  f'{total * 1000:>10.1f} {peak / 2 ** 20:>10.1f} {length:>12}')
+        os.remove(db_path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+# Expired-hold sweep benchmark.
+#
+# Bulk inserts --holds expired holds spread over --events events, plus
+# --live holds that --payers processes pay for (fake provider) while the
+# sweep runs. Reports holds released/sec and the slowest batch (the longest
+# any sweep transaction holds its locks), then checks that every event's
+# tickets add up: available + held + confirmed == capacity.
+#
+#   python -m benchmarks.hold_sweep --holds 50000 --live 2000 --payers 4
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.common import make_app, percentile
+
+INSERT_CHUNK_SIZE = 5000
+
+
+def seed(app, events, holds, live):
+    from sqlalchemy import insert
+
+    from app import db
+    from app.models import Booking, Event, User
+
+    now = datetime.utcnow()
+    with app.app_context():
+        organizer = User(email='organizer@example.com', name='Organizer',
+                         role='organizer')
+        attendee = User(email='attendee@example.com', name='Attendee')
+        db.session.add_all([organizer, attendee])
+        db.session.flush()
+
+        # Every hold is one ticket; events start with 100 tickets to spare
+        per_event = [0] * events
+        for i in range(holds + live):
+            per_event[i % events] += 1
+        event_rows = [Event(title=f'Sale {i}', date=now + timedelta(days=30),
+                            price=10.0, capacity=count + 100,
+                            available_tickets=100, organizer_id=organizer.id,
+                            status='active')
+                      for i, count in enumerate(per_event)]
+        db.session.add_all(event_rows)
+        db.session.flush()
+        event_ids = [e.id for e in event_rows]
+
+        expired_at = now - timedelta(minutes=1)
+        live_until = now + timedelta(hours=1)
+        rows = [{'booking_number': f'BK-H{i:08d}', 'event_id': event_ids[i % events],
+                 'user_id': attendee.id, 'tickets_count': 1, 'total_amount': 10.0,
+                 'booking_date': now, 'status': 'pending',
+                 'expires_at': expired_at if i < holds else live_until}
+                for i in range(holds + live)]
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            db.session.execute(insert(Booking), rows[start:start + INSERT_CHUNK_SIZE])
+        db.session.commit()
+        live_ids = db.session.scalars(
+            db.select(Booking.id).where(Booking.expires_at == live_until)).all()
+        return attendee.id, live_ids
+
+
+def payer(db_path, booking_ids):
+    from app import db
+    from app.booking import BookingError
+    from app.models import Booking
+    from app.payments import pay_for_booking
+
+    app, _ = make_app(db_path)
+    paid = errors = 0
+    with app.app_context():
+        for booking_id in booking_ids:
+            for _ in range(5):
+                try:
+                    pay_for_booking(db.session.get(Booking, booking_id), 'tok_visa')
+                    paid += 1
+                    break
+                except OperationalError:
+                    db.session.rollback()
+                    errors += 1
+                except BookingError:
+                    db.session.rollback()
+                    break
+    return paid, errors
+
+
+def sweep(app, batch_size):
+    from app.booking import _expire_batch
+
+    durations = []
+    released = 0
+    now = datetime.utcnow()
+    with app.app_context():
+        while True:
+            begin = time.perf_counter()
+            count, _ = _expire_batch(now, batch_size)
+            durations.append(time.perf_counter() - begin)
+            released += count
+            if count < batch_size:
+                return released, durations
+
+
+def check(app):
+    # Events whose tickets don't add up
+    from sqlalchemy import func
+
+    from app import db
+    from app.models import Booking, Event
+
+    with app.app_context():
+        taken = dict(db.session.execute(
+            db.select(Booking.event_id, func.sum(Booking.tickets_count))
+            .where(Booking.status.in_(('pending', 'confirmed')))
+            .group_by(Booking.event_id)).all())
+        return [event.id for event in Event.query.all()
+                if event.available_tickets + taken.get(event.id, 0) != event.capacity]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--holds', type=int, default=20000,
+                        help='expired holds to release')
+    parser.add_argument('--live', type=int, default=1000,
+                        help='live holds paid for during the sweep')
+    parser.add_argument('--events', type=int, default=200)
+    parser.add_argument('--payers', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--db', help='SQLite file to use (default: temp file)')
+    args = parser.parse_args(argv)
+
+    app, db_path = make_app(args.db)
+    _, live_ids = seed(app, args.events, args.holds, args.live)
+
+    chunks = [live_ids[i::args.payers] for i in range(args.payers)] if args.payers else []
+    with multiprocessing.Pool(max(args.payers, 1)) as pool:
+        payments = pool.starmap_async(payer, [(db_path, chunk) for chunk in chunks])
+        started = time.perf_counter()
+        released, durations = sweep(app, args.batch_size)
+        elapsed = time.perf_counter() - started
+        results = payments.get()
+
+    broken = check(app)
+    paid = sum(p for p, _ in results)
+    errors = sum(e for _, e in results)
+    print(f'expired holds:    {args.holds}')
+    print(f'released:         {released}')
+    print(f'batches:          {len(durations)} x {args.batch_size}')
+    print(f'sweep time:       {elapsed:.2f}s')
+    print(f'released/sec:     {released / elapsed:.0f}')
+    print(f'batch p50/max:    {percentile(durations, 50) * 1000:.1f} / '
+          f'{max(durations) * 1000:.1f} ms')
+    print(f'live holds paid:  {paid} / {len(live_ids)} ({errors} lock retries)')
+
+    if args.db is None:
+        os.remove(db_path)
+
+    if released != args.holds or broken:
+        print(f'FAIL: {args.holds - released} holds left, '
+              f'{len(broken)} events with wrong ticket counts')
+        return 1
+    print('OK: every expired hold released, ticket counts add up')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+# Login storm: logins/sec against latency of everything else.
+#
+# Serves the app from a threaded server, keeps --logins threads logging in
+# as fast as they can and meanwhile times catalog requests from --readers
+# threads. Runs once with verification on the request threads and once with
+# the process pool, and reports logins/sec, 503s and catalog p50/p99.
+#
+#   python -m benchmarks.login_storm --logins 32 --seconds 10 --processes 4
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+
+import requests
+from werkzeug.serving import make_server
+
+from benchmarks.common import make_app, percentile, seed_events
+
+
+def run(args, processes):
+    # No page cache, so catalog requests do real work
+    app, db_path = make_app(CACHE_BACKEND='null',
+                            PASSWORD_VERIFY_PROCESSES=processes,
+                            PASSWORD_VERIFY_QUEUE=args.queue)
+    seed_events(app, 500)
+
+    from app import db
+    from app.models import User
+
+    with app.app_context():
+        template = User(email='template@example.com', name='Template')
+        template.set_password('bench')
+        db.session.add_all([User(email=f'user{i}@example.com', name=f'User {i}',
+                                 password_hash=template.password_hash)
+                            for i in range(args.logins)])
+        db.session.commit()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    base = f'http://127.0.0.1:{server.server_port}'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    results = {'logins': 0, 'shed': 0, 'errors': 0, 'latencies': []}
+
+    def login(i):
+        data = {'email': f'user{i}@example.com', 'password': 'bench',
+                'remember': 'no'}
+        while not stop.is_set():
+            response = requests.post(f'{base}/login', data=data,
+                                     allow_redirects=False)
+            with lock:
+                if response.status_code == 302:
+                    results['logins'] += 1
+                elif response.status_code == 503:
+                    results['shed'] += 1
+                else:
+                    results['errors'] += 1
+            if response.status_code == 503:
+                # A real client would back off before retrying
+                time.sleep(0.1)
+
+    def read():
+        with requests.Session() as session:
+            while not stop.is_set():
+                started = time.perf_counter()
+                session.get(f'{base}/events')
+                with lock:
+                    results['latencies'].append(time.perf_counter() - started)
+
+    threads = ([threading.Thread(target=login, args=(i,)) for i in range(args.logins)]
+               + [threading.Thread(target=read) for _ in range(args.readers)])
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    server.shutdown()
+
+    verifier = app.extensions['password_verifier']
+    if verifier is not None:
+        verifier.shutdown()
+    os.remove(db_path)
+
+    latencies = results['latencies']
+    return (results['logins'] / args.seconds, results['shed'], results['errors'],
+            percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--logins', type=int, default=32,
+                        help='Threads logging in concurrently.')
+    parser.add_argument('--readers', type=int, default=4,
+                        help='Threads browsing the catalog meanwhile.')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--queue', type=int, default=16)
+    args = parser.parse_args(argv)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    print(f"{'verify':>10} {'logins/s':>9} {'503s':>6} {'errors':>7} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for label, processes in (('inline', 0), (f'pool x{args.processes}', args.processes)):
+        rate, shed, errors, p50, p99 = run(args, processes)
+        print(f'{label:>10} {rate:>9.1f} {shed:>6} {errors:>7} {p50:>8.1f} {p99:>8.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
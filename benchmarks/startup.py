@@ -0,0 +1,112 @@
+# Cold start benchmark.
+#
+# Starts fresh interpreters and times importing the app package,
+# create_app() and the first two requests, in three modes:
+#
+#   default    schema setup on start (create_all, migrations, search index)
+#   no-schema  SCHEMA_SETUP_ON_START off, as after `flask db-upgrade`
+#   preload    PRELOAD on in a parent that then forks; only the forked
+#              worker's first requests count towards time to first request
+#
+#   python -m benchmarks.startup --runs 5
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Runs in the child interpreter; prints one JSON line of timings
+CHILD = r'''
+import json, os, sys, time
+started = time.perf_counter()
+import app
+from config import Config
+imported = time.perf_counter()
+
+settings = json.loads(sys.argv[1])
+config_class = type('StartupConfig', (Config,), settings)
+application = app.create_app(config_class)
+created = time.perf_counter()
+
+def first_requests():
+    begin = time.perf_counter()
+    client = application.test_client()
+    status = client.get('/api/v1/events').status_code
+    first = time.perf_counter() - begin
+    client.get('/api/v1/events?per_page=5')
+    return status, first, time.perf_counter() - begin - first
+
+result = {'import': imported - started, 'create': created - imported}
+if settings.get('PRELOAD'):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read)
+        status, first, second = first_requests()
+        os.write(write, json.dumps([status, first, second]).encode())
+        os._exit(0)
+    os.close(write)
+    with os.fdopen(read) as pipe:
+        status, first, second = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+else:
+    status, first, second = first_requests()
+result.update(status=status, first_request=first, second_request=second)
+print(json.dumps(result))
+'''
+
+MODES = {
+    'default': {},
+    'no-schema': {'SCHEMA_SETUP_ON_START': False},
+    'preload': {'SCHEMA_SETUP_ON_START': False, 'PRELOAD': True},
+}
+STEPS = ('import', 'create', 'first_request', 'second_request')
+
+
+def run_child(settings):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(p or os.getcwd() for p in sys.path))
+    output = subprocess.run([sys.executable, '-c', CHILD, json.dumps(settings)],
+                            capture_output=True, text=True, env=env, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5, help='interpreters per mode')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--db', help='SQLite file to use (default: temp file)')
+    args = parser.parse_args(argv)
+
+    db_path = args.db
+    if db_path is None:
+        fd, db_path = tempfile.mkstemp(suffix='.db', prefix='eventhub-startup-')
+        os.close(fd)
+    base = {
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + os.path.abspath(db_path),
+        'SECRET_KEY': 'benchmark',
+    }
+    # Build the schema once so the skipping modes find it in place
+    run_child(base)
+
+    failed = False
+    print(f'{"mode":<10} ' + ' '.join(f'{step:>15}' for step in STEPS) + f' {"total":>10}')
+    for mode in args.modes:
+        results = [run_child({**base, **MODES[mode]}) for _ in range(args.runs)]
+        failed |= any(r['status'] != 200 for r in results)
+        medians = {step: statistics.median(r[step] for r in results) for step in STEPS}
+        total = medians['import'] + medians['create'] + medians['first_request']
+        print(f'{mode:<10} ' + ' '.join(f'{medians[step] * 1000:>12.1f} ms' for step in STEPS)
+              + f' {total * 1000:>7.1f} ms')
+    print(f'total = import + create + first request, median of {args.runs} runs; '
+          'with preload the first two are paid once, in the parent')
+
+    if args.db is None:
+        os.remove(db_path)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+# Route benchmarks: throughput and latency percentiles for the hot routes.
+#
+# Copies the database (so booking runs can be repeated), drives each route
+# through the Flask test client and reports requests/sec, p50/p95/p99 and
+# SQL statements per request. The page cache is off unless --cache is given,
+# so the numbers measure real work.
+#
+# Results can be saved as JSON and compared with an earlier run; routes
+# whose p50 or p95 got more than --threshold slower are flagged and the
+# exit status is 1.
+#
+#   python -m benchmarks.datagen --db bench.db --scale medium
+#   python -m benchmarks.suite --db bench.db --output before.json
+#   ... change something ...
+#   python -m benchmarks.suite --db bench.db --compare before.json
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.common import make_app, percentile
+
+
+def _event_id(ctx, rng):
+    # Mostly popular events, like real traffic
+    events = ctx['event_ids']
+    return events[min(int(len(events) * rng.random() ** 3), len(events) - 1)]
+
+
+# name: (client, method, url(ctx, rng), form data)
+SCENARIOS = {
+    'index': ('anonymous', 'GET', lambda ctx, rng: '/', None),
+    'events': ('anonymous', 'GET', lambda ctx, rng: '/events', None),
+    'events_next_page': ('anonymous', 'GET',
+                         lambda ctx, rng: f"/events?after={ctx['cursor']}", None),
+    'events_category': ('anonymous', 'GET',
+                        lambda ctx, rng: f"/events?category={rng.choice(ctx['categories'])}",
+                        None),
+    'events_search': ('anonymous', 'GET',
+                      lambda ctx, rng: f"/events?q={rng.choice(ctx['words'])}", None),
+    'events_by_rating': ('anonymous', 'GET', lambda ctx, rng: '/events?sort=rating', None),
+    'event_detail': ('anonymous', 'GET',
+                     lambda ctx, rng: f'/event/{_event_id(ctx, rng)}', None),
+    'dashboard': ('attendee', 'GET', lambda ctx, rng: '/dashboard', None),
+    'organizer_dashboard': ('organizer', 'GET', lambda ctx, rng: '/dashboard', None),
+    'admin_dashboard': ('admin', 'GET', lambda ctx, rng: '/admin', None),
+    'book_event': ('attendee', 'POST',
+                   lambda ctx, rng: f'/event/{_event_id(ctx, rng)}/book',
+                   {'tickets_count': '1'}),
+}
+ACCOUNTS = {'attendee': 'user0@example.com', 'organizer': 'organizer0@example.com',
+            'admin': 'admin@example.com'}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _context(app):
+    from app import db
+    from app.models import Event
+    from app.pagination import encode_cursor
+
+    with app.app_context():
+        event_ids = db.session.scalars(
+            db.select(Event.id).where(Event.status == 'active',
+                                      Event.available_tickets > 100)
+            .order_by(Event.id)).all()
+        second_page = db.session.execute(
+            db.select(Event.date, Event.id).where(Event.status == 'active')
+            .order_by(Event.date, Event.id)
+            .offset(app.config['EVENTS_PER_PAGE'] - 1).limit(1)).first()
+    if not event_ids or second_page is None:
+        raise SystemExit('Not enough data, run benchmarks.datagen first.')
+    return {'event_ids': event_ids, 'cursor': encode_cursor(list(second_page)),
+            'categories': ['concert', 'conference', 'workshop', 'sports'],
+            'words': ['jazz', 'rock', 'summer', 'tech', 'marathon']}
+
+
+def _clients(app):
+    clients = {'anonymous': app.test_client()}
+    for role, email in ACCOUNTS.items():
+        client = app.test_client()
+        response = client.post('/login', data={'email': email, 'password': 'bench',
+                                               'remember': 'no'})
+        if response.status_code != 302:
+            raise SystemExit(f'Could not log in {email}; was the data made by datagen?')
+        clients[role] = client
+    return clients
+
+
+def run_route(app, clients, ctx, name, requests, warmup, seed):
+    from app import instrumentation
+
+    role, method, url, data = SCENARIOS[name]
+    client = clients[role]
+    rng = random.Random(seed)
+    for _ in range(warmup):
+        client.open(url(ctx, rng), method=method, data=data)
+
+    instrumentation.reset()
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(requests):
+        target = url(ctx, rng)
+        begin = time.perf_counter()
+        response = client.open(target, method=method, data=data)
+        latencies.append(time.perf_counter() - begin)
+        if response.status_code >= 400:
+            errors += 1
+    elapsed = time.perf_counter() - started
+
+    statements = sum(s['queries'] for s in instrumentation.endpoint_stats().values())
+    return {
+        'requests': requests,
+        'errors': errors,
+        'throughput': requests / elapsed,
+        'mean_ms': sum(latencies) / len(latencies) * 1000,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'statements': statements / requests,
+    }
+
+
+def compare(baseline, results, threshold, floor_ms):
+    # Routes where p50 or p95 is more than `threshold` (and floor_ms) slower
+    regressions = []
+    for name, new in results['routes'].items():
+        old = baseline['routes'].get(name)
+        if old is None:
+            continue
+        for field in ('p50_ms', 'p95_ms'):
+            if (new[field] > old[field] * (1 + threshold)
+                    and new[field] - old[field] > floor_ms):
+                regressions.append((name, field, old[field], new[field]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', required=True, help='SQLite file made by benchmarks.datagen.')
+    parser.add_argument('--routes', nargs='+', choices=sorted(SCENARIOS),
+                        default=list(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--cache', action='store_true', help='Keep the page cache on.')
+    parser.add_argument('--output', help='Write results to this JSON file.')
+    parser.add_argument('--compare', help='Earlier results to compare against.')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Relative slowdown that counts as a regression.')
+    parser.add_argument('--floor-ms', type=float, default=0.5,
+                        help='Ignore slowdowns smaller than this.')
+    args = parser.parse_args(argv)
+
+    fd, db_path = tempfile.mkstemp(suffix='.db', prefix='eventhub-suite-')
+    os.close(fd)
+    shutil.copyfile(args.db, db_path)
+
+    overrides = {'QUERY_BUDGET_STRICT': False}
+    if not args.cache:
+        overrides['CACHE_BACKEND'] = 'null'
+    app, _ = make_app(db_path, **overrides)
+    try:
+        ctx = _context(app)
+        clients = _clients(app)
+        with app.app_context():
+            from app import stats
+            totals = stats.get_totals()
+
+        results = {
+            'meta': {
+                'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'database': os.path.abspath(args.db),
+                'totals': totals,
+                'requests': args.requests,
+                'cache': args.cache,
+            },
+            'routes': {},
+        }
+
+        print(f"{'route':<20} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} "
+              f"{'p99 ms':>8} {'stmts':>6} {'errors':>6}")
+        for name in args.routes:
+            r = run_route(app, clients, ctx, name, args.requests, args.warmup, args.seed)
+            results['routes'][name] = r
+            print(f"{name:<20} {r['throughput']:>8.1f} {r['p50_ms']:>8.2f} "
+                  f"{r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['statements']:>6.1f} "
+                  f"{r['errors']:>6}")
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Results written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold, args.floor_ms)
+        print(f"\nCompared with {args.compare} ({baseline['meta'].get('commit')}):")
+        for name in args.routes:
+            old = baseline['routes'].get(name)
+            if old is not None:
+                new = results['routes'][name]
+                change = (new['p95_ms'] / old['p95_ms'] - 1) * 100 if old['p95_ms'] else 0.0
+                print(f"  {name:<20} p95 {old['p95_ms']:>8.2f} -> {new['p95_ms']:>8.2f} ms "
+                      f"({change:+.0f}%)")
+        for name, field, old, new in regressions:
+            print(f'REGRESSION {name} {field}: {old:.2f} -> {new:.2f} ms')
+        if regressions:
+            return 1
+        print('No regressions.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,67 @@
+# Bulk ticket issuance throughput.
+#
+# Issues tickets for one event through app.tickets.issue_tickets_bulk and
+# reports tickets/sec for the insert and the QR rendering separately.
+#
+#   python -m benchmarks.tickets --counts 1000 50000 --processes 8
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+def run(count, processes):
+    from benchmarks.common import make_app
+
+    upload_folder = tempfile.mkdtemp(prefix='eventhub-tickets-')
+    app, db_path = make_app(UPLOAD_FOLDER=upload_folder,
+                            TICKET_RENDER_PROCESSES=processes)
+
+    from app import db, tickets
+    from app.models import User, Event
+
+    with app.app_context():
+        organizer = User(email='tickets@bench.local', name='Organizer',
+                         role='organizer')
+        db.session.add(organizer)
+        db.session.flush()
+        event = Event(title='Stadium show', date=datetime(2030, 6, 1),
+                      capacity=count, available_tickets=count,
+                      organizer_id=organizer.id)
+        db.session.add(event)
+        db.session.commit()
+
+        started = time.perf_counter()
+        numbers = tickets.create_tickets(event.id, [organizer.id] * count)
+        db.session.commit()
+        inserted = time.perf_counter()
+        tickets.render_qr_codes(numbers)
+        db.session.commit()
+        rendered = time.perf_counter()
+
+    blobs = sum(len(files) for _, _, files in os.walk(upload_folder))
+    shutil.rmtree(upload_folder)
+    os.remove(db_path)
+    return inserted - started, rendered - inserted, blobs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--counts', type=int, nargs='+', default=[1000, 50000])
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    print(f"{'tickets':>8} {'insert/s':>12} {'render/s':>12} {'total/s':>12} {'files':>8}")
+    for count in args.counts:
+        insert_time, render_time, blobs = run(count, args.processes)
+        print(f'{count:>8} {count / insert_time:>12.0f} {count / render_time:>12.0f} '
+              f'{count / (insert_time + render_time):>12.0f} {blobs:>8}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
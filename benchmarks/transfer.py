@@ -0,0 +1,94 @@
+# Import/export throughput in rows/sec.
+#
+# Writes a CSV and a JSON Lines file of synthetic events, imports each into
+# a fresh database, then exports the events back out, tracking peak Python
+# memory of the export to check that it doesn't grow with the row count.
+#
+#   python -m benchmarks.transfer --rows 20000
+
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import make_app
+
+CATEGORIES = ['concert', 'conference', 'workshop', 'sports', 'festival', 'other']
+COLUMNS = ['title', 'description', 'date', 'time', 'location', 'category',
+           'price', 'capacity']
+
+
+def synthetic_rows(count):
+    for i in range(count):
+        yield [f'Imported event {i}', f'Description of imported event {i}',
+               f'2031-{i % 12 + 1:02d}-{i % 28 + 1:02d}', '19:30',
+               f'City {i % 50}', CATEGORIES[i % len(CATEGORIES)],
+               str(i % 90), str(50 + i % 200)]
+
+
+def write_source(path, fmt, count):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(synthetic_rows(count))
+        else:
+            for row in synthetic_rows(count):
+                f.write(json.dumps(dict(zip(COLUMNS, row))) + '\n')
+
+
+def run(fmt, count, chunk_size):
+    app, db_path = make_app()
+
+    from app import db, transfer
+    from app.models import User
+
+    source = tempfile.mktemp(suffix='.' + fmt)
+    write_source(source, fmt, count)
+    with app.app_context():
+        organizer = User(email='importer@example.com', name='Importer',
+                         role='organizer')
+        db.session.add(organizer)
+        db.session.commit()
+
+        started = time.perf_counter()
+        with open(source, encoding='utf-8') as f:
+            imported, failed = transfer.import_events(
+                transfer.read_rows(f, fmt), organizer.id, chunk_size)
+        import_rate = imported / (time.perf_counter() - started)
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        with open(os.devnull, 'w') as out:
+            columns, rows = transfer.export_rows('events')
+            exported = transfer.write_rows(out, fmt, columns, rows)
+        export_rate = exported / (time.perf_counter() - started)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    os.remove(source)
+    os.remove(db_path)
+    assert failed == 0 and exported == count
+    return import_rate, export_rate, peak / 1024 / 1024
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    print(f"{'format':>6} {'import rows/s':>14} {'export rows/s':>14} "
+          f"{'export peak MB':>15}")
+    for fmt in ('csv', 'jsonl'):
+        import_rate, export_rate, peak = run(fmt, args.rows, args.chunk_size)
+        print(f'{fmt:>6} {import_rate:>14.0f} {export_rate:>14.0f} {peak:>15.1f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
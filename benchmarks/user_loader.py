@@ -0,0 +1,69 @@
+# SQL statements per authenticated request with and without the user cache.
+#
+# Logs in a number of users and replays dashboard requests, then compares
+# the average statements and database time per request.
+#
+#   python -m benchmarks.user_loader --users 50 --requests 2000
+
+import argparse
+import os
+import random
+import sys
+import time
+
+
+def run(users, requests, cache_size):
+    from benchmarks.common import make_app
+
+    app, db_path = make_app(USER_CACHE_SIZE=cache_size)
+
+    from app import db, instrumentation
+    from app.models import User
+
+    with app.app_context():
+        accounts = []
+        for i in range(users):
+            user = User(email=f'user{i}@example.com', name=f'User {i}')
+            user.set_password('bench')
+            accounts.append(user)
+        db.session.add_all(accounts)
+        db.session.commit()
+
+    clients = []
+    for i in range(users):
+        client = app.test_client()
+        response = client.post('/login', data={'email': f'user{i}@example.com',
+                                               'password': 'bench', 'remember': 'no'})
+        if response.status_code != 302:
+            raise SystemExit(f'Could not log in user{i}')
+        clients.append(client)
+
+    instrumentation.reset()
+    rng = random.Random(42)
+    started = time.perf_counter()
+    for _ in range(requests):
+        rng.choice(clients).get('/dashboard')
+    elapsed = time.perf_counter() - started
+
+    stats = instrumentation.endpoint_stats()['main.dashboard']
+    os.remove(db_path)
+    return (stats['queries'] / stats['requests'],
+            stats['query_time'] / stats['requests'] * 1000,
+            requests / elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    print(f"{'user cache':>10} {'stmts/req':>10} {'db ms/req':>10} {'req/s':>10}")
+    for label, size in (('off', 0), ('on', 10000)):
+        statements, db_ms, rate = run(args.users, args.requests, size)
+        print(f'{label:>10} {statements:>10.2f} {db_ms:>10.3f} {rate:>10.0f}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
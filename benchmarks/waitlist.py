@@ -0,0 +1,233 @@
+# Waitlist benchmark: one sold-out event with a long line.
+#
+# Bulk inserts --entries waitlist entries (1-4 tickets each) on one event,
+# times joining the end of the line and looking up a position, then frees
+# --release tickets per round (a capacity increase, as edit_event does)
+# while --promoters processes race to promote the line. Reports entries
+# promoted/sec and the slowest promote call, then checks that promotion
+# was FIFO, nobody was promoted twice and the tickets add up:
+# available + held + confirmed == capacity.
+#
+#   python -m benchmarks.waitlist --entries 100000 --release 5000 --rounds 10
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.common import make_app, percentile
+
+INSERT_CHUNK_SIZE = 5000
+CAPACITY = 500
+
+
+def seed(app, entries):
+    from sqlalchemy import insert
+
+    from app import db
+    from app.models import Booking, Event, User, WaitlistEntry
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    with app.app_context():
+        organizer = User(email='organizer@example.com', name='Organizer',
+                         role='organizer')
+        db.session.add(organizer)
+        db.session.flush()
+        # Sold out: one confirmed booking holds every ticket
+        event = Event(title='Hot show', date=now + timedelta(days=30), price=10.0,
+                      capacity=CAPACITY, available_tickets=0,
+                      organizer_id=organizer.id, status='active')
+        db.session.add(event)
+        db.session.flush()
+        db.session.add(Booking(booking_number='BK-SOLDOUT', event_id=event.id,
+                               user_id=organizer.id, tickets_count=CAPACITY,
+                               total_amount=10.0 * CAPACITY, status='confirmed'))
+        db.session.commit()
+
+        for start in range(0, entries + 1, INSERT_CHUNK_SIZE):
+            end = min(start + INSERT_CHUNK_SIZE, entries + 1)
+            db.session.execute(insert(User), [
+                {'email': f'fan{i}@example.com', 'name': f'Fan {i}'}
+                for i in range(start, end)])
+        db.session.commit()
+        first_fan = organizer.id + 1
+
+        # The last fan joins during the benchmark
+        for start in range(0, entries, INSERT_CHUNK_SIZE):
+            end = min(start + INSERT_CHUNK_SIZE, entries)
+            db.session.execute(insert(WaitlistEntry), [
+                {'event_id': event.id, 'user_id': first_fan + i,
+                 'tickets_count': rng.randint(1, 4), 'status': 'waiting',
+                 'created_at': now}
+                for i in range(start, end)])
+        db.session.commit()
+        return event.id, first_fan + entries
+
+
+def lookups(app, event_id, user_id, repeat):
+    from app import db, waitlist
+    from app.models import Event
+
+    with app.app_context():
+        begin = time.perf_counter()
+        entry = waitlist.join(db.session.get(Event, event_id), user_id, 2)
+        joined = time.perf_counter() - begin
+
+        durations = []
+        for _ in range(repeat):
+            begin = time.perf_counter()
+            place = waitlist.position(entry)
+            durations.append(time.perf_counter() - begin)
+        return joined, place, durations
+
+
+def release(app, event_id, tickets):
+    # What edit_event does when the capacity goes up
+    from sqlalchemy import update
+
+    from app import db
+    from app.models import Event
+
+    with app.app_context():
+        db.session.execute(
+            update(Event).where(Event.id == event_id)
+            .values(capacity=Event.capacity + tickets,
+                    available_tickets=Event.available_tickets + tickets))
+        db.session.commit()
+
+
+def promoter(db_path, event_id, batch_size):
+    from app import db, waitlist
+
+    app, _ = make_app(db_path, SCHEMA_SETUP_ON_START=False)
+    promoted = errors = 0
+    with app.app_context():
+        begin = time.perf_counter()
+        for _ in range(20):
+            try:
+                promoted += waitlist.promote(event_id, batch_size)
+                break
+            except OperationalError:
+                # SQLite's single writer; PostgreSQL would wait on the lock
+                db.session.rollback()
+                errors += 1
+    return promoted, errors, time.perf_counter() - begin
+
+
+def check(app, event_id):
+    # Returns a list of problems, empty if all is well
+    from sqlalchemy import func
+
+    from app import db
+    from app.models import Booking, Event, WaitlistEntry
+
+    problems = []
+    with app.app_context():
+        event = db.session.get(Event, event_id)
+        taken = db.session.scalar(
+            db.select(func.coalesce(func.sum(Booking.tickets_count), 0))
+            .where(Booking.event_id == event_id,
+                   Booking.status.in_(('pending', 'confirmed'))))
+        if event.available_tickets + taken != event.capacity:
+            problems.append(f'tickets: {event.available_tickets} available + '
+                            f'{taken} taken != {event.capacity}')
+
+        last_promoted = db.session.scalar(
+            db.select(func.max(WaitlistEntry.id))
+            .where(WaitlistEntry.event_id == event_id, WaitlistEntry.status == 'promoted'))
+        first_waiting = db.session.scalar(
+            db.select(func.min(WaitlistEntry.id))
+            .where(WaitlistEntry.event_id == event_id, WaitlistEntry.status == 'waiting'))
+        if last_promoted and first_waiting and first_waiting < last_promoted:
+            problems.append(f'not FIFO: entry {first_waiting} still waiting '
+                            f'behind promoted {last_promoted}')
+
+        mismatched = db.session.scalar(
+            db.select(func.count())
+            .select_from(WaitlistEntry)
+            .outerjoin(Booking, Booking.id == WaitlistEntry.booking_id)
+            .where(WaitlistEntry.event_id == event_id,
+                   WaitlistEntry.status == 'promoted',
+                   (Booking.id.is_(None))
+                   | (Booking.user_id != WaitlistEntry.user_id)
+                   | (Booking.tickets_count != WaitlistEntry.tickets_count)))
+        if mismatched:
+            problems.append(f'{mismatched} promoted entries without a matching hold')
+
+        holds = db.session.scalar(
+            db.select(func.count()).select_from(Booking)
+            .where(Booking.event_id == event_id, Booking.status == 'pending'))
+        promoted = db.session.scalar(
+            db.select(func.count()).select_from(WaitlistEntry)
+            .where(WaitlistEntry.event_id == event_id,
+                   WaitlistEntry.status == 'promoted'))
+        if holds != promoted:
+            problems.append(f'{holds} holds for {promoted} promoted entries')
+        return problems, promoted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--entries', type=int, default=100000,
+                        help='people waiting on the event')
+    parser.add_argument('--release', type=int, default=5000,
+                        help='tickets freed per round')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--promoters', type=int, default=4,
+                        help='processes promoting at the same time')
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--db', help='SQLite file to use (default: temp file)')
+    args = parser.parse_args(argv)
+
+    app, db_path = make_app(args.db)
+    started = time.perf_counter()
+    event_id, last_user = seed(app, args.entries)
+    print(f'seeded:           {args.entries} entries in '
+          f'{time.perf_counter() - started:.1f}s')
+
+    joined, place, durations = lookups(app, event_id, last_user, 200)
+    print(f'join (end):       {joined * 1000:.1f} ms, position {place}')
+    print(f'position p50/max: {percentile(durations, 50) * 1000:.2f} / '
+          f'{max(durations) * 1000:.2f} ms')
+
+    calls = []
+    promoted = errors = 0
+    elapsed = 0.0
+    with multiprocessing.Pool(args.promoters) as pool:
+        for _ in range(args.rounds):
+            release(app, event_id, args.release)
+            begin = time.perf_counter()
+            results = pool.starmap(promoter, [(db_path, event_id, args.batch_size)]
+                                   * args.promoters)
+            elapsed += time.perf_counter() - begin
+            promoted += sum(p for p, _, _ in results)
+            errors += sum(e for _, e, _ in results)
+            calls.extend(t for _, _, t in results)
+
+    problems, total = check(app, event_id)
+    print(f'released:         {args.rounds} x {args.release} tickets')
+    print(f'promoted:         {promoted} entries ({errors} lock retries)')
+    print(f'promoted/sec:     {promoted / elapsed:.0f}')
+    print(f'promote p50/max:  {percentile(calls, 50) * 1000:.1f} / '
+          f'{max(calls) * 1000:.1f} ms')
+
+    if args.db is None:
+        os.remove(db_path)
+
+    if promoted != total:
+        problems.append(f'promote() reported {promoted}, {total} entries promoted')
+    if problems:
+        print('FAIL: ' + '; '.join(problems))
+        return 1
+    print('OK: promoted in order, once each, ticket counts add up')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
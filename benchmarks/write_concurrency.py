@@ -0,0 +1,165 @@
+# Write concurrency under SQLite journal settings.
+#
+# Runs --writers processes booking tickets, --readers processes browsing
+# the catalog and --exporters processes running `flask export events` over a
+# --events catalog against the same SQLite file for --seconds, once with
+# SQLite's defaults (rollback journal, synchronous=FULL) and once with the
+# configured pragmas (WAL, synchronous=NORMAL, busy_timeout). It reports
+# bookings/sec, median booking latency, reads/sec and "database is locked"
+# errors. Timing starts once every process has built its app.
+#
+# With the rollback journal a booking can't commit while any statement is
+# reading, and an export is one long statement; with WAL readers don't block
+# the writer. On a single CPU, 8 writers, 8 readers and 1 exporter over
+# 50,000 events gave 2.5 bookings/s (p50 499 ms) and 49 reads/s with the
+# defaults, and 8.9 bookings/s (p50 129 ms) and 376 reads/s tuned. With
+# --exporters 0 throughput is about the same, 8.7 vs 8.5 bookings/s.
+#
+#   python -m benchmarks.write_concurrency --writers 8 --readers 8 --exporters 1
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.common import make_app, percentile, seed_events
+
+DEFAULTS = {'SQLITE_JOURNAL_MODE': '', 'SQLITE_SYNCHRONOUS': '',
+            'SQLITE_BUSY_TIMEOUT': ''}
+
+
+def seed(app, writers):
+    from app import db
+    from app.models import User, Event
+
+    with app.app_context():
+        users = [User(email=f'writer{i}@example.com', name=f'Writer {i}')
+                 for i in range(writers)]
+        db.session.add_all(users)
+        db.session.flush()
+        event = Event(title='Big show', date=datetime(2030, 6, 1), price=20.0,
+                      capacity=10 ** 8, available_tickets=10 ** 8,
+                      organizer_id=users[0].id, status='active')
+        db.session.add(event)
+        db.session.commit()
+        return event.id, [u.id for u in users]
+
+
+def writer(db_path, overrides, event_id, user_id, start, seconds):
+    from app import db
+    from app.booking import book_tickets
+    from app.models import Event
+
+    app, _ = make_app(db_path, **overrides)
+    booked = errors = 0
+    latencies = []
+    with app.app_context():
+        event = db.session.get(Event, event_id)
+        db.session.expunge(event)
+        db.session.commit()
+        start.wait()
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            began = time.perf_counter()
+            try:
+                book_tickets(event, user_id, 1)
+                booked += 1
+                latencies.append(time.perf_counter() - began)
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    return booked, errors, latencies
+
+
+def reader(db_path, overrides, start, seconds):
+    from app import db
+    from app.models import Event
+
+    app, _ = make_app(db_path, **overrides)
+    reads = errors = 0
+    with app.app_context():
+        start.wait()
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            try:
+                (Event.query.filter_by(status='active')
+                 .order_by(Event.date).limit(50).all())
+                db.session.commit()
+                reads += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    return reads, errors
+
+
+def exporter(db_path, overrides, start, seconds):
+    from app import db, transfer
+
+    app, _ = make_app(db_path, **overrides)
+    exports = errors = 0
+    with app.app_context():
+        start.wait()
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            try:
+                _, rows = transfer.export_rows('events')
+                for _ in rows:
+                    pass
+                db.session.commit()
+                exports += 1
+            except OperationalError:
+                db.session.rollback()
+                errors += 1
+    return exports, errors
+
+
+def run(args, overrides):
+    app, db_path = make_app(**overrides)
+    seed_events(app, args.events)
+    event_id, user_ids = seed(app, args.writers)
+
+    processes = args.writers + args.readers + args.exporters
+    with multiprocessing.Manager() as manager, multiprocessing.Pool(processes) as pool:
+        start = manager.Barrier(processes)
+        writes = pool.starmap_async(writer, [
+            (db_path, overrides, event_id, user_id, start, args.seconds)
+            for user_id in user_ids])
+        reads = pool.starmap_async(reader, [
+            (db_path, overrides, start, args.seconds) for _ in range(args.readers)])
+        exports = pool.starmap_async(exporter, [
+            (db_path, overrides, start, args.seconds) for _ in range(args.exporters)])
+        writes, reads, exports = writes.get(), reads.get(), exports.get()
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    latencies = [latency for _, _, per_writer in writes for latency in per_writer]
+    return (sum(b for b, _, _ in writes) / args.seconds,
+            percentile(latencies, 50) * 1000,
+            sum(r for r, _ in reads) / args.seconds,
+            sum(e for _, e, _ in writes) + sum(e for _, e in reads + exports))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--exporters', type=int, default=1)
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args(argv)
+
+    print(f"{'settings':>10} {'bookings/s':>11} {'p50 ms':>8} {'reads/s':>9} "
+          f"{'lock errors':>12}")
+    for label, overrides in (('default', DEFAULTS), ('tuned', {})):
+        bookings, latency, reads, errors = run(args, overrides)
+        print(f'{label:>10} {bookings:>11.1f} {latency:>8.0f} {reads:>9.1f} {errors:>12}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
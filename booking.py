@@ -0,0 +1,230 @@
+# Booking engine: keeps ticket counts correct when many users book at once.
+#
+# Checkout starts with a hold: a pending booking whose tickets are already
+# taken off Event.available_tickets and which expires at Booking.expires_at
+# unless app.payments confirms it first. `flask holds-sweep` puts the
+# tickets of expired holds back, a bounded batch per transaction.
+
+import random
+import string
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db, jobs
+from app.cache import event_changed
+from app.models import Event, Booking
+
+# SystemRandom so forked workers don't share the same random sequence
+_random = random.SystemRandom()
+
+BOOKING_NUMBER_ATTEMPTS = 5
+
+
+class BookingError(Exception):
+    pass
+
+
+class SoldOut(BookingError):
+    pass
+
+
+class HoldExpired(BookingError):
+    pass
+
+
+def init_app(app):
+    app.cli.add_command(sweep_command)
+
+
+def generate_booking_number():
+    return 'BK-' + ''.join(
+        _random.choices(string.ascii_uppercase + string.digits, k=8))
+
+
+def reserve_tickets(event_id, tickets_count):
+    # Conditional decrement in a single UPDATE, so two requests can never
+    # both take the last tickets. Returns False if not enough are left.
+    result = db.session.execute(
+        update(Event)
+        .where(Event.id == event_id,
+               Event.status == 'active',
+               Event.available_tickets >= tickets_count)
+        .values(available_tickets=Event.available_tickets - tickets_count)
+        .execution_options(synchronize_session=False))
+    if result.rowcount != 1:
+        return False
+    event_changed(event_id)
+    return True
+
+
+def release_tickets(event_id, tickets_count):
+    # Put tickets back on sale (the caller commits)
+    db.session.execute(
+        update(Event)
+        .where(Event.id == event_id)
+        .values(available_tickets=Event.available_tickets + tickets_count)
+        .execution_options(synchronize_session=False))
+    event_changed(event_id)
+
+
+def queue_fulfilment(booking):
+    # Tickets and the confirmation email are produced by the job worker,
+    # keyed by booking so each is queued at most once
+    jobs.enqueue('issue_tickets', {'booking_id': booking.id},
+                 key=f'issue_tickets:{booking.booking_number}')
+    jobs.enqueue('send_booking_confirmation', {'booking_id': booking.id},
+                 key=f'booking_email:{booking.booking_number}')
+
+
+def book_tickets(event, user_id, tickets_count=1, status='confirmed',
+                 expires_at=None):
+    if tickets_count < 1:
+        raise BookingError('You must book at least one ticket.')
+
+    if not reserve_tickets(event.id, tickets_count):
+        db.session.rollback()
+        raise SoldOut('No tickets available!')
+
+    # Retry inside a savepoint if the random booking number is already taken
+    for _ in range(BOOKING_NUMBER_ATTEMPTS):
+        booking = Booking(
+            booking_number=generate_booking_number(),
+            event_id=event.id,
+            user_id=user_id,
+            tickets_count=tickets_count,
+            total_amount=event.price * tickets_count,
+            status=status,
+            expires_at=expires_at
+        )
+        try:
+            with db.session.begin_nested():
+                db.session.add(booking)
+        except IntegrityError:
+            continue
+        if status == 'confirmed':
+            queue_fulfilment(booking)
+        db.session.commit()
+        return booking
+
+    db.session.rollback()
+    raise BookingError('Could not create booking, please try again.')
+
+
+def hold_tickets(event, user_id, tickets_count=1):
+    # Pending booking holding the tickets for BOOKING_HOLD_SECONDS while the
+    # user pays, see app.payments.pay_for_booking
+    expires_at = datetime.utcnow() + timedelta(
+        seconds=current_app.config['BOOKING_HOLD_SECONDS'])
+    return book_tickets(event, user_id, tickets_count, status='pending',
+                        expires_at=expires_at)
+
+
+def extend_hold(booking, seconds):
+    # Keep a live hold for at least `seconds` more (the caller commits).
+    # Returns False if it has expired or is no longer pending.
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(Booking)
+        .where(Booking.id == booking.id,
+               Booking.status == 'pending',
+               Booking.expires_at > now)
+        .values(expires_at=max(booking.expires_at or now, now + timedelta(seconds=seconds)))
+        .execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+
+def claim_hold(booking):
+    # Take a pending hold away from the sweeper for good, whether or not it
+    # has expired yet: the sweeper only looks at holds with an expiry. The
+    # row stays locked until the caller commits.
+    result = db.session.execute(
+        update(Booking)
+        .where(Booking.id == booking.id,
+               Booking.status == 'pending',
+               Booking.expires_at.isnot(None))
+        .values(expires_at=None)
+        .execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+
+def _expire_batch(now, batch_size):
+    # One transaction: mark up to batch_size expired holds and give their
+    # tickets back with one UPDATE per event. Holds locked by a concurrent
+    # payment are skipped (PostgreSQL) and picked up by a later sweep.
+    # Returns (holds released, ids of the events that got tickets back).
+    batch = (select(Booking.id)
+             .where(Booking.status == 'pending', Booking.expires_at <= now)
+             .order_by(Booking.expires_at)
+             .limit(batch_size)
+             .with_for_update(skip_locked=True))
+    expired = db.session.execute(
+        update(Booking)
+        .where(Booking.id.in_(batch.scalar_subquery()),
+               Booking.status == 'pending',
+               Booking.expires_at <= now)
+        .values(status='expired')
+        .returning(Booking.event_id, Booking.tickets_count)
+        .execution_options(synchronize_session=False)).all()
+    if not expired:
+        db.session.rollback()
+        return 0, set()
+
+    released = defaultdict(int)
+    for event_id, tickets_count in expired:
+        released[event_id] += tickets_count or 1
+    table = Event.__table__
+    db.session.execute(
+        update(table)
+        .where(table.c.id == bindparam('event_id'))
+        .values(available_tickets=table.c.available_tickets + bindparam('tickets')),
+        [{'event_id': event_id, 'tickets': tickets}
+         for event_id, tickets in released.items()])
+    for event_id in released:
+        event_changed(event_id, db.session)
+    db.session.commit()
+    return len(expired), set(released)
+
+
+def expire_holds(now=None, batch_size=None):
+    # Release every hold that expired before `now` and offer the tickets to
+    # the events' waitlists; returns how many holds were released
+    from app import waitlist
+
+    now = now or datetime.utcnow()
+    batch_size = batch_size or current_app.config['HOLD_SWEEP_BATCH_SIZE']
+    total = 0
+    events = set()
+    while True:
+        count, event_ids = _expire_batch(now, batch_size)
+        total += count
+        events.update(event_ids)
+        if count < batch_size:
+            break
+    for event_id in events:
+        waitlist.promote(event_id)
+    return total
+
+
+@click.command('holds-sweep')
+@click.option('--batch-size', type=int,
+              help='Holds released per transaction (default HOLD_SWEEP_BATCH_SIZE).')
+@click.option('--loop', is_flag=True,
+              help='Keep sweeping every HOLD_SWEEP_INTERVAL seconds.')
+@with_appcontext
+def sweep_command(batch_size, loop):
+    """Release the tickets of expired booking holds."""
+    while True:
+        released = expire_holds(batch_size=batch_size)
+        if released or not loop:
+            click.echo(f'Released {released} expired holds.')
+        if not loop:
+            return
+        db.session.remove()
+        time.sleep(current_app.config['HOLD_SWEEP_INTERVAL'])
@@ -0,0 +1,293 @@
+# Response cache for anonymous page views.
+#
+# Pages are cached by endpoint, view arguments and normalized query string.
+# Each cached page also depends on one or more tags ("catalog",
+# "event:<id>"); the current generation of every tag is part of the key, so
+# invalidating a tag just bumps its generation and the old entries are never
+# read again (they age out of the LRU or expire).
+#
+# Event changes mark their tags on the SQLAlchemy session and the tags are
+# only invalidated once the transaction commits.
+
+import hashlib
+import itertools
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, has_app_context, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.models import Event
+
+CATALOG_TAG = 'catalog'
+_generation_counter = itertools.count()
+
+
+class CacheBackend:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, record=True):
+        # record=False leaves the hit/miss counters alone
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self)}
+
+
+class NullCache(CacheBackend):
+    def get(self, key, record=True):
+        self.misses += record
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+class LRUCache(CacheBackend):
+    # In-process cache, least recently used entries go first when full
+
+    def __init__(self, max_entries=1024, default_ttl=None):
+        super().__init__()
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, record=True):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += record
+                    return value
+                del self._data[key]
+                self.evictions += 1
+            self.misses += record
+            return None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileCache(CacheBackend):
+    # One pickle file per entry, shared by every worker on the machine.
+    # Counters are per process.
+
+    def __init__(self, directory, default_ttl=None):
+        super().__init__()
+        self.directory = directory
+        self.default_ttl = default_ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode()).hexdigest() + '.cache')
+
+    def get(self, key, record=True):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires_at, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            self.misses += record
+            return None
+        if expires_at is not None and expires_at <= time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.evictions += 1
+            self.misses += record
+            return None
+        self.hits += record
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        # Write to a temp file and rename so readers never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires_at, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                os.remove(os.path.join(self.directory, name))
+
+    def __len__(self):
+        return sum(1 for name in os.listdir(self.directory)
+                   if name.endswith('.cache'))
+
+
+def init_app(app):
+    backend = app.config['CACHE_BACKEND']
+    ttl = app.config['CACHE_DEFAULT_TTL']
+    if backend == 'lru':
+        cache = LRUCache(app.config['CACHE_MAX_ENTRIES'], ttl)
+    elif backend == 'file':
+        cache = FileCache(app.config['CACHE_DIR'], ttl)
+    elif backend == 'null':
+        cache = NullCache()
+    else:
+        raise ValueError(f'Unknown CACHE_BACKEND: {backend}')
+    app.extensions['page_cache'] = cache
+
+
+def get_cache():
+    return current_app.extensions['page_cache']
+
+
+def stats():
+    return get_cache().stats()
+
+
+# Tags
+
+def _generation(cache, tag):
+    key = f'gen:{tag}'
+    generation = cache.get(key, record=False)
+    if generation is None:
+        # A lost generation must never come back as an old value, so start
+        # from something unique instead of 0
+        generation = _new_generation()
+        cache.set(key, generation, ttl=0)  # 0: never expires
+    return generation
+
+
+def _new_generation():
+    return f'{time.time_ns():x}.{os.getpid()}.{next(_generation_counter)}'
+
+
+def invalidate(*tags):
+    cache = get_cache()
+    for tag in tags:
+        cache.set(f'gen:{tag}', _new_generation(), ttl=0)
+
+
+def event_tag(event_id):
+    return f'event:{event_id}'
+
+
+def event_changed(event_id, db_session=None):
+    # Invalidate the event's pages once the current transaction commits
+    db_session = db_session or db.session
+    tags = db_session.info.setdefault('cache_tags', set())
+    tags.update((CATALOG_TAG, event_tag(event_id)))
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(db_session):
+    tags = db_session.info.pop('cache_tags', None)
+    if tags and has_app_context() and 'page_cache' in current_app.extensions:
+        invalidate(*tags)
+
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(db_session):
+    db_session.info.pop('cache_tags', None)
+
+
+def _event_mutated(mapper, connection, target):
+    event_changed(target.id, object_session(target))
+
+
+for _hook in ('after_insert', 'after_update', 'after_delete'):
+    sa_event.listen(Event, _hook, _event_mutated)
+
+
+# Views
+
+def normalized_args():
+    # Order-insensitive, ignores blank values and tracking parameters
+    return tuple(sorted(
+        (name, value.strip())
+        for name, value in request.args.items(multi=True)
+        if value.strip() and not name.startswith('utm_')))
+
+
+def cached_view(*tags, timeout=None):
+    # Cache the page for anonymous GET requests. Tags may use the view
+    # arguments, e.g. @cached_view('event:{event_id}').
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if (request.method != 'GET'
+                    or current_user.is_authenticated
+                    or session.get('_flashes')):
+                return view(**kwargs)
+
+            cache = get_cache()
+            resolved = [tag.format(**kwargs) for tag in tags]
+            key = repr((
+                request.endpoint,
+                tuple(sorted(kwargs.items())),
+                normalized_args(),
+                tuple(_generation(cache, tag) for tag in resolved),
+            ))
+
+            cached = cache.get(key)
+            if cached is not None:
+                body, status, mimetype = cached
+                response = current_app.response_class(
+                    body, status=status, mimetype=mimetype)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            response = make_response(view(**kwargs))
+            if (response.status_code == 200 and not response.is_streamed
+                    and 'Set-Cookie' not in response.headers):
+                cache.set(key, (response.get_data(), response.status_code,
+                                response.mimetype), ttl=timeout)
+                response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
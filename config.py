@@ -8,5 +8,115 @@ class Config:
     SECRET_KEY = os.getenv('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool (not used for in-memory SQLite)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # seconds
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+    # Applied to every SQLite connection; empty leaves SQLite's default
+    SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = os.getenv('SQLITE_BUSY_TIMEOUT', '5000')  # ms
+    # Read-only copy of the database for SELECTs in GET requests
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+    # Read from the primary this long after a browser's last write request
+    REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', 5))
+    AUTO_MIGRATE = os.getenv('AUTO_MIGRATE', '1') == '1'
+    # Create missing tables, migrate and build the search index on every
+    # start. Turn off in production and run `flask db-upgrade` on deploy,
+    # so workers boot without inspecting the schema.
+    SCHEMA_SETUP_ON_START = os.getenv('SCHEMA_SETUP_ON_START', '1') == '1'
+    # Import lazily loaded modules and warm up in create_app, for prefork
+    # servers that build the app once in the parent (gunicorn --preload)
+    PRELOAD = os.getenv('PRELOAD', '0') == '1'
     UPLOAD_FOLDER = 'uploads'
-    MAX_CONTENT_LENGTH = 5 * 1024 * 1024  # 5MB max file size
+    MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH', 10 * 1024 * 1024))  # bytes
+    # Larger images are rejected before decoding
+    IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', 40_000_000))
+    TICKET_RENDER_PROCESSES = int(os.getenv('TICKET_RENDER_PROCESSES', os.cpu_count() or 1))
+
+    MAIL_SERVER = os.getenv('MAIL_SERVER', 'localhost')
+    MAIL_PORT = int(os.getenv('MAIL_PORT', 25))
+    MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', '0') == '1'
+    MAIL_USERNAME = os.getenv('MAIL_USERNAME')
+    MAIL_PASSWORD = os.getenv('MAIL_PASSWORD')
+    MAIL_DEFAULT_SENDER = os.getenv('MAIL_DEFAULT_SENDER', MAIL_USERNAME)
+    MAIL_SENDER_NAME = os.getenv('MAIL_SENDER_NAME', 'EventHub')
+
+    # Weather enrichment, disabled unless WEATHER_API_URL is set
+    WEATHER_API_URL = os.getenv('WEATHER_API_URL')
+    WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
+    WEATHER_TTL = int(os.getenv('WEATHER_TTL', 3 * 3600))  # seconds
+    # Failed lookups aren't retried for this long (0 retries every time)
+    WEATHER_FAILURE_TTL = int(os.getenv('WEATHER_FAILURE_TTL', 60))  # seconds
+    WEATHER_TIMEOUT = float(os.getenv('WEATHER_TIMEOUT', 5))  # seconds
+    WEATHER_POOL_SIZE = int(os.getenv('WEATHER_POOL_SIZE', 8))
+    WEATHER_CACHE_SIZE = int(os.getenv('WEATHER_CACHE_SIZE', 1024))
+    WEATHER_LOOKAHEAD_DAYS = int(os.getenv('WEATHER_LOOKAHEAD_DAYS', 14))
+
+    # Background jobs
+    JOB_THREADS = int(os.getenv('JOB_THREADS', 4))
+    JOB_PROCESSES = int(os.getenv('JOB_PROCESSES', 2))
+    JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', 1.0))  # seconds
+    JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 5))
+    JOB_RETRY_BASE_DELAY = int(os.getenv('JOB_RETRY_BASE_DELAY', 10))  # seconds
+    JOB_RETRY_MAX_DELAY = int(os.getenv('JOB_RETRY_MAX_DELAY', 3600))  # seconds
+    JOB_LOCK_TIMEOUT = int(os.getenv('JOB_LOCK_TIMEOUT', 600))  # seconds
+    MAX_TICKETS_PER_BOOKING = int(os.getenv('MAX_TICKETS_PER_BOOKING', 10))
+    # Checkout: tickets are held this long while the user pays
+    BOOKING_HOLD_SECONDS = int(os.getenv('BOOKING_HOLD_SECONDS', 600))
+    # A payment in progress keeps its hold for at least this long
+    PAYMENT_HOLD_EXTENSION = int(os.getenv('PAYMENT_HOLD_EXTENSION', 120))
+    # Promoted waitlist entries get a hold this long, to see the email and pay
+    WAITLIST_HOLD_SECONDS = int(os.getenv('WAITLIST_HOLD_SECONDS', 3600))
+    # Waitlist entries promoted per transaction
+    WAITLIST_PROMOTE_BATCH_SIZE = int(os.getenv('WAITLIST_PROMOTE_BATCH_SIZE', 500))
+    HOLD_SWEEP_BATCH_SIZE = int(os.getenv('HOLD_SWEEP_BATCH_SIZE', 500))
+    HOLD_SWEEP_INTERVAL = float(os.getenv('HOLD_SWEEP_INTERVAL', 15))  # seconds
+    # Payment provider; 'fake' approves any token except tok_declined
+    # (declined) and tok_error (provider failure)
+    PAYMENT_PROVIDER = os.getenv('PAYMENT_PROVIDER', 'fake')
+    PAYMENT_FAKE_DELAY = float(os.getenv('PAYMENT_FAKE_DELAY', 0))  # seconds
+    EVENTS_PER_PAGE = int(os.getenv('EVENTS_PER_PAGE', 24))
+    EVENTS_MAX_PER_PAGE = int(os.getenv('EVENTS_MAX_PER_PAGE', 100))
+    STATS_MAX_STALENESS = int(os.getenv('STATS_MAX_STALENESS', 30))  # seconds
+    # Most SQL statements one request to these endpoints may run
+    QUERY_BUDGETS = {
+        'main.index': 1,
+        'main.events': 2,
+        'main.event_detail': 4,
+        'main.dashboard': 4,
+        'main.event_sales': 4,
+        'main.admin_dashboard': 7,
+        'api.events': 2,
+        'api.event_detail': 2,
+        'api.my_bookings': 2,
+    }
+    QUERY_BUDGET_STRICT = os.getenv('QUERY_BUDGET_STRICT', '0') == '1'
+    # /metrics is open to admins, and to localhost unless this is off
+    METRICS_ALLOW_LOCALHOST = os.getenv('METRICS_ALLOW_LOCALHOST', '1') == '1'
+    # Profile a sample of requests, keep cProfile dumps of those slower than
+    # PROFILE_SLOW_REQUESTS seconds (0 disables)
+    PROFILE_SLOW_REQUESTS = float(os.getenv('PROFILE_SLOW_REQUESTS', 0))
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0.1))
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    # Page cache: 'lru' (per process), 'file' (shared by workers) or 'null'
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'lru')
+    CACHE_DEFAULT_TTL = int(os.getenv('CACHE_DEFAULT_TTL', 300))  # seconds
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 2048))
+    CACHE_DIR = os.getenv('CACHE_DIR', 'cache')
+    # Hash for new passwords; older hashes are replaced on the next login.
+    # The default is werkzeug's (scrypt:32768:8:1), so existing hashes stay.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+    PASSWORD_SALT_LENGTH = int(os.getenv('PASSWORD_SALT_LENGTH', 16))
+    # Verify passwords in a process pool (0 = on the request thread). Logins
+    # beyond PASSWORD_VERIFY_QUEUE in flight are answered with 503.
+    PASSWORD_VERIFY_PROCESSES = int(os.getenv('PASSWORD_VERIFY_PROCESSES', 0))
+    PASSWORD_VERIFY_QUEUE = int(os.getenv('PASSWORD_VERIFY_QUEUE', 32))
+    PASSWORD_VERIFY_TIMEOUT = float(os.getenv('PASSWORD_VERIFY_TIMEOUT', 5))  # seconds
+    # Logged-in user snapshots per process (0 disables)
+    USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 300))  # seconds
+    # How stale other workers' user changes (roles, deletions) may be here
+    USER_CACHE_CHECK_INTERVAL = float(os.getenv('USER_CACHE_CHECK_INTERVAL', 1))  # seconds
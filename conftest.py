@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from jinja2 import ChoiceLoader, DictLoader
+
+from config import Config
+
+# The page templates aren't part of this tree; tests render stand-ins that
+# touch the same attributes and relationships the pages do
+TEMPLATES = {
+    'index.html': 'index',
+    'events.html': '{% for event in events %}{{ event.title }};{% endfor %}',
+    'event_detail.html': (
+        '{{ event.title }} by {{ event.organizer_user.name }}'
+        '{% for review in event.reviews %};{{ review.author.name }}{% endfor %}'),
+    'dashboard.html': (
+        '{% for event in events %}{{ event.title }};{% endfor %}'
+        '{% for booking in bookings %}{{ booking.booking_number }} '
+        '{{ booking.event.title }};{% endfor %}'),
+    'admin_dashboard.html': (
+        '{{ total_users }} {{ total_events }} {{ total_bookings }}'
+        '{% for user in recent_users %}{{ user.email }};{% endfor %}'
+        '{% for event in recent_events %}{{ event.organizer_user.name }};{% endfor %}'
+        '{% for booking in recent_bookings %}{{ booking.user.name }} '
+        '{{ booking.event.title }};{% endfor %}'),
+    'checkout.html': '{{ booking.booking_number }} {{ seconds_left }}',
+    'edit_event.html': 'edit {{ event.title }}',
+    'create_event.html': 'create',
+    'login.html': 'login',
+    'register.html': 'register',
+    'profile.html': 'profile',
+}
+
+
+def create_test_app(tmp_path, **overrides):
+    # Apps made with the same tmp_path share a database, like workers do
+    from app import create_app
+
+    settings = {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "test.db"}',
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'SECRET_KEY': 'test',
+        'CACHE_BACKEND': 'null',
+        # Hashing strength isn't under test here
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+        **overrides,
+    }
+    app = create_app(type('TestConfig', (Config,), settings))
+    app.jinja_loader = ChoiceLoader([DictLoader(TEMPLATES), app.jinja_loader])
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_test_app(tmp_path)
+    yield app
+
+    from app import db
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def seed(app):
+    # An organizer with one event of 10 tickets, an attendee and an admin;
+    # every password is "pw"
+    from app import db
+    from app.models import Event, User
+
+    with app.app_context():
+        users = {}
+        for role in ('organizer', 'attendee', 'admin'):
+            user = User(email=f'{role}@example.com', name=role.title(), role=role)
+            user.set_password('pw')
+            db.session.add(user)
+            users[role] = user
+        db.session.flush()
+        event = Event(title='Concert', description='Live music',
+                      date=datetime.utcnow() + timedelta(days=30), time='20:00',
+                      location='Berlin', category='concert', price=10.0,
+                      capacity=10, available_tickets=10,
+                      organizer_id=users['organizer'].id, status='active')
+        db.session.add(event)
+        db.session.commit()
+        return SimpleNamespace(event_id=event.id,
+                               **{f'{role}_id': user.id for role, user in users.items()})
+
+
+def login(client, email):
+    response = client.post('/login', data={'email': email, 'password': 'pw',
+                                           'remember': 'no'})
+    assert response.status_code == 302
+    return client
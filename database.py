@@ -0,0 +1,138 @@
+# Engine configuration and read-replica routing.
+#
+# configure() turns the DB_* and SQLITE_* settings into engine options
+# before Flask-SQLAlchemy creates the engines; init_app() then applies the
+# SQLite pragmas to every new connection. WAL lets readers carry on while a
+# booking commits, and busy_timeout makes writers wait for the lock instead
+# of failing with "database is locked".
+#
+# With DATABASE_REPLICA_URL set, SELECTs issued while handling GET/HEAD
+# requests go to the replica. Flushes and every other statement use the
+# primary, as do reads for REPLICA_STICKY_SECONDS after the same browser
+# made a write request, so people see their own bookings straight away.
+# Views can call use_primary() when they need fresh data.
+#
+# A forked child (prefork server workers, multiprocessing) starts with
+# empty pools, so no connection is ever shared with the parent.
+
+import os
+import time
+import weakref
+
+from flask import current_app, g, has_request_context, request, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND = 'replica'
+READ_METHODS = ('GET', 'HEAD')
+
+_engines = weakref.WeakSet()
+
+
+def _reset_pools_after_fork():
+    # close=False leaves the parent's connections alone, the child just
+    # stops using them
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
+
+
+class RoutingSession(Session):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _reads_from_replica(clause):
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _reads_from_replica(clause):
+    return (clause is not None
+            and getattr(clause, 'is_select', False)
+            and has_request_context()
+            and request.method in READ_METHODS
+            and not g.get('use_primary')
+            and http_session.get('_primary_until', 0) <= time.time())
+
+
+def use_primary():
+    # Read from the primary for the rest of this request
+    g.use_primary = True
+
+
+def _is_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def _is_memory_sqlite(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def engine_options(config, url):
+    options = {}
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=config['DB_POOL_SIZE'],
+            max_overflow=config['DB_MAX_OVERFLOW'],
+            pool_timeout=config['DB_POOL_TIMEOUT'],
+            pool_recycle=config['DB_POOL_RECYCLE'],
+            pool_pre_ping=config['DB_POOL_PRE_PING'],
+        )
+    return options
+
+
+def configure(app):
+    # Call before db.init_app(); explicit SQLALCHEMY_ENGINE_OPTIONS win
+    config = app.config
+    options = engine_options(config, config['SQLALCHEMY_DATABASE_URI'])
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+    replica_url = config['DATABASE_REPLICA_URL']
+    if replica_url:
+        replica = engine_options(config, replica_url)
+        replica['url'] = replica_url
+        if make_url(replica_url).get_backend_name() == 'postgresql':
+            # Refuse writes even if one slips through
+            replica['connect_args'] = {
+                'options': '-c default_transaction_read_only=on'}
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = replica
+        config['SQLALCHEMY_BINDS'] = binds
+
+
+def init_app(app, db):
+    # Call inside an app context, before anything connects
+    pragmas = [(name, app.config[key]) for name, key in (
+        ('journal_mode', 'SQLITE_JOURNAL_MODE'),
+        ('synchronous', 'SQLITE_SYNCHRONOUS'),
+        ('busy_timeout', 'SQLITE_BUSY_TIMEOUT'),
+    ) if app.config[key] not in (None, '')]
+    for engine in db.engines.values():
+        _engines.add(engine)
+        if _is_sqlite(engine.url) and pragmas:
+            sa_event.listen(engine, 'connect', _pragma_setter(pragmas))
+
+    if app.config['DATABASE_REPLICA_URL']:
+        app.after_request(_stick_to_primary)
+
+
+def _pragma_setter(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+    return set_pragmas
+
+
+def _stick_to_primary(response):
+    if request.method not in READ_METHODS and response.status_code < 400:
+        http_session['_primary_until'] = (
+            time.time() + current_app.config['REPLICA_STICKY_SECONDS'])
+    return response
@@ -1,6 +1,7 @@
 # for user registration and login
 
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, SelectField, TextAreaField, FloatField, IntegerField
 from wtforms.fields import DateField, TimeField  # Add this import
 from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError
@@ -55,6 +56,8 @@ class EventForm(FlaskForm):
     ])  # Changed } to ]
     price = FloatField('Price per Ticket', default=0.0)
     capacity = IntegerField('Total Capacity', default=100)
+    image = FileField('Event Image', validators=[
+                      FileAllowed(['jpg', 'jpeg', 'png', 'webp'], 'Please upload a JPEG, PNG or WebP.')])
     submit = SubmitField('Create Event')
 
 
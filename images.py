@@ -0,0 +1,119 @@
+# Event image uploads.
+#
+# An upload is decoded once with Pillow and re-encoded as a JPEG in each
+# size in VARIANTS. Each variant is stored content-addressed (app.storage)
+# under UPLOAD_FOLDER/images, so its URL changes whenever its bytes do and
+# /media can tell browsers to cache it forever. Event.image_variants holds
+# the variant paths as JSON; Event.image keeps the hero for older code.
+# Pillow is only imported once an upload needs it.
+
+import io
+import json
+import os
+
+from flask import current_app, send_from_directory, url_for
+
+from app.storage import store_blob, upload_path
+
+IMAGE_DIR = 'images'
+# name: (width, height, crop to fill); without crop the image only shrinks.
+# Largest first: each variant is made from the one before, which is much
+# faster than resizing the original every time.
+VARIANTS = {
+    'hero': (1600, 900, False),
+    'card': (480, 270, True),
+    'thumb': (160, 120, True),
+}
+JPEG_QUALITY = 82
+# What uploads may be; EventForm checks the extension, Pillow the content
+FORMATS = ('JPEG', 'PNG', 'WEBP')
+ONE_YEAR = 365 * 24 * 3600
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def init_app(app):
+    app.add_template_global(event_image_url)
+    app.add_url_rule('/media/<path:filename>', 'media', media_view)
+
+
+def _open(data):
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    Image.MAX_IMAGE_PIXELS = current_app.config['IMAGE_MAX_PIXELS']
+    try:
+        image = Image.open(io.BytesIO(data), formats=FORMATS)
+        # Decode JPEGs at a reduced scale when that is still big enough
+        width, height, _ = next(iter(VARIANTS.values()))
+        image.draft('RGB', (width, height))
+        image.load()
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(f'Not a usable image: {e}') from e
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        # JPEG has no alpha, put transparent areas on white
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def render_variants(data):
+    # {variant name: JPEG bytes}
+    from PIL import Image, ImageOps
+
+    image = _open(data)
+    variants = {}
+    for name, (width, height, crop) in VARIANTS.items():
+        if crop:
+            image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        else:
+            image = image.copy()
+            image.thumbnail((width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        # No exif argument, so camera metadata (GPS etc.) is dropped
+        image.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True,
+                   progressive=True)
+        variants[name] = out.getvalue()
+    return variants
+
+
+def save_event_image(file_storage):
+    # Stores every variant, returns {variant name: path under images/}
+    data = file_storage.read()
+    if not data:
+        raise InvalidImage('The uploaded file is empty.')
+    root = upload_path(IMAGE_DIR)
+    return {name: store_blob(root, variant, 'jpg')
+            for name, variant in render_variants(data).items()}
+
+
+def apply_to_event(event, paths):
+    event.image = paths['hero']
+    event.image_variants = json.dumps(paths)
+
+
+def event_image_url(event, variant='card'):
+    # For templates: {{ event_image_url(event, 'thumb') }}
+    if event.image_variants:
+        paths = json.loads(event.image_variants)
+        if variant in paths:
+            return url_for('media', filename=paths[variant])
+    return url_for('static', filename=f'images/{event.image or "default_event.jpg"}')
+
+
+def media_view(filename):
+    # Content-addressed, so the file behind a URL never changes; the
+    # digest in the name doubles as the ETag
+    etag = os.path.splitext(os.path.basename(filename))[0]
+    response = send_from_directory(upload_path(IMAGE_DIR), filename,
+                                   etag=etag, max_age=ONE_YEAR)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
@@ -0,0 +1,255 @@
+# Per-request performance instrumentation.
+#
+# Every request is timed into a latency histogram per endpoint, along with
+# the SQL statements it ran (count and time) and the time spent rendering
+# templates. QUERY_BUDGETS maps endpoints to the most statements a single
+# request may run; over budget is logged, or raises QueryBudgetExceeded
+# when QUERY_BUDGET_STRICT is on (use that in tests).
+#
+# /metrics serves these, plus cache hit counts, in the Prometheus text
+# format. Numbers are per process. It answers admins and requests from
+# localhost (unless METRICS_ALLOW_LOCALHOST is off, e.g. behind a proxy on
+# the same host).
+#
+# With PROFILE_SLOW_REQUESTS set, a PROFILE_SAMPLE_RATE fraction of requests
+# run under cProfile and those slower than the threshold are dumped to
+# PROFILE_DIR for `python -m pstats` or snakeviz. Only one request per
+# process is profiled at a time: since Python 3.12 a second profiler can't
+# be enabled while one runs, and one profile covers every thread anyway.
+
+import cProfile
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+
+from flask import (abort, before_render_template, current_app, g, has_app_context,
+                   request, template_rendered)
+from flask_login import current_user
+from sqlalchemy import event as sa_event
+from sqlalchemy.engine import Engine
+
+# Upper bounds in seconds, Prometheus style (each bucket counts <= le)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+_lock = threading.Lock()
+_endpoint_stats = {}
+# Held while a request is being profiled
+_profile_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_stop_profiler)
+    before_render_template.connect(_template_started, app)
+    template_rendered.connect(_template_finished, app)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+
+@sa_event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@sa_event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if has_app_context() and 'query_count' in g:
+        g.query_count += 1
+        g.query_time += time.perf_counter() - started
+
+
+def _template_started(sender, template, context, **extra):
+    if 'template_started' in g:
+        g.template_started.append(time.perf_counter())
+
+
+def _template_finished(sender, template, context, **extra):
+    if g.get('template_started'):
+        g.template_time += time.perf_counter() - g.template_started.pop()
+
+
+def _start_request():
+    g.query_count = 0
+    g.query_time = 0.0
+    g.template_time = 0.0
+    g.template_started = []
+    g.request_started = time.perf_counter()
+
+    threshold = current_app.config['PROFILE_SLOW_REQUESTS']
+    if (threshold and random.random() < current_app.config['PROFILE_SAMPLE_RATE']
+            and _profile_lock.acquire(blocking=False)):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiling tool (a debugger, coverage) is active
+            _profile_lock.release()
+            return
+        g.profiler = profiler
+
+
+def _stop_profiler(exc=None):
+    # Also runs for requests that failed before _finish_request
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profile_lock.release()
+
+
+def _new_stats():
+    return {'requests': 0, 'queries': 0, 'query_time': 0.0, 'max_queries': 0,
+            'latency': 0.0, 'template_time': 0.0,
+            'latency_buckets': [0] * len(LATENCY_BUCKETS)}
+
+
+def _finish_request(response):
+    if 'query_count' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unknown'
+    count = g.query_count
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        try:
+            if elapsed >= current_app.config['PROFILE_SLOW_REQUESTS']:
+                _dump_profile(profiler, endpoint, elapsed)
+        finally:
+            _profile_lock.release()
+
+    with _lock:
+        stats = _endpoint_stats.get(endpoint)
+        if stats is None:
+            stats = _endpoint_stats[endpoint] = _new_stats()
+        stats['requests'] += 1
+        stats['queries'] += count
+        stats['query_time'] += g.query_time
+        stats['max_queries'] = max(stats['max_queries'], count)
+        stats['latency'] += elapsed
+        stats['template_time'] += g.template_time
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if elapsed <= bound:
+                stats['latency_buckets'][i] += 1
+                break
+
+    budget = current_app.config['QUERY_BUDGETS'].get(endpoint)
+    if budget is not None and count > budget:
+        message = (f'{endpoint} ran {count} SQL statements, '
+                   f'budget is {budget}')
+        if current_app.config['QUERY_BUDGET_STRICT']:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    return response
+
+
+def _dump_profile(profiler, endpoint, elapsed):
+    directory = os.path.join(current_app.root_path, current_app.config['PROFILE_DIR'])
+    os.makedirs(directory, exist_ok=True)
+    name = (f"{re.sub(r'[^A-Za-z0-9_.-]', '_', endpoint)}-"
+            f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{os.getpid()}-"
+            f"{int(elapsed * 1000)}ms.prof")
+    path = os.path.join(directory, name)
+    profiler.dump_stats(path)
+    current_app.logger.info('Profiled slow request %s (%.0f ms): %s',
+                            request.path, elapsed * 1000, path)
+
+
+def request_stats():
+    # (statement count, seconds spent in the database) for this request
+    return g.get('query_count', 0), g.get('query_time', 0.0)
+
+
+def endpoint_stats():
+    with _lock:
+        return {endpoint: dict(stats, latency_buckets=list(stats['latency_buckets']))
+                for endpoint, stats in _endpoint_stats.items()}
+
+
+def reset():
+    with _lock:
+        _endpoint_stats.clear()
+
+
+def cache_stats():
+    # {cache name: backend stats} for the caches this process has
+    extensions = current_app.extensions
+    caches = {'page': extensions.get('page_cache'),
+              'user': extensions.get('user_cache')}
+    weather = extensions.get('weather')
+    if weather is not None:
+        caches['weather'] = weather.cache
+    return {name: cache.stats() for name, cache in caches.items() if cache is not None}
+
+
+# Prometheus text format
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels.items()) + '}'
+
+
+def render_metrics():
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+
+    stats = sorted(endpoint_stats().items())
+
+    histogram = []
+    for endpoint, s in stats:
+        cumulative = 0
+        for bound, bucket in zip(LATENCY_BUCKETS, s['latency_buckets']):
+            cumulative += bucket
+            histogram.append((_labels(endpoint=endpoint, le=bound), cumulative))
+        histogram.append((_labels(endpoint=endpoint, le='+Inf'), s['requests']))
+    lines.append('# HELP eventhub_request_duration_seconds Request latency.')
+    lines.append('# TYPE eventhub_request_duration_seconds histogram')
+    lines.extend(f'eventhub_request_duration_seconds_bucket{labels} {value}'
+                 for labels, value in histogram)
+    for endpoint, s in stats:
+        labels = _labels(endpoint=endpoint)
+        lines.append(f'eventhub_request_duration_seconds_sum{labels} {s["latency"]:.6f}')
+        lines.append(f'eventhub_request_duration_seconds_count{labels} {s["requests"]}')
+
+    metric('eventhub_sql_statements_total', 'counter', 'SQL statements run.',
+           [(_labels(endpoint=e), s['queries']) for e, s in stats])
+    metric('eventhub_sql_duration_seconds_total', 'counter',
+           'Time spent running SQL statements.',
+           [(_labels(endpoint=e), f"{s['query_time']:.6f}") for e, s in stats])
+    metric('eventhub_template_render_seconds_total', 'counter',
+           'Time spent rendering templates.',
+           [(_labels(endpoint=e), f"{s['template_time']:.6f}") for e, s in stats])
+
+    caches = sorted(cache_stats().items())
+    for field, kind, help_text in (
+            ('hits', 'counter', 'Cache hits.'),
+            ('misses', 'counter', 'Cache misses.'),
+            ('evictions', 'counter', 'Entries evicted or expired.'),
+            ('entries', 'gauge', 'Entries currently cached.')):
+        suffix = '' if kind == 'gauge' else '_total'
+        metric(f'eventhub_cache_{field}{suffix}', kind, help_text,
+               [(_labels(cache=name), s[field]) for name, s in caches])
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view():
+    allowed = (
+        (current_app.config['METRICS_ALLOW_LOCALHOST']
+         and request.remote_addr in LOCAL_ADDRESSES)
+        or (current_user.is_authenticated and current_user.role == 'admin'))
+    if not allowed:
+        abort(403)
+    return current_app.response_class(
+        render_metrics(), mimetype='text/plain; version=0.0.4')
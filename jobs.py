@@ -0,0 +1,225 @@
+# Background job queue backed by the job table.
+#
+# Requests call enqueue() inside their own transaction, so a job exists if
+# and only if the work that needs it was committed. `flask jobs-worker`
+# claims due jobs and runs their handlers on a thread pool; handlers hand
+# CPU-heavy pieces to the worker's process pool with worker.map_cpu().
+# Failed jobs are retried with exponential backoff until max_attempts.
+
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import Job
+
+HANDLERS = {}
+# Modules that register handlers with @job
+HANDLER_MODULES = ('app.tickets', 'app.notifications')
+
+
+def job(kind):
+    def register(fn):
+        HANDLERS[kind] = fn
+        return fn
+    return register
+
+
+def init_app(app):
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+    app.cli.add_command(worker_command)
+
+
+def enqueue(kind, payload=None, key=None, run_at=None):
+    # Adds the job to the current transaction; the caller commits.
+    # With a key, enqueueing the same work twice returns the first job.
+    if key is not None:
+        existing = Job.query.filter_by(idempotency_key=key).first()
+        if existing is not None:
+            return existing
+
+    new_job = Job(kind=kind,
+                  payload=json.dumps(payload or {}),
+                  idempotency_key=key,
+                  run_at=run_at or datetime.utcnow(),
+                  max_attempts=current_app.config['JOB_MAX_ATTEMPTS'])
+    try:
+        with db.session.begin_nested():
+            db.session.add(new_job)
+    except IntegrityError:
+        return Job.query.filter_by(idempotency_key=key).one()
+    return new_job
+
+
+def enqueue_many(kind, payloads, keys=None):
+    # Bulk enqueue() for new work, one INSERT for all the jobs. The keys
+    # must not be taken yet; use enqueue() when they may be.
+    now = datetime.utcnow()
+    max_attempts = current_app.config['JOB_MAX_ATTEMPTS']
+    keys = keys or [None] * len(payloads)
+    rows = [{'kind': kind, 'payload': json.dumps(payload), 'idempotency_key': key,
+             'status': 'queued', 'attempts': 0, 'max_attempts': max_attempts,
+             'run_at': now, 'created_at': now}
+            for payload, key in zip(payloads, keys)]
+    if rows:
+        db.session.execute(insert(Job), rows)
+    return len(rows)
+
+
+def retry_delay(attempts):
+    base = current_app.config['JOB_RETRY_BASE_DELAY']
+    delay = min(base * 2 ** (attempts - 1), current_app.config['JOB_RETRY_MAX_DELAY'])
+    # Jitter so jobs that failed together don't all retry together
+    return delay * random.uniform(1.0, 1.2)
+
+
+def claim(worker_id, limit):
+    # Mark up to `limit` due jobs as running for this worker and return
+    # their ids. Jobs whose worker died (locked too long) are picked up again.
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config['JOB_LOCK_TIMEOUT'])
+    claimable = or_(
+        and_(Job.status == 'queued', Job.run_at <= now),
+        and_(Job.status == 'running', Job.locked_at < stale))
+
+    ids = db.session.scalars(
+        select(Job.id).where(claimable).order_by(Job.run_at).limit(limit)).all()
+    if not ids:
+        db.session.rollback()
+        return []
+
+    token = f'{worker_id}:{uuid.uuid4().hex[:12]}'
+    # Re-checking claimable in the UPDATE makes sure two workers that picked
+    # the same ids can't both get them
+    db.session.execute(
+        update(Job).where(Job.id.in_(ids), claimable)
+        .values(status='running', locked_by=token, locked_at=now,
+                attempts=Job.attempts + 1)
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    return db.session.scalars(
+        select(Job.id).where(Job.locked_by == token,
+                             Job.status == 'running')).all()
+
+
+def finish(job_record):
+    job_record.status = 'done'
+    job_record.finished_at = datetime.utcnow()
+    job_record.locked_by = None
+    job_record.last_error = None
+    db.session.commit()
+
+
+def fail(job_record, error):
+    job_record.last_error = error
+    job_record.locked_by = None
+    if job_record.attempts >= job_record.max_attempts:
+        job_record.status = 'failed'
+        job_record.finished_at = datetime.utcnow()
+    else:
+        job_record.status = 'queued'
+        job_record.run_at = datetime.utcnow() + timedelta(
+            seconds=retry_delay(job_record.attempts))
+    db.session.commit()
+
+
+class Worker:
+    def __init__(self, app, threads, processes, poll_interval=1.0):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self._stop = threading.Event()
+        # Create the process pool before any threads exist, and use spawn so
+        # children never inherit locks or database connections
+        self.process_pool = None
+        if processes:
+            self.process_pool = ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context('spawn'))
+        self.thread_pool = ThreadPoolExecutor(threads, thread_name_prefix='job')
+
+    def map_cpu(self, fn, *iterables, chunksize=1):
+        # Run fn over the inputs in the process pool (inline without one)
+        if self.process_pool is None:
+            return list(map(fn, *iterables))
+        return list(self.process_pool.map(fn, *iterables, chunksize=chunksize))
+
+    def run_job(self, job_id):
+        with self.app.app_context():
+            job_record = db.session.get(Job, job_id)
+            handler = HANDLERS.get(job_record.kind)
+            try:
+                if handler is None:
+                    raise LookupError(f'No handler for job kind {job_record.kind!r}')
+                handler(json.loads(job_record.payload or '{}'), self)
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Job %s (%s) failed', job_id, job_record.kind)
+                fail(job_record, traceback.format_exc(limit=5))
+            else:
+                finish(job_record)
+            finally:
+                db.session.remove()
+
+    def run(self, once=False):
+        in_flight = set()
+        try:
+            while not self._stop.is_set():
+                in_flight = {f for f in in_flight if not f.done()}
+                free = self.threads - len(in_flight)
+                ids = []
+                if free > 0:
+                    with self.app.app_context():
+                        ids = claim(self.worker_id, free)
+                for job_id in ids:
+                    in_flight.add(self.thread_pool.submit(self.run_job, job_id))
+                if once and not ids and not in_flight:
+                    break
+                if not ids:
+                    time.sleep(self.poll_interval if not once else 0.05)
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self._stop.set()
+
+    def shutdown(self):
+        self.thread_pool.shutdown(wait=True)
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=True)
+
+
+@click.command('jobs-worker')
+@click.option('--threads', type=int, help='Concurrent jobs (default JOB_THREADS).')
+@click.option('--processes', type=int,
+              help='Processes for CPU-heavy work (default JOB_PROCESSES).')
+@click.option('--once', is_flag=True, help='Exit when the queue is empty.')
+@with_appcontext
+def worker_command(threads, processes, once):
+    """Run background jobs."""
+    app = current_app._get_current_object()
+    worker = Worker(app,
+                    threads or app.config['JOB_THREADS'],
+                    app.config['JOB_PROCESSES'] if processes is None else processes,
+                    app.config['JOB_POLL_INTERVAL'])
+    click.echo(f'Worker {worker.worker_id} started.')
+    try:
+        worker.run(once=once)
+    except KeyboardInterrupt:
+        worker.stop()
@@ -0,0 +1,218 @@
+# Versioned schema migrations.
+#
+# db.create_all() only creates missing tables, it never changes an existing
+# one, so anything added to an existing table (indexes, columns) needs a
+# migration here. Migrations run in version order, each in its own
+# transaction, and the applied versions are recorded in schema_migrations.
+#
+# Every migration must be safe to run on a database that create_all() has
+# just built with the current models, so use the helpers below rather than
+# plain CREATE/ALTER statements.
+
+from datetime import datetime
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, inspect, text, update
+
+from app import db
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+def init_app(app):
+    if app.config['AUTO_MIGRATE'] and app.config['SCHEMA_SETUP_ON_START']:
+        upgrade()
+    app.cli.add_command(upgrade_command)
+    app.cli.add_command(version_command)
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER NOT NULL PRIMARY KEY, '
+        'description VARCHAR(200), '
+        'applied_at DATETIME)'))
+
+
+def applied_versions(conn):
+    _ensure_version_table(conn)
+    return {row[0] for row in conn.execute(
+        text('SELECT version FROM schema_migrations'))}
+
+
+def pending():
+    with db.engine.begin() as conn:
+        done = applied_versions(conn)
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def upgrade():
+    applied = []
+    for version, description, fn in pending():
+        with db.engine.begin() as conn:
+            fn(conn)
+            conn.execute(text(
+                'INSERT INTO schema_migrations (version, description, applied_at) '
+                'VALUES (:version, :description, :applied_at)'),
+                {'version': version, 'description': description,
+                 'applied_at': datetime.utcnow()})
+        current_app.logger.info('Applied migration %s: %s', version, description)
+        applied.append((version, description))
+    return applied
+
+
+# Helpers
+
+def _quote(conn, name):
+    # "user" is a reserved word outside SQLite
+    return conn.dialect.identifier_preparer.quote(name)
+
+
+def create_index(conn, name, table, *columns):
+    conn.execute(text(
+        f'CREATE INDEX IF NOT EXISTS {name} ON {_quote(conn, table)} '
+        f'({", ".join(_quote(conn, c) for c in columns)})'))
+
+
+def add_column(conn, table, name, ddl):
+    # ddl is the column type and options, e.g. "INTEGER NOT NULL DEFAULT 0"
+    existing = {c['name'] for c in inspect(conn).get_columns(table)}
+    if name not in existing:
+        conn.execute(text(
+            f'ALTER TABLE {_quote(conn, table)} ADD COLUMN {_quote(conn, name)} {ddl}'))
+
+
+def create_table(conn, model):
+    model.__table__.create(conn, checkfirst=True)
+
+
+# Migrations
+
+@migration(1, 'Indexes for catalog, dashboard and admin queries')
+def add_hot_query_indexes(conn):
+    create_index(conn, 'ix_event_status_date', 'event', 'status', 'date')
+    create_index(conn, 'ix_event_status_category_date',
+                 'event', 'status', 'category', 'date')
+    create_index(conn, 'ix_event_organizer_id_created_at',
+                 'event', 'organizer_id', 'created_at')
+    create_index(conn, 'ix_event_created_at', 'event', 'created_at')
+    create_index(conn, 'ix_user_created_at', 'user', 'created_at')
+    create_index(conn, 'ix_booking_user_id', 'booking', 'user_id')
+    create_index(conn, 'ix_booking_event_id', 'booking', 'event_id')
+    create_index(conn, 'ix_booking_booking_date', 'booking', 'booking_date')
+    create_index(conn, 'ix_ticket_event_id', 'ticket', 'event_id')
+    create_index(conn, 'ix_ticket_user_id', 'ticket', 'user_id')
+    create_index(conn, 'ix_payment_booking_id', 'payment', 'booking_id')
+    create_index(conn, 'ix_review_event_id', 'review', 'event_id')
+    create_index(conn, 'ix_review_user_id', 'review', 'user_id')
+
+
+@migration(2, 'Dashboard counters and daily booking rollups')
+def add_stats_tables(conn):
+    from app.models import StatCounter, DailyBookingStat
+    from app.stats import reconcile_connection
+    create_table(conn, StatCounter)
+    create_table(conn, DailyBookingStat)
+    reconcile_connection(conn)
+
+
+@migration(3, 'Background job queue and ticket booking link')
+def add_job_queue(conn):
+    from app.models import Job
+    create_table(conn, Job)
+    add_column(conn, 'ticket', 'booking_id', 'INTEGER REFERENCES booking (id)')
+    create_index(conn, 'ix_ticket_booking_id', 'ticket', 'booking_id')
+
+
+@migration(4, 'Room for longer password hashes')
+def widen_password_hash(conn):
+    # SQLite doesn't enforce VARCHAR lengths
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(f'ALTER TABLE {_quote(conn, "user")} '
+                          'ALTER COLUMN password_hash TYPE VARCHAR(256)'))
+
+
+@migration(5, 'Event review count and rating aggregates')
+def add_event_ratings(conn):
+    from app.ratings import reconcile_connection
+    add_column(conn, 'event', 'review_count', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(conn, 'event', 'rating_sum', 'INTEGER NOT NULL DEFAULT 0')
+    add_column(conn, 'event', 'rating_avg', 'FLOAT NOT NULL DEFAULT 0')
+    create_index(conn, 'ix_event_status_rating_avg', 'event', 'status', 'rating_avg')
+    reconcile_connection(conn)
+
+
+@migration(6, 'Per-event hourly and daily sales rollups')
+def add_event_sales_stats(conn):
+    from app.models import EventSalesStat
+    from app.analytics import reconcile_connection
+    create_table(conn, EventSalesStat)
+    reconcile_connection(conn)
+
+
+@migration(7, 'Resized event image variants')
+def add_event_image_variants(conn):
+    add_column(conn, 'event', 'image_variants', 'TEXT')
+
+
+@migration(8, 'Event last-modified time for API validators')
+def add_event_updated_at(conn):
+    from app.models import Event
+    add_column(conn, 'event', 'updated_at', 'TIMESTAMP')
+    create_index(conn, 'ix_event_updated_at', 'event', 'updated_at')
+    # Existing events count as last modified when they were created
+    event = Event.__table__
+    conn.execute(update(event).where(event.c.updated_at.is_(None)).values(
+        updated_at=func.coalesce(event.c.created_at, datetime.utcnow())))
+
+
+@migration(9, 'Booking hold expiry')
+def add_booking_expires_at(conn):
+    add_column(conn, 'booking', 'expires_at', 'TIMESTAMP')
+    create_index(conn, 'ix_booking_status_expires_at', 'booking', 'status', 'expires_at')
+
+
+@migration(10, 'Event waitlists')
+def add_waitlist(conn):
+    from app.models import WaitlistEntry
+    create_table(conn, WaitlistEntry)
+
+
+@migration(11, 'Index for the user dashboard bookings')
+def add_booking_user_date_index(conn):
+    create_index(conn, 'ix_booking_user_id_booking_date', 'booking', 'user_id', 'booking_date')
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def upgrade_command():
+    """Create missing tables and apply pending schema migrations."""
+    from app import search
+    db.create_all()
+    applied = upgrade()
+    current_app.extensions['event_search'] = search.ensure_index()
+    for version, description in applied:
+        click.echo(f'Applied {version}: {description}')
+    if not applied:
+        click.echo('Database is up to date.')
+
+
+@click.command('db-version')
+@with_appcontext
+def version_command():
+    """Show applied and pending schema migrations."""
+    with db.engine.begin() as conn:
+        done = applied_versions(conn)
+    for version, description, _ in MIGRATIONS:
+        state = 'applied' if version in done else 'pending'
+        click.echo(f'{version:>4}  {state:<8} {description}')
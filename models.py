@@ -1,18 +1,18 @@
 from datetime import datetime
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 from app import db, login_manager
+from app.passwords import hash_password, needs_rehash, verify_password
 
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(256))
     name = db.Column(db.String(100))
     phone = db.Column(db.String(20))
     # admin, organizer, attendee
     role = db.Column(db.String(20), default='attendee')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     organizer_profile = db.relationship(
         'OrganizerProfile', backref='user', uselist=False)
     reviews = db.relationship('Review', backref='author', lazy=True)
@@ -22,10 +22,14 @@ class User(UserMixin, db.Model):
     bookings = db.relationship('Booking', backref='user', lazy=True)
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        # True when the hash was made with other PASSWORD_HASH_* settings
+        return needs_rehash(self.password_hash)
 
 
 class OrganizerProfile(db.Model):
@@ -40,6 +44,16 @@ class OrganizerProfile(db.Model):
 
 
 class Event(db.Model):
+    __table_args__ = (
+        # Catalog: active events, optionally by category, in date order
+        db.Index('ix_event_status_date', 'status', 'date'),
+        db.Index('ix_event_status_category_date', 'status', 'category', 'date'),
+        # Organizer dashboard: own events, newest first
+        db.Index('ix_event_organizer_id_created_at', 'organizer_id', 'created_at'),
+        # Catalog sorted by rating
+        db.Index('ix_event_status_rating_avg', 'status', 'rating_avg'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
@@ -48,25 +62,42 @@ class Event(db.Model):
     location = db.Column(db.String(200))
     address = db.Column(db.String(300))
     image = db.Column(db.String(200), default='default_event.jpg')
+    # JSON {variant: path} of uploaded images, see app.images
+    image_variants = db.Column(db.Text)
     price = db.Column(db.Float, default=0.0)
     capacity = db.Column(db.Integer, default=100)
     available_tickets = db.Column(db.Integer, default=100)
     category = db.Column(db.String(50))  # String field, not foreign key
     organizer_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     status = db.Column(db.String(20), default='active')
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # Bumped by every UPDATE, ORM or Core; the API's ETags are built from it
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
     weather_data = db.Column(db.Text)
+    # Review aggregates, maintained by app.ratings
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_avg = db.Column(db.Float, nullable=False, default=0.0)
 
     tickets = db.relationship('Ticket', backref='event', lazy=True)
     bookings = db.relationship('Booking', backref='event', lazy=True)
     reviews = db.relationship('Review', backref='event', lazy=True)
 
+    @property
+    def average_rating(self):
+        # None until the event has been reviewed
+        return self.rating_avg if self.review_count else None
+
 
 class Ticket(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     ticket_number = db.Column(db.String(20), unique=True, nullable=False)
-    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey(
+        'event.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(
+        'user.id'), nullable=False, index=True)
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'), index=True)
     qr_code = db.Column(db.String(200))
     purchase_date = db.Column(db.DateTime, default=datetime.utcnow)
     # active, used, cancelled
@@ -74,25 +105,60 @@ class Ticket(db.Model):
 
 
 class Booking(db.Model):
+    __table_args__ = (
+        # Expired hold sweep
+        db.Index('ix_booking_status_expires_at', 'status', 'expires_at'),
+        # User dashboard: own bookings, newest first
+        db.Index('ix_booking_user_id_booking_date', 'user_id', 'booking_date'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     booking_number = db.Column(db.String(20), unique=True, nullable=False)
-    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey(
+        'event.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(
+        'user.id'), nullable=False, index=True)
     tickets_count = db.Column(db.Integer, default=1)
     total_amount = db.Column(db.Float, nullable=False)
-    booking_date = db.Column(db.DateTime, default=datetime.utcnow)
-    # pending, confirmed, cancelled
-    status = db.Column(db.String(20), default='pending')
+    booking_date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    # pending, confirmed, cancelled, expired. active_history loads the old
+    # value before a change, the rollup hooks need it to see a confirmed
+    # booking being cancelled.
+    status = db.column_property(
+        db.Column(db.String(20), default='pending'), active_history=True)
+    # When a pending booking's hold on its tickets runs out, see app.booking
+    expires_at = db.Column(db.DateTime)
+
+
+class WaitlistEntry(db.Model):
+    # Users waiting for tickets to a sold-out event, served in id order by
+    # app.waitlist
+    __table_args__ = (
+        # Next entries in line for an event
+        db.Index('ix_waitlist_entry_event_id_status_id', 'event_id', 'status', 'id'),
+        db.Index('ix_waitlist_entry_user_id_event_id', 'user_id', 'event_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    tickets_count = db.Column(db.Integer, nullable=False, default=1)
+    # waiting, promoted, left
+    status = db.Column(db.String(20), nullable=False, default='waiting')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    promoted_at = db.Column(db.DateTime)
+    # The hold created on promotion
+    booking_id = db.Column(db.Integer, db.ForeignKey('booking.id'))
 
 
 class Payment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     booking_id = db.Column(db.Integer, db.ForeignKey(
-        'booking.id'), nullable=False)
+        'booking.id'), nullable=False, index=True)
     amount = db.Column(db.Float, nullable=False)
     payment_method = db.Column(db.String(50))
     transaction_id = db.Column(db.String(100), unique=True)
-    # pending, completed, failed
+    # pending, completed, failed, refunded
     status = db.Column(db.String(20), default='pending')
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     booking = db.relationship('Booking', backref='payment', uselist=False)
@@ -100,13 +166,65 @@ class Payment(db.Model):
 
 class Review(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey(
+        'event.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(
+        'user.id'), nullable=False, index=True)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class StatCounter(db.Model):
+    # Running totals kept up to date by app.stats
+    name = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class DailyBookingStat(db.Model):
+    # Confirmed bookings per day, kept up to date by app.stats
+    day = db.Column(db.Date, primary_key=True)
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    tickets = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class EventSalesStat(db.Model):
+    # Confirmed bookings per event per hour and per day, kept up to date by
+    # app.analytics
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id'), primary_key=True)
+    period = db.Column(db.String(5), primary_key=True)  # hour, day
+    bucket = db.Column(db.DateTime, primary_key=True)  # start of the period
+    bookings = db.Column(db.Integer, nullable=False, default=0)
+    tickets = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+
+class Job(db.Model):
+    # Background work queued by requests and run by `flask jobs-worker`
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text)  # JSON
+    # Enqueueing the same key twice returns the existing job
+    idempotency_key = db.Column(db.String(100), unique=True)
+    # queued, running, done, failed
+    status = db.Column(db.String(20), default='queued', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=5, nullable=False)
+    run_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+
 @login_manager.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    # Served from the per-process user cache when possible
+    from app import user_cache
+    return user_cache.load(int(id))
@@ -0,0 +1,47 @@
+# Emails sent from background jobs
+
+from flask import current_app
+from flask_mail import Message
+
+from app import db, mail
+from app.jobs import job
+from app.models import Booking
+
+
+@job('send_booking_confirmation')
+def send_booking_confirmation(payload, worker):
+    booking = db.session.get(Booking, payload['booking_id'])
+    if booking is None or booking.status != 'confirmed':
+        return
+
+    event = booking.event
+    message = Message(
+        subject=f'Booking confirmed: {event.title}',
+        recipients=[booking.user.email],
+        body=(f'Hi {booking.user.name},\n\n'
+              f'Your booking {booking.booking_number} for {event.title} '
+              f'on {event.date:%Y-%m-%d} at {event.time or ""} is confirmed.\n'
+              f'Tickets: {booking.tickets_count}\n'
+              f'Total: {booking.total_amount:.2f}\n\n'
+              f'See you there!\n{current_app.config["MAIL_SENDER_NAME"]}'))
+    mail.send(message)
+
+
+@job('send_waitlist_offer')
+def send_waitlist_offer(payload, worker):
+    booking = db.session.get(Booking, payload['booking_id'])
+    if booking is None or booking.status != 'pending':
+        return
+
+    event = booking.event
+    message = Message(
+        subject=f'Tickets available: {event.title}',
+        recipients=[booking.user.email],
+        body=(f'Hi {booking.user.name},\n\n'
+              f'Tickets for {event.title} on {event.date:%Y-%m-%d} came free '
+              f'and we are holding {booking.tickets_count} for you until '
+              f'{booking.expires_at:%Y-%m-%d %H:%M} UTC.\n'
+              f'Complete booking {booking.booking_number} from your dashboard '
+              f'before then to keep them.\n\n'
+              f'{current_app.config["MAIL_SENDER_NAME"]}'))
+    mail.send(message)
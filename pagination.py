@@ -0,0 +1,81 @@
+# Keyset (cursor) pagination.
+#
+# Instead of OFFSET, each page remembers the sort key of its last row and the
+# next page starts right after it, so page 1000 costs the same as page 1.
+# The cursor handed to clients is an opaque url-safe token.
+
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+
+def encode_cursor(values):
+    data = [{'dt': v.isoformat()} if isinstance(v, datetime) else v
+            for v in values]
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    # Returns None for a missing or malformed cursor, i.e. the first page
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+        return [datetime.fromisoformat(v['dt']) if isinstance(v, dict) else v
+                for v in data]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+
+
+def after(keys, values):
+    # Rows that sort after `values` for the given [(column, descending)] keys:
+    # (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        equal = [keys[j][0] == values[j] for j in range(i)]
+        beyond = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, beyond))
+    return or_(*clauses)
+
+
+def order(query, keys):
+    return query.order_by(*[column.desc() if descending else column.asc()
+                            for column, descending in keys])
+
+
+def keyset_query(query, keys, cursor):
+    # The sort key values are selected next to each row so the cursor can be
+    # built from the last row without knowing how they were computed
+    values = decode_cursor(cursor)
+    if values is not None and len(values) == len(keys):
+        query = query.filter(after(keys, values))
+    query = query.add_columns(*[column for column, _ in keys])
+    return order(query, keys)
+
+
+def keyset_rows(query, keys, cursor, per_page):
+    # Like keyset_page for queries of several columns: returns (rows,
+    # next_cursor) with the sort key values stripped from the rows
+    rows = keyset_query(query, keys, cursor).limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(list(rows[-1][-len(keys):]))
+    return [row[:-len(keys)] for row in rows], next_cursor
+
+
+def keyset_page(query, keys, cursor, per_page):
+    # Returns (items, next_cursor); next_cursor is None on the last page
+    rows, next_cursor = keyset_rows(query, keys, cursor, per_page)
+    return [row[0] for row in rows], next_cursor
+
+
+def keyset_stream(query, keys, cursor, chunk_size):
+    # Yields every remaining item, fetching chunk_size rows at a time
+    for row in keyset_query(query, keys, cursor).yield_per(chunk_size):
+        yield row[0]
@@ -0,0 +1,134 @@
+# Password hashing and verification.
+#
+# PASSWORD_HASH_METHOD and PASSWORD_SALT_LENGTH pick the werkzeug hash for
+# new passwords; hashes made with other settings still verify and are
+# replaced on the user's next login.
+#
+# Verifying is deliberately slow, so with PASSWORD_VERIFY_PROCESSES set it
+# runs in a process pool instead of on the request thread. At most
+# PASSWORD_VERIFY_QUEUE checks may be waiting or running; further logins
+# are answered with 503 straight away rather than piling up behind them.
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+
+from flask import current_app, has_app_context
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# werkzeug's own default, which every existing hash was made with
+DEFAULT_METHOD = 'scrypt'
+DEFAULT_SALT_LENGTH = 16
+
+
+class VerifierBusy(Exception):
+    pass
+
+
+class PasswordVerifier:
+    def __init__(self, processes, queue_size, timeout):
+        self.processes = processes
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned children don't inherit the server's threads or locks
+                self._pool = ProcessPoolExecutor(
+                    self.processes, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def _discard_pool(self, pool):
+        # A child died; start a fresh pool for the next login
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+
+    def verify(self, pwhash, password):
+        if not self._slots.acquire(blocking=False):
+            raise VerifierBusy('Too many password checks in flight')
+        try:
+            pool = self._get_pool()
+            future = pool.submit(check_password_hash, pwhash, password)
+        except BrokenProcessPool:
+            self._slots.release()
+            self._discard_pool(pool)
+            raise VerifierBusy('Password check pool restarted')
+        except BaseException:
+            self._slots.release()
+            raise
+
+        # The slot is freed when the check finishes, not when we give up
+        # waiting: cancel() can't stop a running check, and it keeps a
+        # worker busy until it's done
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise VerifierBusy('Password check timed out')
+        except BrokenProcessPool:
+            self._discard_pool(pool)
+            raise VerifierBusy('Password check pool restarted')
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+def init_app(app):
+    processes = app.config['PASSWORD_VERIFY_PROCESSES']
+    app.extensions['password_verifier'] = (
+        PasswordVerifier(processes, app.config['PASSWORD_VERIFY_QUEUE'],
+                         app.config['PASSWORD_VERIFY_TIMEOUT'])
+        if processes else None)
+    app.register_error_handler(VerifierBusy, _busy)
+
+
+def _busy(error):
+    return ('The server is busy, please try logging in again in a moment.',
+            503, {'Retry-After': '1'})
+
+
+def _settings():
+    if not has_app_context():
+        return DEFAULT_METHOD, DEFAULT_SALT_LENGTH
+    return (current_app.config['PASSWORD_HASH_METHOD'],
+            current_app.config['PASSWORD_SALT_LENGTH'])
+
+
+def hash_password(password):
+    method, salt_length = _settings()
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def verify_password(pwhash, password):
+    if not pwhash:
+        return False
+    verifier = (current_app.extensions.get('password_verifier')
+                if has_app_context() else None)
+    if verifier is None:
+        return check_password_hash(pwhash, password)
+    return verifier.verify(pwhash, password)
+
+
+@lru_cache(maxsize=16)
+def _hash_prefix(method, salt_length):
+    # werkzeug fills in defaults (e.g. iterations), so compare against what
+    # it actually writes: "<method>$<salt>$<hash>"
+    method_part, salt, _ = generate_password_hash(
+        '', method=method, salt_length=salt_length).split('$')
+    return method_part, len(salt)
+
+
+def needs_rehash(pwhash):
+    method_part, salt_length = _hash_prefix(*_settings())
+    parts = (pwhash or '').split('$')
+    return len(parts) != 3 or parts[0] != method_part or len(parts[1]) != salt_length
@@ -0,0 +1,145 @@
+# Payments for held bookings.
+#
+# pay_for_booking() turns a hold (a pending booking, see app.booking) into
+# a confirmed booking: it keeps the hold alive for the duration of the
+# charge, records a pending Payment before calling the provider, and only
+# confirms if the hold is still there afterwards, refunding otherwise.
+# cancel_booking() refunds completed payments and gives the tickets back.
+# The provider is chosen by PAYMENT_PROVIDER; 'fake' runs locally for
+# development, tests and benchmarks.
+
+import time
+import uuid
+
+from flask import current_app
+
+from sqlalchemy import update
+
+from app import db
+from app.booking import (BookingError, HoldExpired, claim_hold, extend_hold,
+                         queue_fulfilment, release_tickets)
+from app.models import Booking, Payment, Ticket
+
+
+class PaymentError(Exception):
+    # The provider could not take the payment
+    pass
+
+
+class PaymentDeclined(PaymentError):
+    pass
+
+
+class FakeProvider:
+    # Approves every token except tok_declined and tok_error
+
+    def __init__(self, app):
+        self.delay = app.config['PAYMENT_FAKE_DELAY']
+
+    def charge(self, amount, token, reference):
+        # Returns the provider's transaction id
+        if self.delay:
+            time.sleep(self.delay)
+        if token == 'tok_declined':
+            raise PaymentDeclined('Your card was declined.')
+        if token == 'tok_error':
+            raise PaymentError('The payment provider is unavailable, please try again.')
+        return f'fake_{uuid.uuid4().hex}'
+
+    def refund(self, transaction_id):
+        pass
+
+
+PROVIDERS = {'fake': FakeProvider}
+
+
+def init_app(app):
+    name = app.config['PAYMENT_PROVIDER']
+    if name not in PROVIDERS:
+        raise RuntimeError(f'Unknown PAYMENT_PROVIDER {name!r}')
+    app.extensions['payments'] = PROVIDERS[name](app)
+
+
+def get_provider():
+    return current_app.extensions['payments']
+
+
+def pay_for_booking(booking, token, payment_method='card'):
+    # Charge the booking's total and confirm it. Raises HoldExpired when
+    # the tickets are no longer held and PaymentError when the charge fails;
+    # the hold stays in place after a failed charge so the user can retry.
+    if booking.status == 'expired':
+        raise HoldExpired('Your reservation has expired, please book again.')
+    if booking.status != 'pending' or booking.expires_at is None:
+        raise BookingError('This booking is not awaiting payment.')
+    if not extend_hold(booking, current_app.config['PAYMENT_HOLD_EXTENSION']):
+        db.session.rollback()
+        raise HoldExpired('Your reservation has expired, please book again.')
+
+    # On record before the provider is called, so a crash mid-charge leaves
+    # a trace to reconcile against the provider
+    payment = Payment(booking_id=booking.id, amount=booking.total_amount,
+                      payment_method=payment_method, status='pending')
+    db.session.add(payment)
+    db.session.commit()
+
+    provider = get_provider()
+    try:
+        transaction_id = provider.charge(payment.amount, token, booking.booking_number)
+    except PaymentError:
+        payment.status = 'failed'
+        db.session.commit()
+        raise
+
+    payment.transaction_id = transaction_id
+    if not claim_hold(booking):
+        # Swept while the charge was in flight
+        db.session.rollback()
+        provider.refund(transaction_id)
+        payment.transaction_id = transaction_id
+        payment.status = 'failed'
+        db.session.commit()
+        raise HoldExpired('Your reservation expired before the payment went through, '
+                          'the charge has been refunded.')
+
+    payment.status = 'completed'
+    booking.status = 'confirmed'
+    booking.expires_at = None
+    queue_fulfilment(booking)
+    db.session.commit()
+    return payment
+
+
+def cancel_booking(booking):
+    # Cancel a pending or confirmed booking, refund what was paid and put
+    # the tickets back on sale. Returns False if it had already ended.
+    # The caller offers the tickets to the waitlist once this returns.
+    previous = booking.status
+    if previous not in ('pending', 'confirmed'):
+        return False
+    # The conditional UPDATE lets only one request (or the hold sweeper)
+    # end the booking; the attribute change below is what the rollup
+    # hooks see
+    claimed = db.session.execute(
+        update(Booking)
+        .where(Booking.id == booking.id, Booking.status == previous)
+        .values(status='cancelled', expires_at=None)
+        .execution_options(synchronize_session=False))
+    if claimed.rowcount != 1:
+        db.session.rollback()
+        return False
+
+    provider = get_provider()
+    for payment in Payment.query.filter_by(booking_id=booking.id, status='completed'):
+        provider.refund(payment.transaction_id)
+        payment.status = 'refunded'
+
+    booking.status = 'cancelled'
+    booking.expires_at = None
+    release_tickets(booking.event_id, booking.tickets_count)
+    db.session.execute(
+        update(Ticket).where(Ticket.booking_id == booking.id)
+        .values(status='cancelled')
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    return True
@@ -0,0 +1,48 @@
+# Warm-up for prefork servers.
+#
+# Several modules import their heavy dependencies on first use so that a
+# single worker boots fast. A prefork server that builds the app once in
+# its parent (gunicorn --preload) is better off paying for them there:
+# with PRELOAD on, create_app imports them, configures the ORM mappers and
+# compiles the templates, then closes every connection it made. Workers
+# fork from that warm parent and share its memory copy-on-write.
+
+import gc
+import importlib
+
+from sqlalchemy.orm import configure_mappers
+
+from app import db
+
+# Imported on first use by app.images, app.weather, app.tickets and
+# app.stats, and by the Email validator
+DEFERRED_MODULES = (
+    'PIL.Image',
+    'PIL.ImageOps',
+    'PIL.JpegImagePlugin',
+    'PIL.PngImagePlugin',
+    'requests',
+    'urllib3.util.retry',
+    'qrcode',
+    'sqlalchemy.dialects.postgresql',
+    'email_validator',
+)
+
+
+def preload(app):
+    for name in DEFERRED_MODULES:
+        importlib.import_module(name)
+    configure_mappers()
+
+    for name in app.jinja_env.list_templates():
+        if name.endswith('.html'):
+            app.jinja_env.get_template(name)
+
+    # Nothing connected in the parent may be used by a worker
+    for engine in db.engines.values():
+        engine.dispose()
+
+    # Keep the startup objects out of the collector's way, so collections
+    # in the workers don't touch (and copy) the pages they live on
+    gc.collect()
+    gc.freeze()
@@ -0,0 +1,164 @@
+# Query-plan check for the hot queries in routes.py.
+#
+# Runs EXPLAIN QUERY PLAN (SQLite) on each query below and reports any step
+# that reads a whole table instead of going through an index. When a route
+# query changes, update its twin here so `flask db-check-plans` keeps
+# guarding it.
+
+import re
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.orm import joinedload
+
+from app import db
+from app.models import User, Event, Booking, Review, WaitlistEntry
+
+# "SCAN event" is a full table scan; "SCAN event USING INDEX ..." walks an
+# index in order (fine with a LIMIT) and "SEARCH ..." is an index lookup
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+HOT_QUERIES = {}
+
+
+def hot_query(name):
+    def register(fn):
+        HOT_QUERIES[name] = fn
+        return fn
+    return register
+
+
+@hot_query('events catalog')
+def _catalog():
+    return (Event.query.filter_by(status='active')
+            .order_by(Event.date.asc(), Event.id.asc()).limit(25))
+
+
+@hot_query('events catalog by category')
+def _catalog_category():
+    return (Event.query.filter_by(status='active')
+            .filter(Event.category == 'concert')
+            .order_by(Event.date.asc(), Event.id.asc()).limit(25))
+
+
+@hot_query('events catalog by date')
+def _catalog_date():
+    day = datetime(2030, 1, 1)
+    return (Event.query.filter_by(status='active')
+            .filter(Event.date >= day, Event.date < day + timedelta(days=1))
+            .order_by(Event.date.asc(), Event.id.asc()).limit(25))
+
+
+@hot_query('events catalog by rating')
+def _catalog_rating():
+    return (Event.query.filter_by(status='active')
+            .order_by(Event.rating_avg.desc(), Event.date.asc(), Event.id.asc())
+            .limit(25))
+
+
+@hot_query('api catalog validator')
+def _catalog_version():
+    return db.session.query(db.func.max(Event.updated_at))
+
+
+@hot_query('expired holds')
+def _expired_holds():
+    return (Booking.query.filter(Booking.status == 'pending',
+                                 Booking.expires_at <= datetime(2030, 1, 1))
+            .order_by(Booking.expires_at).limit(500))
+
+
+@hot_query('waitlist next in line')
+def _waitlist_next():
+    return (WaitlistEntry.query.filter_by(event_id=1, status='waiting')
+            .order_by(WaitlistEntry.id).limit(500))
+
+
+@hot_query('waitlist position')
+def _waitlist_position():
+    return db.session.query(db.func.count(WaitlistEntry.id)).filter(
+        WaitlistEntry.event_id == 1, WaitlistEntry.status == 'waiting',
+        WaitlistEntry.id <= 50000)
+
+
+@hot_query('dashboard events')
+def _dashboard_events():
+    return (Event.query.filter_by(organizer_id=1)
+            .order_by(Event.created_at.desc()))
+
+
+@hot_query('dashboard bookings')
+def _dashboard_bookings():
+    return (Booking.query.filter_by(user_id=1).options(joinedload(Booking.event))
+            .order_by(Booking.booking_date.desc()))
+
+
+@hot_query('event bookings')
+def _event_bookings():
+    return Booking.query.filter_by(event_id=1)
+
+
+@hot_query('event reviews')
+def _event_reviews():
+    return Review.query.filter_by(event_id=1)
+
+
+@hot_query('admin recent users')
+def _recent_users():
+    return User.query.order_by(User.created_at.desc()).limit(5)
+
+
+@hot_query('admin recent events')
+def _recent_events():
+    return Event.query.order_by(Event.created_at.desc()).limit(5)
+
+
+@hot_query('admin recent bookings')
+def _recent_bookings():
+    return Booking.query.order_by(Booking.booking_date.desc()).limit(5)
+
+
+def explain(query):
+    statement = query.statement.compile(
+        dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    with db.engine.connect() as conn:
+        rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}').all()
+    # Rows are (id, parent, notused, detail)
+    return [row[-1] for row in rows]
+
+
+def check_plans():
+    # Returns {query name: [offending plan steps]} for queries that scan
+    problems = {}
+    for name, build in HOT_QUERIES.items():
+        scans = [step for step in explain(build()) if FULL_SCAN.match(step)]
+        if scans:
+            problems[name] = scans
+    return problems
+
+
+def init_app(app):
+    app.cli.add_command(check_plans_command)
+
+
+@click.command('db-check-plans')
+@click.option('--verbose', is_flag=True, help='Print every query plan.')
+@with_appcontext
+def check_plans_command(verbose):
+    """Fail if a hot query falls back to a full table scan."""
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Plan checks are only implemented for SQLite.')
+
+    if verbose:
+        for name, build in HOT_QUERIES.items():
+            click.echo(name)
+            for step in explain(build()):
+                click.echo(f'    {step}')
+
+    problems = check_plans()
+    for name, scans in problems.items():
+        click.echo(f'FULL SCAN in {name}: {"; ".join(scans)}', err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo(f'All {len(HOT_QUERIES)} hot queries use indexes.')
@@ -0,0 +1,90 @@
+# Per-event review aggregates.
+#
+# Event.review_count, rating_sum and rating_avg are updated by Review mapper
+# hooks in the same transaction as the review, so the catalog can show,
+# filter and sort by rating without reading the review table. Bulk changes
+# to reviews skip the hooks; run `flask ratings-reconcile` after them.
+
+import click
+from flask.cli import with_appcontext
+from datetime import datetime
+
+from sqlalchemy import (Float, case, cast, column, event as sa_event, func, inspect,
+                        select, table, update)
+from sqlalchemy.orm import object_session
+
+from app import db
+from app.cache import event_changed
+from app.models import Event, Review
+
+
+def init_app(app):
+    app.cli.add_command(reconcile_command)
+
+
+def _average(count, total):
+    return case((count > 0, cast(total, Float) / count), else_=0.0)
+
+
+def _adjust(conn, event_id, count, total):
+    # SET expressions see the old values, so the average uses the new ones
+    event = Event.__table__
+    new_count = event.c.review_count + count
+    new_total = event.c.rating_sum + total
+    conn.execute(update(event).where(event.c.id == event_id).values(
+        review_count=new_count,
+        rating_sum=new_total,
+        rating_avg=_average(new_count, new_total)))
+
+
+@sa_event.listens_for(Review, 'after_insert')
+def _review_inserted(mapper, connection, target):
+    _adjust(connection, target.event_id, 1, target.rating)
+    event_changed(target.event_id, object_session(target))
+
+
+@sa_event.listens_for(Review, 'after_update')
+def _review_updated(mapper, connection, target):
+    state = inspect(target)
+    event_history = state.attrs.event_id.history
+    rating_history = state.attrs.rating.history
+    if not (event_history.has_changes() or rating_history.has_changes()):
+        return
+    old_event_id = (event_history.deleted or [target.event_id])[0]
+    old_rating = (rating_history.deleted or [target.rating])[0]
+    _adjust(connection, old_event_id, -1, -old_rating)
+    _adjust(connection, target.event_id, 1, target.rating)
+    event_changed(old_event_id, object_session(target))
+    event_changed(target.event_id, object_session(target))
+
+
+@sa_event.listens_for(Review, 'after_delete')
+def _review_deleted(mapper, connection, target):
+    _adjust(connection, target.event_id, -1, -target.rating)
+    event_changed(target.event_id, object_session(target))
+
+
+def reconcile_connection(conn):
+    # A lightweight table has no onupdate for updated_at, so this also runs
+    # in migration 5, before migration 8 adds that column
+    event = table('event', column('id'), column('review_count'),
+                  column('rating_sum'), column('rating_avg'))
+    review = Review.__table__
+    count = (select(func.count()).where(review.c.event_id == event.c.id)
+             .scalar_subquery())
+    total = (select(func.coalesce(func.sum(review.c.rating), 0))
+             .where(review.c.event_id == event.c.id).scalar_subquery())
+    conn.execute(update(event).values(review_count=count, rating_sum=total))
+    conn.execute(update(event).values(
+        rating_avg=_average(event.c.review_count, event.c.rating_sum)))
+
+
+@click.command('ratings-reconcile')
+@with_appcontext
+def reconcile_command():
+    """Recompute event review counts and average ratings from scratch."""
+    with db.engine.begin() as conn:
+        reconcile_connection(conn)
+        # Ratings may have changed, so API validators must too
+        conn.execute(update(Event.__table__).values(updated_at=datetime.utcnow()))
+    click.echo('Event ratings recomputed.')
@@ -1,10 +1,19 @@
-from flask import render_template, redirect, url_for, flash, request
+from flask import render_template, redirect, url_for, flash, request, current_app
+from flask import abort, jsonify
+from flask import Response, stream_template
 from flask_login import login_user, logout_user, login_required, current_user
 from app import db
-from app.models import User, Event, Booking
+from app.models import User, Event, Booking, Review
 from app.forms import RegistrationForm, LoginForm, EventForm, ProfileEditForm
 from app.forms import EventForm
-from datetime import datetime
+from app.booking import hold_tickets, BookingError, HoldExpired
+from app.payments import pay_for_booking, cancel_booking, PaymentError
+from app import analytics, images, search, stats, waitlist, weather
+from app.cache import cached_view, CATALOG_TAG
+from app.pagination import keyset_page, keyset_stream
+from sqlalchemy import update
+from sqlalchemy.orm import joinedload, selectinload
+from datetime import datetime, timedelta
 import os
 
 # We'll create a Blueprint for routes
@@ -14,6 +23,7 @@ main = Blueprint('main', __name__)
 
 
 @main.route('/')
+@cached_view(CATALOG_TAG)
 def index():
     return render_template('index.html')
 
@@ -49,6 +59,9 @@ def login():
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
         if user and user.check_password(form.password.data):
+            if user.password_needs_rehash():
+                user.set_password(form.password.data)
+                db.session.commit()
             login_user(user, remember=(form.remember.data == 'yes'))
             next_page = request.args.get('next')
             flash('Login successful!', 'success')
@@ -74,12 +87,15 @@ def dashboard():
     user_events = Event.query.filter_by(
         organizer_id=current_user.id).order_by(Event.created_at.desc()).all()
 
-    # Get user's bookings (if they exist in your model)
-    user_bookings = []
-    if hasattr(current_user, 'bookings'):
-        user_bookings = current_user.bookings
+    # Get user's bookings with their events in the same query
+    user_bookings = Booking.query.filter_by(user_id=current_user.id).options(
+        joinedload(Booking.event)).order_by(Booking.booking_date.desc()).all()
 
-    return render_template('dashboard.html', events=user_events, bookings=user_bookings)
+    # Sales figures for the organizer's events, from the rollups
+    sales = analytics.summaries(user_events)
+
+    return render_template('dashboard.html', events=user_events, bookings=user_bookings,
+                           sales=sales)
 
 
 @main.route('/profile', methods=['GET', 'POST'])
@@ -88,9 +104,11 @@ def profile():
     form = ProfileEditForm(original_email=current_user.email)
 
     if form.validate_on_submit():
-        current_user.name = form.name.data
-        current_user.email = form.email.data
-        current_user.phone = form.phone.data
+        # current_user may be a cached read-only snapshot, update the row
+        user = db.session.get(User, current_user.id)
+        user.name = form.name.data
+        user.email = form.email.data
+        user.phone = form.phone.data
 
         db.session.commit()
         flash('Your profile has been updated successfully!', 'success')
@@ -106,46 +124,94 @@ def profile():
 
 
 @main.route('/events')
+@cached_view(CATALOG_TAG)
 def events():
     # Get search parameters
     search_query = request.args.get('q', '').strip()
     category_filter = request.args.get('category', '')
     date_filter = request.args.get('date', '')
+    min_rating = request.args.get('min_rating', type=float)
+    sort = request.args.get('sort', '')
 
     # Start with base query
     query = Event.query.filter_by(status='active')
 
-    # Apply search filter
+    # Apply search filter (ranked full-text search when available)
+    rank = None
     if search_query:
-        query = query.filter(
-            (Event.title.ilike(f'%{search_query}%')) |
-            (Event.description.ilike(f'%{search_query}%'))
-        )
+        query, rank = search.apply_search(query, search_query)
 
     # Apply category filter
     if category_filter:
-        query = query.filter_by(category=category_filter)
+        query = query.filter(Event.category == category_filter)
 
     # Apply date filter
     if date_filter:
         # Convert string date to datetime
         try:
             filter_date = datetime.strptime(date_filter, '%Y-%m-%d')
-            query = query.filter(db.func.date(Event.date)
-                                 == filter_date.date())
+            # Range instead of date(Event.date) so the index can be used
+            query = query.filter(Event.date >= filter_date,
+                                 Event.date < filter_date + timedelta(days=1))
         except ValueError:
             pass  # If date format is invalid, ignore the filter
 
-    # Order and execute
-    events_list = query.order_by(Event.date.asc()).all()
+    # Apply rating filter (stored average, no join on reviews)
+    if min_rating:
+        query = query.filter(Event.rating_avg >= min_rating)
+
+    # Sort key for keyset pagination, best matches first when searching
+    keys = [(Event.date, False), (Event.id, False)]
+    if sort == 'rating':
+        keys.insert(0, (Event.rating_avg, True))
+    elif rank is not None:
+        keys.insert(0, (rank, False))
+
+    cursor = request.args.get('after')
+    per_page = min(
+        request.args.get('per_page', current_app.config['EVENTS_PER_PAGE'], type=int),
+        current_app.config['EVENTS_MAX_PER_PAGE'])
+    per_page = max(per_page, 1)
+
+    # Streamed mode: send the page header right away and render the rest of
+    # the catalog as rows arrive, one chunk of per_page rows at a time
+    if request.args.get('stream') == '1':
+        events_iter = keyset_stream(query, keys, cursor, per_page)
+        # stream_template keeps the request context for the whole stream
+        return Response(stream_template('events.html', events=events_iter, next_cursor=None),
+                        mimetype='text/html')
+
+    events_list, next_cursor = keyset_page(query, keys, cursor, per_page)
 
-    return render_template('events.html', events=events_list)
+    return render_template('events.html', events=events_list, next_cursor=next_cursor)
 
 
 @main.route('/event/<int:event_id>')
+@cached_view('event:{event_id}')
 def event_detail(event_id):
+    # Organizer joined in, reviews and their authors in one extra query
+    event = Event.query.options(
+        joinedload(Event.organizer_user),
+        selectinload(Event.reviews).joinedload(Review.author)
+    ).get_or_404(event_id)
+    return render_template('event_detail.html', event=event,
+                           weather=weather.for_event(event))
+
+
+@main.route('/event/<int:event_id>/sales')
+@login_required
+def event_sales(event_id):
     event = Event.query.get_or_404(event_id)
-    return render_template('event_detail.html', event=event)
+
+    # Only the organizer and admins can see sales
+    if event.organizer_id != current_user.id and current_user.role != 'admin':
+        abort(403)
+
+    period = request.args.get('period', 'day')
+    if period not in analytics.PERIODS:
+        abort(400)
+    buckets = request.args.get('buckets', type=int)
+    return jsonify(analytics.event_report(event, period, buckets))
 
 
 @main.route('/event/create', methods=['GET', 'POST'])
@@ -159,6 +225,16 @@ def create_event():
     form = EventForm()
 
     if form.validate_on_submit():
+        # Resize and store the image first so a bad file doesn't leave an
+        # event behind
+        image_paths = None
+        if form.image.data:
+            try:
+                image_paths = images.save_event_image(form.image.data)
+            except images.InvalidImage:
+                flash('The image could not be read, please upload a JPEG, PNG or WebP.', 'danger')
+                return render_template('create_event.html', form=form)
+
         # Combine date and time
         event_datetime = datetime.combine(form.date.data, form.time.data)
 
@@ -177,6 +253,8 @@ def create_event():
             organizer_id=current_user.id,
             status='active'
         )
+        if image_paths:
+            images.apply_to_event(event, image_paths)
 
         db.session.add(event)
         db.session.commit()
@@ -208,9 +286,33 @@ def edit_event(event_id):
         event.address = form.address.data
         event.category = form.category.data
         event.price = form.price.data
-        event.capacity = form.capacity.data
+
+        if form.image.data:
+            try:
+                images.apply_to_event(event, images.save_event_image(form.image.data))
+            except images.InvalidImage:
+                flash('The image could not be read, please upload a JPEG, PNG or WebP.', 'danger')
+                return render_template('edit_event.html', form=form, event=event)
+
+        # Tickets on sale move with the capacity, in one conditional UPDATE
+        # so bookings made meanwhile are counted; it can't drop below what
+        # is already sold or held
+        added = form.capacity.data - event.capacity
+        if added:
+            resized = db.session.execute(
+                update(Event)
+                .where(Event.id == event.id, Event.available_tickets + added >= 0)
+                .values(available_tickets=Event.available_tickets + added)
+                .execution_options(synchronize_session=False))
+            if resized.rowcount != 1:
+                db.session.rollback()
+                flash('The capacity cannot be lower than the tickets already booked!', 'danger')
+                return render_template('edit_event.html', form=form, event=event)
+            event.capacity = form.capacity.data
 
         db.session.commit()
+        if added > 0:
+            waitlist.promote(event.id)
         flash('Event updated successfully!', 'success')
         return redirect(url_for('main.event_detail', event_id=event.id))
 
@@ -255,37 +357,119 @@ def book_event(event_id):
         flash('You cannot book your own event!', 'danger')
         return redirect(url_for('main.event_detail', event_id=event.id))
 
-    # Check ticket availability
-    if event.available_tickets < 1:
-        flash('No tickets available!', 'danger')
+    tickets_count = request.form.get('tickets_count', 1, type=int)
+    if not 1 <= tickets_count <= current_app.config['MAX_TICKETS_PER_BOOKING']:
+        flash('Invalid number of tickets!', 'danger')
         return redirect(url_for('main.event_detail', event_id=event.id))
 
-    # Generate booking number
-    import random
-    import string
-    booking_number = 'BK-' + \
-        ''.join(random.choices(string.ascii_uppercase + string.digits, k=8))
-
-    # Create booking
-    booking = Booking(
-        booking_number=booking_number,
-        event_id=event.id,
-        user_id=current_user.id,
-        tickets_count=1,
-        total_amount=event.price,
-        status='confirmed'
-    )
-    db.session.add(booking)
-
-    # Update available tickets
-    event.available_tickets -= 1
+    # Freed tickets go to the waitlist first
+    if waitlist.has_waiting(event.id):
+        flash('Tickets for this event go to the waitlist first, please join it.', 'info')
+        return redirect(url_for('main.event_detail', event_id=event.id))
 
-    db.session.commit()
-    flash(
-        f'Booking successful! Your booking number: {booking_number}', 'success')
+    # Cheap early check; the booking engine re-checks atomically
+    if event.available_tickets < tickets_count:
+        flash('No tickets available! You can join the waitlist.', 'danger')
+        return redirect(url_for('main.event_detail', event_id=event.id))
+
+    # Hold the tickets while the user pays
+    try:
+        booking = hold_tickets(event, current_user.id, tickets_count)
+    except BookingError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.event_detail', event_id=event_id))
+
+    return redirect(url_for('main.checkout', booking_id=booking.id))
+
+
+@main.route('/booking/<int:booking_id>/checkout', methods=['GET', 'POST'])
+@login_required
+def checkout(booking_id):
+    booking = Booking.query.options(joinedload(Booking.event)).get_or_404(booking_id)
+    if booking.user_id != current_user.id:
+        abort(404)
+    if booking.status == 'expired':
+        flash('Your reservation has expired, please book again.', 'danger')
+        return redirect(url_for('main.event_detail', event_id=booking.event_id))
+    if booking.status != 'pending' or booking.expires_at is None:
+        flash('This booking is not awaiting payment.', 'info')
+        return redirect(url_for('main.dashboard'))
+
+    if request.method == 'POST':
+        try:
+            pay_for_booking(booking, request.form.get('payment_token', ''),
+                            request.form.get('payment_method', 'card'))
+        except HoldExpired as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('main.event_detail', event_id=booking.event_id))
+        except (PaymentError, BookingError) as e:
+            flash(str(e), 'danger')
+        else:
+            flash(
+                f'Booking successful! Your booking number: {booking.booking_number}', 'success')
+            return redirect(url_for('main.dashboard'))
+
+    seconds_left = max(int((booking.expires_at - datetime.utcnow()).total_seconds()), 0)
+    return render_template('checkout.html', booking=booking, event=booking.event,
+                           seconds_left=seconds_left)
+
+
+@main.route('/booking/<int:booking_id>/cancel', methods=['POST'])
+@login_required
+def cancel_booking_view(booking_id):
+    booking = Booking.query.get_or_404(booking_id)
+    if booking.user_id != current_user.id:
+        abort(404)
+
+    try:
+        cancelled = cancel_booking(booking)
+    except PaymentError as e:
+        flash(str(e), 'danger')
+        return redirect(url_for('main.dashboard'))
+    if not cancelled:
+        flash('This booking can no longer be cancelled.', 'info')
+        return redirect(url_for('main.dashboard'))
+
+    waitlist.promote(booking.event_id)
+    flash('Booking cancelled.', 'success')
     return redirect(url_for('main.dashboard'))
 
 
+@main.route('/event/<int:event_id>/waitlist', methods=['POST'])
+@login_required
+def join_waitlist(event_id):
+    event = Event.query.get_or_404(event_id)
+    if event.organizer_id == current_user.id:
+        flash('You cannot book your own event!', 'danger')
+        return redirect(url_for('main.event_detail', event_id=event.id))
+
+    tickets_count = request.form.get('tickets_count', 1, type=int)
+    if not 1 <= tickets_count <= current_app.config['MAX_TICKETS_PER_BOOKING']:
+        flash('Invalid number of tickets!', 'danger')
+        return redirect(url_for('main.event_detail', event_id=event.id))
+
+    try:
+        entry = waitlist.join(event, current_user.id, tickets_count)
+    except BookingError as e:
+        flash(str(e), 'info')
+        return redirect(url_for('main.event_detail', event_id=event.id))
+
+    # Tickets may have been free already
+    if entry.status == 'promoted':
+        return redirect(url_for('main.checkout', booking_id=entry.booking_id))
+    flash(f'You are number {waitlist.position(entry)} on the waitlist. '
+          'We will email you when tickets free up.', 'success')
+    return redirect(url_for('main.event_detail', event_id=event.id))
+
+
+@main.route('/event/<int:event_id>/waitlist/leave', methods=['POST'])
+@login_required
+def leave_waitlist(event_id):
+    if waitlist.leave(event_id, current_user.id):
+        flash('You have left the waitlist.', 'info')
+    return redirect(url_for('main.event_detail', event_id=event_id))
+
+
 @main.route('/create-admin')
 def create_admin():
     # Check if admin already exists
@@ -312,22 +496,22 @@ def admin_dashboard():
         flash('Access denied. Admin only.', 'danger')
         return redirect(url_for('main.dashboard'))
 
-    # Get all data for admin
-    total_users = User.query.count()
-    total_events = Event.query.count()
-    total_bookings = Booking.query.count()
+    # Totals come from the counters table, not COUNT(*) over every table
+    totals = stats.get_totals()
 
     # Get recent activities
     recent_users = User.query.order_by(User.created_at.desc()).limit(5).all()
-    recent_events = Event.query.order_by(
+    recent_events = Event.query.options(joinedload(Event.organizer_user)).order_by(
         Event.created_at.desc()).limit(5).all()
-    recent_bookings = Booking.query.order_by(
+    recent_bookings = Booking.query.options(
+        joinedload(Booking.user), joinedload(Booking.event)).order_by(
         Booking.booking_date.desc()).limit(5).all()
 
     return render_template('admin_dashboard.html',
-                           total_users=total_users,
-                           total_events=total_events,
-                           total_bookings=total_bookings,
+                           total_users=totals['users'],
+                           total_events=totals['events'],
+                           total_bookings=totals['bookings'],
+                           daily_stats=stats.daily_bookings(),
                            recent_users=recent_users,
                            recent_events=recent_events,
                            recent_bookings=recent_bookings)
@@ -0,0 +1,159 @@
+# Full-text search over events.
+#
+# On SQLite the events are mirrored into an FTS5 table (rowid = event.id) that
+# is kept in sync from the Event mapper hooks below. Other databases, or SQLite
+# builds without FTS5, fall back to the old ILIKE filter.
+
+import re
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import (column, event as sa_event, func, inspect,
+                        literal_column, select, table, text)
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Event
+
+FTS_TABLE = 'event_search'
+INDEXED_COLUMNS = ('title', 'description', 'location', 'category')
+# bm25 column weights, same order as INDEXED_COLUMNS
+COLUMN_WEIGHTS = (10.0, 1.0, 3.0, 2.0)
+
+
+def init_app(app):
+    # Without schema setup on start, look for the index on first use
+    app.extensions['event_search'] = (
+        ensure_index() if app.config['SCHEMA_SETUP_ON_START'] else None)
+    app.cli.add_command(rebuild_command)
+
+
+def is_enabled():
+    enabled = current_app.extensions.get('event_search')
+    if enabled is None:
+        enabled = current_app.extensions['event_search'] = index_exists()
+    return enabled
+
+
+def index_exists():
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    with db.engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': FTS_TABLE}).first() is not None
+
+
+def ensure_index():
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    if index_exists():
+        return True
+
+    with db.engine.begin() as conn:
+        try:
+            conn.execute(text(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                f"{', '.join(INDEXED_COLUMNS)}, "
+                "tokenize = 'unicode61 remove_diacritics 2')"))
+        except OperationalError:
+            current_app.logger.warning(
+                'SQLite FTS5 is not available, event search will use LIKE')
+            return False
+        # New index on an existing database: fill it from the event table
+        _rebuild(conn)
+    return True
+
+
+def _rebuild(conn):
+    columns = ', '.join(INDEXED_COLUMNS)
+    conn.execute(text(f'DELETE FROM {FTS_TABLE}'))
+    conn.execute(text(
+        f'INSERT INTO {FTS_TABLE} (rowid, {columns}) '
+        f'SELECT id, {columns} FROM event'))
+
+
+def rebuild():
+    with db.engine.begin() as conn:
+        _rebuild(conn)
+
+
+def index_event(conn, event):
+    remove_event(conn, event.id)
+    values = {name: getattr(event, name) or '' for name in INDEXED_COLUMNS}
+    values['rowid'] = event.id
+    conn.execute(text(
+        f"INSERT INTO {FTS_TABLE} (rowid, {', '.join(INDEXED_COLUMNS)}) "
+        f"VALUES (:rowid, {', '.join(':' + name for name in INDEXED_COLUMNS)})"),
+        values)
+
+
+def remove_event(conn, event_id):
+    conn.execute(text(f'DELETE FROM {FTS_TABLE} WHERE rowid = :id'),
+                 {'id': event_id})
+
+
+def build_match(search_query):
+    # Quote every word so user input can't inject FTS syntax, and prefix-match
+    # the words so results show up while the user is still typing
+    words = re.findall(r'\w+', search_query)
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def apply_search(query, search_query):
+    # Returns (query, rank) where rank is a column to order by, or None if
+    # the fallback filter was used
+    match = build_match(search_query)
+    if not match:
+        return query, None
+
+    if not is_enabled():
+        return query.filter(
+            (Event.title.ilike(f'%{search_query}%')) |
+            (Event.description.ilike(f'%{search_query}%'))
+        ), None
+
+    fts = literal_column(FTS_TABLE)
+    search_table = table(FTS_TABLE, column('rowid'))
+    ranked = select(
+        search_table.c.rowid.label('event_id'),
+        func.bm25(fts, *COLUMN_WEIGHTS).label('rank')
+    ).where(fts.op('MATCH')(match)).subquery()
+
+    query = query.join(ranked, ranked.c.event_id == Event.id)
+    return query, ranked.c.rank
+
+
+def _text_changed(target):
+    state = inspect(target)
+    return any(state.attrs[name].history.has_changes()
+               for name in INDEXED_COLUMNS)
+
+
+@sa_event.listens_for(Event, 'after_insert')
+def _event_inserted(mapper, connection, target):
+    if is_enabled():
+        index_event(connection, target)
+
+
+@sa_event.listens_for(Event, 'after_update')
+def _event_updated(mapper, connection, target):
+    if is_enabled() and _text_changed(target):
+        index_event(connection, target)
+
+
+@sa_event.listens_for(Event, 'after_delete')
+def _event_deleted(mapper, connection, target):
+    if is_enabled():
+        remove_event(connection, target.id)
+
+
+@click.command('search-rebuild')
+@with_appcontext
+def rebuild_command():
+    """Rebuild the event full-text search index."""
+    if not is_enabled():
+        raise click.ClickException('Full-text search is not available.')
+    rebuild()
+    click.echo('Search index rebuilt.')
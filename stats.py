@@ -0,0 +1,186 @@
+# Site-wide statistics for the admin dashboard.
+#
+# Instead of COUNT(*) over whole tables on every page view, totals live in
+# the stat_counter table and confirmed bookings are rolled up per day in
+# daily_booking_stat. Both are updated by mapper hooks inside the same
+# transaction as the row that changed, so a rollback undoes them too.
+# Counter changes are summed per flush, so adding many rows at once costs
+# one upsert per counter.
+# Bulk inserts skip the hooks; run `flask stats-reconcile` after them.
+
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import cast, delete, event as sa_event, func, inspect, insert, select, update
+from sqlalchemy.orm import Session, object_session
+
+from app import db
+from app.models import User, Event, Booking, StatCounter, DailyBookingStat
+
+COUNTED_MODELS = {'users': User, 'events': Event, 'bookings': Booking}
+
+_snapshot = {'totals': None, 'loaded_at': 0.0}
+_snapshot_lock = threading.Lock()
+
+
+def init_app(app):
+    app.cli.add_command(reconcile_command)
+
+
+def increment(conn, model, keys, deltas):
+    # Add deltas to the row identified by keys, creating it if missing
+    table = model.__table__
+    dialect = conn.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        # Imported here so SQLite deployments never load the PostgreSQL dialect
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as insert_fn
+        else:
+            from sqlalchemy.dialects.postgresql import insert as insert_fn
+        statement = insert_fn(table).values(**keys, **deltas)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={name: table.c[name] + statement.excluded[name]
+                  for name in deltas})
+        conn.execute(statement)
+        return
+
+    where = [table.c[name] == value for name, value in keys.items()]
+    result = conn.execute(update(table).where(*where).values(
+        {name: table.c[name] + value for name, value in deltas.items()}))
+    if result.rowcount == 0:
+        conn.execute(insert(table).values(**keys, **deltas))
+
+
+def _count(target, name, delta):
+    deltas = object_session(target).info.setdefault('stat_counter_deltas', {})
+    deltas[name] = deltas.get(name, 0) + delta
+
+
+@sa_event.listens_for(Session, 'after_flush')
+def _apply_counts(db_session, flush_context):
+    deltas = db_session.info.pop('stat_counter_deltas', None)
+    if not deltas:
+        return
+    conn = db_session.connection()
+    for name, delta in deltas.items():
+        if delta:
+            increment(conn, StatCounter, {'name': name}, {'value': delta})
+
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _discard_counts(db_session):
+    # Left over from a flush that failed before after_flush
+    db_session.info.pop('stat_counter_deltas', None)
+
+
+def _booking_day(conn, booking, sign):
+    day = (booking.booking_date or datetime.utcnow()).date()
+    increment(conn, DailyBookingStat, {'day': day}, {
+        'bookings': sign,
+        'tickets': sign * (booking.tickets_count or 1),
+        'revenue': sign * (booking.total_amount or 0.0),
+    })
+
+
+def _register_counter(name, model):
+    @sa_event.listens_for(model, 'after_insert')
+    def inserted(mapper, connection, target):
+        _count(target, name, 1)
+
+    @sa_event.listens_for(model, 'after_delete')
+    def deleted(mapper, connection, target):
+        _count(target, name, -1)
+
+
+for _name, _model in COUNTED_MODELS.items():
+    _register_counter(_name, _model)
+
+
+@sa_event.listens_for(Booking, 'after_insert')
+def _booking_inserted(mapper, connection, target):
+    if target.status == 'confirmed':
+        _booking_day(connection, target, 1)
+
+
+@sa_event.listens_for(Booking, 'after_update')
+def _booking_updated(mapper, connection, target):
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+    was_confirmed = 'confirmed' in (history.deleted or ())
+    if target.status == 'confirmed' and not was_confirmed:
+        _booking_day(connection, target, 1)
+    elif was_confirmed and target.status != 'confirmed':
+        _booking_day(connection, target, -1)
+
+
+@sa_event.listens_for(Booking, 'after_delete')
+def _booking_deleted(mapper, connection, target):
+    if target.status == 'confirmed':
+        _booking_day(connection, target, -1)
+
+
+def get_totals():
+    # Totals may be up to STATS_MAX_STALENESS seconds old
+    max_age = current_app.config['STATS_MAX_STALENESS']
+    with _snapshot_lock:
+        if (_snapshot['totals'] is not None
+                and time.monotonic() - _snapshot['loaded_at'] < max_age):
+            return _snapshot['totals']
+
+    rows = db.session.execute(select(StatCounter.name, StatCounter.value)).all()
+    totals = {name: 0 for name in COUNTED_MODELS}
+    totals.update(rows)
+    with _snapshot_lock:
+        _snapshot['totals'] = totals
+        _snapshot['loaded_at'] = time.monotonic()
+    return totals
+
+
+def daily_bookings(days=30):
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    return (DailyBookingStat.query
+            .filter(DailyBookingStat.day >= since)
+            .order_by(DailyBookingStat.day.asc()).all())
+
+
+def reconcile_connection(conn):
+    for name, model in COUNTED_MODELS.items():
+        value = conn.execute(select(func.count()).select_from(model)).scalar()
+        conn.execute(delete(StatCounter).where(StatCounter.name == name))
+        conn.execute(insert(StatCounter).values(name=name, value=value))
+
+    if conn.dialect.name == 'sqlite':
+        day = func.date(Booking.booking_date)
+    else:
+        day = cast(Booking.booking_date, db.Date)
+    rollup = (select(day,
+                     func.count(),
+                     func.coalesce(func.sum(Booking.tickets_count), 0),
+                     func.coalesce(func.sum(Booking.total_amount), 0.0))
+              .where(Booking.status == 'confirmed')
+              .group_by(day))
+    conn.execute(delete(DailyBookingStat))
+    conn.execute(insert(DailyBookingStat).from_select(
+        ['day', 'bookings', 'tickets', 'revenue'], rollup))
+
+
+def reconcile():
+    with db.engine.begin() as conn:
+        reconcile_connection(conn)
+    with _snapshot_lock:
+        _snapshot['totals'] = None
+
+
+@click.command('stats-reconcile')
+@with_appcontext
+def reconcile_command():
+    """Recompute dashboard counters and daily rollups from scratch."""
+    reconcile()
+    for name, value in get_totals().items():
+        click.echo(f'{name}: {value}')
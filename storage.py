@@ -0,0 +1,41 @@
+# Content-addressed file storage under UPLOAD_FOLDER.
+#
+# Files are named after the SHA-256 of their bytes, so storing the same
+# content twice writes it once, and a stored file never changes.
+
+import hashlib
+import os
+import tempfile
+
+from flask import current_app
+
+BLOB_DIR = 'blobs'
+
+
+def upload_root():
+    return os.path.join(current_app.root_path, current_app.config['UPLOAD_FOLDER'])
+
+
+def upload_path(*parts):
+    return os.path.join(upload_root(), *parts)
+
+
+def blob_name(data, extension):
+    digest = hashlib.sha256(data).hexdigest()
+    # Two-level fan-out keeps directories small
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}.{extension}'
+
+
+def store_blob(root, data, extension):
+    # Returns the path relative to root. Doesn't need an app context, so it
+    # can run in worker processes.
+    name = blob_name(data, extension)
+    path = os.path.join(root, name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent writers of the same blob are safe
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return name
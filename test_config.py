@@ -0,0 +1,32 @@
+import importlib
+
+import pytest
+from flask import Flask
+
+import config
+
+
+@pytest.fixture
+def app_config(monkeypatch):
+    # Config reads the environment when the module is imported, so reload
+    # it with the test's environment and again afterwards
+    def load(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        app = Flask(__name__)
+        app.config.from_object(importlib.reload(config).Config)
+        return app.config
+
+    monkeypatch.delenv('MAX_CONTENT_LENGTH', raising=False)
+    yield load
+    monkeypatch.undo()
+    importlib.reload(config)
+
+
+def test_max_content_length_default(app_config):
+    assert app_config()['MAX_CONTENT_LENGTH'] == 10 * 1024 * 1024
+
+
+def test_max_content_length_from_env(app_config):
+    settings = app_config(MAX_CONTENT_LENGTH=str(20 * 1024 * 1024))
+    assert settings['MAX_CONTENT_LENGTH'] == 20 * 1024 * 1024
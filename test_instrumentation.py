@@ -0,0 +1,30 @@
+import threading
+import time
+
+
+def test_overlapping_profiled_requests(app, tmp_path):
+    from app import instrumentation
+
+    app.config.update(PROFILE_SLOW_REQUESTS=0.01, PROFILE_SAMPLE_RATE=1.0,
+                      PROFILE_DIR=str(tmp_path / 'profiles'))
+
+    @app.route('/slow')
+    def slow():
+        time.sleep(0.1)
+        return 'ok'
+
+    statuses = []
+
+    def request():
+        statuses.append(app.test_client().get('/slow').status_code)
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Only one of them could be profiled, none of them failed
+    assert statuses == [200] * 4
+    assert len(list((tmp_path / 'profiles').iterdir())) >= 1
+    assert not instrumentation._profile_lock.locked()
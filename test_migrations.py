@@ -0,0 +1,51 @@
+import os
+import shutil
+
+from sqlalchemy import text
+
+from app import db, migrations
+from conftest import create_test_app
+
+# A database from before the migrations, with real events in it
+OLD_DATABASE = os.path.join(os.path.dirname(__file__), 'event_management.db')
+
+
+def _old_database(tmp_path):
+    shutil.copy(OLD_DATABASE, tmp_path / 'test.db')
+
+
+def _event_times(app):
+    with app.app_context():
+        return db.session.execute(text(
+            'SELECT created_at, updated_at FROM event')).all()
+
+
+def _applied(app):
+    with app.app_context(), db.engine.begin() as conn:
+        return migrations.applied_versions(conn)
+
+
+def test_upgrade_keeps_event_creation_times(tmp_path):
+    _old_database(tmp_path)
+    app = create_test_app(tmp_path)
+
+    assert _applied(app) == {version for version, _, _ in migrations.MIGRATIONS}
+    times = _event_times(app)
+    assert times
+    assert all(updated_at == created_at for created_at, updated_at in times)
+
+
+def test_upgrade_from_version_7(tmp_path, monkeypatch):
+    # Databases migrated before updated_at existed get it from migration 8
+    _old_database(tmp_path)
+    all_migrations = list(migrations.MIGRATIONS)
+    monkeypatch.setattr(migrations, 'MIGRATIONS',
+                        [m for m in all_migrations if m[0] <= 7])
+    app = create_test_app(tmp_path)
+    assert max(_applied(app)) == 7
+
+    monkeypatch.setattr(migrations, 'MIGRATIONS', all_migrations)
+    with app.app_context():
+        applied = migrations.upgrade()
+    assert [version for version, _ in applied] == [8, 9, 10, 11]
+    assert all(updated_at == created_at for created_at, updated_at in _event_times(app))
@@ -0,0 +1,31 @@
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import User
+from app.passwords import needs_rehash
+from config import Config
+from conftest import create_test_app, login
+
+
+def _password_hash(app, user_id):
+    with app.app_context():
+        return db.session.get(User, user_id).password_hash
+
+
+def test_default_method_keeps_existing_hashes(tmp_path):
+    # Existing accounts were hashed with werkzeug's defaults; the default
+    # config must not rewrite them on login
+    app = create_test_app(tmp_path, PASSWORD_HASH_METHOD=Config.PASSWORD_HASH_METHOD)
+    with app.app_context():
+        assert not needs_rehash(generate_password_hash('secret', 'scrypt'))
+        assert needs_rehash(generate_password_hash('secret', 'pbkdf2:sha256:1000'))
+
+
+def test_login_rehashes_after_a_settings_change(app, seed):
+    before = _password_hash(app, seed.attendee_id)
+    login(app.test_client(), 'attendee@example.com')
+    assert _password_hash(app, seed.attendee_id) == before
+
+    app.config['PASSWORD_HASH_METHOD'] = 'pbkdf2:sha256:2000'
+    login(app.test_client(), 'attendee@example.com')
+    assert _password_hash(app, seed.attendee_id).startswith('pbkdf2:sha256:2000$')
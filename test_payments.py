@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.booking import HoldExpired, expire_holds, hold_tickets
+from app.models import Booking, Event, Job, Payment
+from app.payments import PaymentDeclined, PaymentError, get_provider, pay_for_booking
+from conftest import login
+
+
+def _hold(app, seed, tickets=2):
+    with app.app_context():
+        event = db.session.get(Event, seed.event_id)
+        return hold_tickets(event, seed.attendee_id, tickets).id
+
+
+def _available(app, seed):
+    with app.app_context():
+        return db.session.get(Event, seed.event_id).available_tickets
+
+
+def _payments(booking_id):
+    return [p.status for p in Payment.query.filter_by(booking_id=booking_id)
+            .order_by(Payment.id)]
+
+
+def test_hold_then_pay_confirms(app, seed):
+    booking_id = _hold(app, seed)
+    assert _available(app, seed) == 8
+
+    with app.app_context():
+        booking = db.session.get(Booking, booking_id)
+        assert booking.status == 'pending' and booking.expires_at is not None
+        payment = pay_for_booking(booking, 'tok_visa')
+
+        assert payment.status == 'completed'
+        assert payment.transaction_id.startswith('fake_')
+        booking = db.session.get(Booking, booking_id)
+        assert booking.status == 'confirmed'
+        assert booking.expires_at is None
+        assert Job.query.filter_by(kind='send_booking_confirmation').count() == 1
+    assert _available(app, seed) == 8
+
+
+def test_declined_card_keeps_the_hold(app, seed):
+    booking_id = _hold(app, seed)
+
+    with app.app_context():
+        with pytest.raises(PaymentDeclined):
+            pay_for_booking(db.session.get(Booking, booking_id), 'tok_declined')
+        assert db.session.get(Booking, booking_id).status == 'pending'
+
+        # The user can try another card
+        pay_for_booking(db.session.get(Booking, booking_id), 'tok_visa')
+        assert db.session.get(Booking, booking_id).status == 'confirmed'
+        assert _payments(booking_id) == ['failed', 'completed']
+
+
+def test_provider_error(app, seed):
+    booking_id = _hold(app, seed)
+
+    with app.app_context():
+        with pytest.raises(PaymentError):
+            pay_for_booking(db.session.get(Booking, booking_id), 'tok_error')
+        assert db.session.get(Booking, booking_id).status == 'pending'
+        assert _payments(booking_id) == ['failed']
+    assert _available(app, seed) == 8
+
+
+def test_swept_hold_cannot_be_paid(app, seed):
+    booking_id = _hold(app, seed)
+    with app.app_context():
+        assert expire_holds(now=datetime.utcnow() + timedelta(hours=1)) == 1
+        assert db.session.get(Booking, booking_id).status == 'expired'
+    assert _available(app, seed) == 10
+
+    client = login(app.test_client(), 'attendee@example.com')
+    response = client.post(f'/api/v1/me/bookings/{booking_id}/payment',
+                           json={'token': 'tok_visa'})
+    assert response.status_code == 410
+    with app.app_context():
+        with pytest.raises(HoldExpired):
+            pay_for_booking(db.session.get(Booking, booking_id), 'tok_visa')
+        assert _payments(booking_id) == []
+
+
+def test_hold_swept_during_the_charge_is_refunded(app, seed, monkeypatch):
+    booking_id = _hold(app, seed)
+    refunds = []
+
+    with app.app_context():
+        provider = get_provider()
+        charge = provider.charge
+
+        def charge_while_sweeping(amount, token, reference):
+            transaction_id = charge(amount, token, reference)
+            # The sweeper, in another worker, runs before the hold is claimed
+            with app.app_context():
+                expire_holds(now=datetime.utcnow() + timedelta(hours=1))
+            return transaction_id
+
+        monkeypatch.setattr(provider, 'charge', charge_while_sweeping)
+        monkeypatch.setattr(provider, 'refund', refunds.append)
+
+        with pytest.raises(HoldExpired):
+            pay_for_booking(db.session.get(Booking, booking_id), 'tok_visa')
+
+        payment = Payment.query.filter_by(booking_id=booking_id).one()
+        assert payment.status == 'failed'
+        assert refunds == [payment.transaction_id]
+        assert db.session.get(Booking, booking_id).status == 'expired'
+    assert _available(app, seed) == 10
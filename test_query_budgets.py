@@ -0,0 +1,56 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.booking import book_tickets
+from app.instrumentation import QueryBudgetExceeded
+from app.models import Event, Review, User
+from conftest import login
+
+
+@pytest.fixture
+def busy(app, seed):
+    # Enough events, bookings and reviews that a query per row would show
+    app.config['QUERY_BUDGET_STRICT'] = True
+    with app.app_context():
+        reviewers = [User(email=f'reviewer{i}@example.com', name=f'Reviewer {i}')
+                     for i in range(5)]
+        db.session.add_all(reviewers)
+        for i in range(5):
+            event = Event(title=f'Show {i}', date=datetime.utcnow() + timedelta(days=i + 1),
+                          time='20:00', location='Berlin', category='concert',
+                          price=10.0, capacity=10, available_tickets=10,
+                          organizer_id=seed.organizer_id, status='active')
+            db.session.add(event)
+            db.session.flush()
+            book_tickets(event, seed.attendee_id, 1)
+        db.session.add_all(Review(event_id=seed.event_id, user_id=reviewer.id, rating=4)
+                           for reviewer in reviewers)
+        db.session.commit()
+    return seed
+
+
+@pytest.mark.parametrize('email, path', [
+    ('attendee@example.com', '/dashboard'),
+    ('organizer@example.com', '/dashboard'),
+    ('attendee@example.com', '/event/{event_id}'),
+    ('admin@example.com', '/admin'),
+])
+def test_pages_stay_within_budget(app, busy, email, path):
+    client = login(app.test_client(), email)
+    for _ in range(2):
+        # Twice: cold and warm caches
+        response = client.get(path.format(event_id=busy.event_id))
+        assert response.status_code == 200
+
+
+def test_n_plus_one_fails(app, busy, monkeypatch):
+    # Each booking's event reviews, loaded one event at a time
+    templates = app.jinja_loader.loaders[0].mapping
+    monkeypatch.setitem(templates, 'dashboard.html',
+                        '{% for booking in bookings %}'
+                        '{{ booking.event.reviews|length }};{% endfor %}')
+    client = login(app.test_client(), 'attendee@example.com')
+    with pytest.raises(QueryBudgetExceeded, match='main.dashboard'):
+        client.get('/dashboard')
@@ -0,0 +1,89 @@
+import json
+
+from app import db
+from app.models import Booking, Event, Job, User
+from conftest import create_test_app
+
+
+def _invoke(app, *args):
+    return app.test_cli_runner().invoke(args=list(args))
+
+
+def _write_jsonl(path, rows):
+    path.write_text(''.join(json.dumps(row) + '\n' for row in rows))
+    return str(path)
+
+
+def test_users_round_trip(app, seed, tmp_path):
+    exported = tmp_path / 'users.csv'
+    assert _invoke(app, 'export', 'users', '-o', str(exported)).exit_code == 0
+
+    copy_dir = tmp_path / 'copy'
+    copy_dir.mkdir()
+    copy = create_test_app(copy_dir)
+    result = _invoke(copy, 'users-import', str(exported))
+    assert result.exit_code == 0, result.stderr
+    assert 'Imported 3 users, 0 rows rejected.' in result.output
+    with copy.app_context():
+        users = User.query.order_by(User.id).all()
+        assert [(u.email, u.role) for u in users] == [
+            ('organizer@example.com', 'organizer'),
+            ('attendee@example.com', 'attendee'),
+            ('admin@example.com', 'admin')]
+        # Hashes aren't exported, so nobody can log in yet
+        assert all(u.password_hash is None for u in users)
+
+    result = _invoke(copy, 'users-import', str(exported))
+    assert result.exit_code == 1
+    assert 'line 2: email: organizer@example.com is already registered.' in result.stderr
+
+
+def test_bookings_import(app, seed, tmp_path):
+    source = _write_jsonl(tmp_path / 'bookings.jsonl', [
+        {'event_id': seed.event_id, 'user_email': 'attendee@example.com',
+         'tickets_count': 3, 'booking_number': 'BK-OLD00001'},
+        {'event_id': seed.event_id, 'user_email': 'admin@example.com',
+         'tickets_count': 2, 'status': 'cancelled', 'total_amount': 15,
+         'booking_date': '2024-05-01T10:30:00'},
+        {'event_id': seed.event_id, 'user_email': 'nobody@example.com',
+         'tickets_count': 1},
+        {'event_id': seed.event_id, 'user_email': 'admin@example.com',
+         'tickets_count': 8},
+        {'event_id': seed.event_id, 'user_email': 'admin@example.com',
+         'tickets_count': 1, 'status': 'pending'},
+        {'event_id': seed.event_id, 'user_email': 'admin@example.com',
+         'tickets_count': 1, 'booking_number': 'BK-OLD00001'},
+    ])
+
+    result = _invoke(app, 'bookings-import', source)
+    assert result.exit_code == 1
+    assert 'Imported 2 bookings, 4 rows rejected.' in result.output
+    errors = result.stderr.splitlines()
+    assert [error.split(':')[0] for error in errors] == [
+        'line 3', 'line 4', 'line 5', 'line 6']
+    assert 'no user nobody@example.com' in errors[0]
+    assert 'not enough tickets left' in errors[1]
+
+    with app.app_context():
+        confirmed = Booking.query.filter_by(booking_number='BK-OLD00001').one()
+        assert (confirmed.status, confirmed.total_amount) == ('confirmed', 30.0)
+        cancelled = Booking.query.filter_by(status='cancelled').one()
+        assert cancelled.total_amount == 15.0
+        assert cancelled.booking_date.isoformat() == '2024-05-01T10:30:00'
+        # Only the confirmed booking took tickets and got fulfilment queued
+        assert db.session.get(Event, seed.event_id).available_tickets == 7
+        assert sorted(job.kind for job in Job.query) == [
+            'issue_tickets', 'send_booking_confirmation']
+
+
+def test_bookings_dry_run_changes_nothing(app, seed, tmp_path):
+    source = _write_jsonl(tmp_path / 'bookings.jsonl', [
+        {'event_id': seed.event_id, 'user_email': 'attendee@example.com',
+         'tickets_count': 4}])
+
+    result = _invoke(app, 'bookings-import', '--dry-run', source)
+    assert result.exit_code == 0
+    assert 'Validated 1 bookings, 0 rows rejected.' in result.output
+    with app.app_context():
+        assert Booking.query.count() == 0
+        assert db.session.get(Event, seed.event_id).available_tickets == 10
@@ -0,0 +1,49 @@
+from app import db
+from app.models import User
+from app.user_cache import load
+from conftest import create_test_app
+
+
+def _demote(other, user_id):
+    with other.app_context():
+        db.session.get(User, user_id).role = 'attendee'
+        db.session.commit()
+
+
+def test_change_in_this_process_is_seen_at_once(app, seed):
+    with app.app_context():
+        assert load(seed.admin_id).role == 'admin'
+    _demote(app, seed.admin_id)
+    with app.app_context():
+        assert load(seed.admin_id).role == 'attendee'
+
+
+def test_change_in_another_process_is_seen_after_the_check(app, seed, tmp_path):
+    other = create_test_app(tmp_path)
+    app.config['USER_CACHE_CHECK_INTERVAL'] = 3600
+    with app.app_context():
+        assert load(seed.admin_id).role == 'admin'
+
+    _demote(other, seed.admin_id)
+    with app.app_context():
+        # Within the interval the snapshot may still be stale...
+        assert load(seed.admin_id).role == 'admin'
+        # ...but not after the next generation check
+        app.config['USER_CACHE_CHECK_INTERVAL'] = 0
+        assert load(seed.admin_id).role == 'attendee'
+
+
+def test_deleted_user(app, seed, tmp_path):
+    other = create_test_app(tmp_path)
+    app.config['USER_CACHE_CHECK_INTERVAL'] = 3600
+    with app.app_context():
+        snapshot = load(seed.attendee_id)
+
+    with other.app_context():
+        db.session.delete(db.session.get(User, seed.attendee_id))
+        db.session.commit()
+
+    with app.app_context():
+        assert snapshot.model is None
+        # model dropped the stale snapshot
+        assert load(seed.attendee_id) is None
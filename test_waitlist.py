@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+
+from app import db, waitlist
+from app.booking import expire_holds, hold_tickets
+from app.models import Booking, Event, Job, User, WaitlistEntry
+from app.payments import cancel_booking
+from conftest import login
+
+
+def _sell_out(app, seed):
+    # The admin holds every ticket; returns that booking's id
+    with app.app_context():
+        event = db.session.get(Event, seed.event_id)
+        return hold_tickets(event, seed.admin_id, event.available_tickets).id
+
+
+def _join(app, seed, *tickets):
+    # A new user per entry, joining in the given order; returns their ids
+    user_ids = []
+    with app.app_context():
+        event = db.session.get(Event, seed.event_id)
+        for count in tickets:
+            user = User(email=f'fan{User.query.count()}@example.com', name='Fan')
+            db.session.add(user)
+            db.session.commit()
+            waitlist.join(event, user.id, count)
+            user_ids.append(user.id)
+    return user_ids
+
+
+def _promoted(app, seed):
+    # User ids of promoted entries, in line order
+    with app.app_context():
+        return [entry.user_id for entry in WaitlistEntry.query
+                .filter_by(event_id=seed.event_id, status='promoted')
+                .order_by(WaitlistEntry.id)]
+
+
+def _free(app, booking_id):
+    with app.app_context():
+        booking = db.session.get(Booking, booking_id)
+        assert cancel_booking(booking)
+        return waitlist.promote(booking.event_id)
+
+
+def test_promotes_in_order(app, seed):
+    booking_id = _sell_out(app, seed)
+    fans = _join(app, seed, 3, 4, 2)
+    with app.app_context():
+        entry = waitlist.waiting_entry(seed.event_id, fans[2])
+        assert waitlist.position(entry) == 3
+
+    assert _free(app, booking_id) == 3
+    assert _promoted(app, seed) == fans
+    with app.app_context():
+        holds = {b.user_id: b for b in Booking.query.filter_by(status='pending')}
+        assert [holds[fan].tickets_count for fan in fans] == [3, 4, 2]
+        assert all(holds[fan].expires_at > datetime.utcnow() for fan in fans)
+        assert Job.query.filter_by(kind='send_waitlist_offer').count() == 3
+        assert db.session.get(Event, seed.event_id).available_tickets == 1
+
+
+def test_stops_at_the_first_entry_that_does_not_fit(app, seed):
+    with app.app_context():
+        event = db.session.get(Event, seed.event_id)
+        # 3 tickets left: the first fan fits, the second doesn't, and the
+        # third, who would fit, must not jump the line
+        hold_tickets(event, seed.admin_id, 7)
+    booking_id = _sell_out(app, seed)
+    fans = _join(app, seed, 2, 2, 1)
+
+    _free(app, booking_id)
+    assert _promoted(app, seed) == fans[:1]
+    with app.app_context():
+        assert db.session.get(Event, seed.event_id).available_tickets == 1
+        assert waitlist.has_waiting(seed.event_id)
+
+
+def test_new_bookings_wait_behind_the_line(app, seed):
+    _sell_out(app, seed)
+    _join(app, seed, 1)
+    client = login(app.test_client(), 'attendee@example.com')
+    response = client.post(f'/api/v1/events/{seed.event_id}/bookings', json={'tickets': 1})
+    assert response.status_code == 409
+
+
+def test_swept_hold_promotes_the_next_entry(app, seed):
+    booking_id = _sell_out(app, seed)
+    fans = _join(app, seed, 4, 4)
+    _free(app, booking_id)
+    assert _promoted(app, seed) == fans
+    more = _join(app, seed, 4)
+
+    # The first fan never pays; their 4 tickets go to the next in line
+    with app.app_context():
+        first = WaitlistEntry.query.filter_by(user_id=fans[0]).one()
+        db.session.get(Booking, first.booking_id).expires_at = (
+            datetime.utcnow() - timedelta(seconds=1))
+        db.session.commit()
+        assert expire_holds() == 1
+    assert _promoted(app, seed) == fans + more
+
+
+def test_capacity_increase_promotes(app, seed):
+    _sell_out(app, seed)
+    fans = _join(app, seed, 3, 3)
+
+    client = login(app.test_client(), 'organizer@example.com')
+    response = client.post(f'/event/{seed.event_id}/edit', data={
+        'title': 'Concert', 'description': 'Live music', 'date': '2030-01-01',
+        'time': '20:00', 'location': 'Berlin', 'address': 'Street 1',
+        'category': 'concert', 'price': '10', 'capacity': '14'})
+    assert response.status_code == 302
+
+    assert _promoted(app, seed) == fans[:1]
+    with app.app_context():
+        event = db.session.get(Event, seed.event_id)
+        assert (event.capacity, event.available_tickets) == (14, 1)
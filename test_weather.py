@@ -0,0 +1,94 @@
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from app import db
+from app.models import Event
+from app.weather import WeatherUnavailable, get_service, parse
+from conftest import create_test_app
+
+
+class StubProvider(BaseHTTPRequestHandler):
+    # Answers like a weather provider; the server's `status` makes it fail
+    def do_GET(self):
+        self.server.requests.append(parse_qs(urlparse(self.path).query))
+        if self.server.status != 200:
+            self.send_error(self.server.status)
+            return
+        query = parse_qs(urlparse(self.path).query)
+        body = json.dumps({'summary': f'Sunny in {query["location"][0]}'}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def provider():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubProvider)
+    server.requests = []
+    server.status = 200
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def weather_app(tmp_path, provider):
+    host, port = provider.server_address
+    return create_test_app(tmp_path, WEATHER_API_URL=f'http://{host}:{port}/forecast',
+                           WEATHER_API_KEY='secret')
+
+
+def test_lookup_is_cached(weather_app, provider):
+    day = datetime.utcnow().date()
+    with weather_app.app_context():
+        service = get_service()
+        assert service.lookup('Berlin', day) == {'summary': 'Sunny in Berlin'}
+        assert service.lookup(' berlin ', day) == {'summary': 'Sunny in Berlin'}
+    assert provider.requests == [{'location': ['Berlin'], 'date': [day.isoformat()],
+                                  'key': ['secret']}]
+
+
+def test_failures_are_cached_briefly(weather_app, provider):
+    provider.status = 500
+    day = datetime.utcnow().date()
+    with weather_app.app_context():
+        service = get_service()
+        for _ in range(3):
+            with pytest.raises(WeatherUnavailable):
+                service.lookup('Berlin', day)
+        assert len(provider.requests) == 1
+
+        # Once the failure has expired the provider is asked again
+        provider.status = 200
+        service.cache.delete(('berlin', day.isoformat()))
+        assert service.lookup('Berlin', day) == {'summary': 'Sunny in Berlin'}
+        assert len(provider.requests) == 2
+
+
+def test_refresh_batches_by_location_and_date(weather_app, provider, seed):
+    # seed went through the `app` fixture, which shares the database
+    date = datetime.utcnow() + timedelta(days=2)
+    with weather_app.app_context():
+        events = [Event(title=f'Show {i}', date=date, location=location,
+                        price=0, capacity=10, available_tickets=10,
+                        organizer_id=seed.organizer_id, status='active')
+                  for i, location in enumerate(['Berlin', 'Berlin', 'Paris'])]
+        db.session.add_all(events)
+        db.session.commit()
+
+        assert get_service().refresh(events) == 3
+        assert len(provider.requests) == 2
+        stored = parse(db.session.get(Event, events[2].id).weather_data)
+        assert stored['forecast'] == {'summary': 'Sunny in Paris'}
@@ -0,0 +1,157 @@
+# Ticket issuance.
+#
+# issue_tickets_bulk() creates any number of tickets with one bulk insert
+# and renders their QR codes in parallel across a process pool. Images are
+# stored content-addressed (app.storage) and Ticket.qr_code points at the
+# blob. Confirmed bookings get their tickets from the 'issue_tickets'
+# background job, so booking requests never wait for rendering.
+
+import io
+import multiprocessing
+import random
+import string
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import repeat
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, insert, select, update
+
+from app import db
+from app.jobs import job
+from app.models import Booking, Event, Ticket
+from app.storage import store_blob, upload_path, upload_root
+
+_random = random.SystemRandom()
+
+INSERT_CHUNK_SIZE = 1000
+# SQLite allows at most 999 bound parameters per statement
+LOOKUP_CHUNK_SIZE = 900
+
+
+def init_app(app):
+    app.cli.add_command(issue_command)
+
+
+def generate_ticket_number():
+    return 'TK-' + ''.join(
+        _random.choices(string.ascii_uppercase + string.digits, k=10))
+
+
+def unique_ticket_numbers(count):
+    # `count` numbers that are unique within the batch and not in the database
+    numbers = set()
+    while len(numbers) < count:
+        candidates = set()
+        while len(candidates) < count - len(numbers):
+            candidate = generate_ticket_number()
+            if candidate not in numbers:
+                candidates.add(candidate)
+        candidates = list(candidates)
+        for start in range(0, len(candidates), LOOKUP_CHUNK_SIZE):
+            chunk = candidates[start:start + LOOKUP_CHUNK_SIZE]
+            taken = set(db.session.scalars(
+                select(Ticket.ticket_number).where(Ticket.ticket_number.in_(chunk))))
+            numbers.update(n for n in chunk if n not in taken)
+    return list(numbers)
+
+
+def render_qr_png(data):
+    # Runs in a worker process, so keep it free of app and database state
+    import qrcode
+
+    # A fixed mask pattern skips scoring all eight masks, which is most of
+    # the rendering time; any mask is valid for scanners
+    code = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M,
+                         box_size=6, border=4, mask_pattern=0)
+    code.add_data(data)
+    code.make(fit=True)
+    buffer = io.BytesIO()
+    code.make_image().save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def render_and_store_qr(ticket_number, root):
+    return store_blob(root, render_qr_png(ticket_number), 'png')
+
+
+def create_tickets(event_id, user_ids, booking_id=None):
+    # One ticket per entry in user_ids; returns the new ticket numbers
+    numbers = unique_ticket_numbers(len(user_ids))
+    now = datetime.utcnow()
+    rows = [{'ticket_number': number, 'event_id': event_id, 'user_id': user_id,
+             'booking_id': booking_id, 'purchase_date': now, 'status': 'active'}
+            for number, user_id in zip(numbers, user_ids)]
+    for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+        db.session.execute(insert(Ticket), rows[start:start + INSERT_CHUNK_SIZE])
+    return numbers
+
+
+def render_qr_codes(ticket_numbers, map_cpu=None, chunksize=64):
+    # Render and store the QR codes, then point the tickets at them.
+    # map_cpu is e.g. a job worker's map_cpu; by default a process pool of
+    # TICKET_RENDER_PROCESSES is used for the call.
+    root = upload_root()
+    if map_cpu is not None:
+        paths = map_cpu(render_and_store_qr, ticket_numbers,
+                        repeat(root, len(ticket_numbers)), chunksize=chunksize)
+    else:
+        processes = current_app.config['TICKET_RENDER_PROCESSES']
+        with ProcessPoolExecutor(
+                processes, mp_context=multiprocessing.get_context('spawn')) as pool:
+            paths = list(pool.map(render_and_store_qr, ticket_numbers,
+                                  repeat(root), chunksize=chunksize))
+
+    table = Ticket.__table__
+    statement = (update(table)
+                 .where(table.c.ticket_number == bindparam('number'))
+                 .values(qr_code=bindparam('path')))
+    params = [{'number': number, 'path': path}
+              for number, path in zip(ticket_numbers, paths)]
+    for start in range(0, len(params), INSERT_CHUNK_SIZE):
+        db.session.execute(statement, params[start:start + INSERT_CHUNK_SIZE])
+
+
+def issue_tickets_bulk(event_id, user_ids, booking_id=None, map_cpu=None):
+    numbers = create_tickets(event_id, user_ids, booking_id)
+    db.session.commit()
+    render_qr_codes(numbers, map_cpu)
+    db.session.commit()
+    return numbers
+
+
+@job('issue_tickets')
+def issue_tickets(payload, worker):
+    booking = db.session.get(Booking, payload['booking_id'])
+    if booking is None or booking.status != 'confirmed':
+        return
+
+    # Only create what's missing, so a retried job never duplicates tickets
+    existing = Ticket.query.filter_by(booking_id=booking.id).count()
+    missing = booking.tickets_count - existing
+    if missing > 0:
+        create_tickets(booking.event_id, [booking.user_id] * missing, booking.id)
+        db.session.commit()
+
+    pending = db.session.scalars(select(Ticket.ticket_number).where(
+        Ticket.booking_id == booking.id, Ticket.qr_code.is_(None))).all()
+    if pending:
+        render_qr_codes(pending, worker.map_cpu)
+        db.session.commit()
+
+
+@click.command('tickets-issue')
+@click.argument('event_id', type=int)
+@click.argument('count', type=int)
+@click.option('--user', 'user_id', type=int,
+              help='Ticket holder (default: the event organizer).')
+@with_appcontext
+def issue_command(event_id, count, user_id):
+    """Issue COUNT tickets for EVENT_ID in one batch."""
+    event = db.session.get(Event, event_id)
+    if event is None:
+        raise click.ClickException(f'Event {event_id} not found.')
+    numbers = issue_tickets_bulk(event.id, [user_id or event.organizer_id] * count)
+    click.echo(f'Issued {len(numbers)} tickets, QR codes in {upload_path()}.')
@@ -0,0 +1,403 @@
+# Bulk import and export.
+#
+# `flask events-import`, `users-import` and `bookings-import` read CSV or
+# JSON Lines one row at a time, validate every row and insert valid rows
+# through the ORM in chunks, one transaction per chunk, so the search index,
+# stats and page cache hooks all see them. Invalid rows are reported with
+# their line number and skipped. Each reads the columns its `flask export`
+# counterpart writes:
+#
+#   events    validated like EventForm, owned by the --organizer
+#   users     no password is exported, so imported users get none and can't
+#             log in until one is set
+#   bookings  the event by id and the user by email; confirmed bookings take
+#             their tickets from the event and have tickets and confirmation
+#             queued, like a booking made on the site
+#
+# `flask export` streams events, bookings or users as CSV or JSON Lines,
+# fetching EXPORT_BATCH_SIZE rows at a time, so memory stays flat however
+# big the table is.
+
+import csv
+import json
+import sys
+from datetime import date, datetime
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from sqlalchemy.orm import aliased
+from werkzeug.datastructures import MultiDict
+from wtforms import DateTimeField, FloatField, Form, IntegerField, SelectField, StringField
+from wtforms.validators import DataRequired, Email, Length, NumberRange, Optional
+
+from app import db
+from app.booking import generate_booking_number, queue_fulfilment, reserve_tickets
+from app.forms import EventForm
+from app.models import Booking, Event, User
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_BATCH_SIZE = 1000
+FORMATS = ('csv', 'jsonl')
+
+
+def init_app(app):
+    app.cli.add_command(import_events_command)
+    app.cli.add_command(import_users_command)
+    app.cli.add_command(import_bookings_command)
+    app.cli.add_command(export_command)
+
+
+# Reading and writing
+
+def detect_format(filename, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if filename.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+def read_rows(stream, fmt):
+    # Yields (line number, dict of strings)
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, ValueError(f'invalid JSON: {e}')
+            continue
+        if not isinstance(row, dict):
+            yield line_no, ValueError('expected a JSON object')
+            continue
+        yield line_no, {key: '' if value is None else str(value)
+                        for key, value in row.items()}
+
+
+def _plain(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def write_rows(stream, fmt, columns, rows):
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow([_plain(value) for value in row])
+            count += 1
+        return count
+
+    for row in rows:
+        stream.write(json.dumps(dict(zip(columns, map(_plain, row)))))
+        stream.write('\n')
+        count += 1
+    return count
+
+
+# Import
+
+def _errors(form):
+    return '; '.join(f'{field}: {", ".join(messages)}'
+                     for field, messages in form.errors.items())
+
+
+def import_rows(rows, build, chunk_size=IMPORT_CHUNK_SIZE, on_error=None,
+                dry_run=False, on_flush=None):
+    # rows are (line number, dict or exception) pairs from read_rows();
+    # build(row) returns (model, None) or (None, error). on_flush(models)
+    # runs once a chunk has ids, before it commits. Returns (imported, failed).
+    imported = failed = 0
+    chunk = []
+
+    def flush():
+        if dry_run:
+            # Undo anything build() wrote, such as ticket reservations
+            db.session.rollback()
+        else:
+            db.session.add_all(chunk)
+            if on_flush is not None:
+                db.session.flush()
+                on_flush(chunk)
+            db.session.commit()
+            # Don't keep a whole import's worth of objects in the session
+            db.session.expunge_all()
+        chunk.clear()
+
+    for line_no, row in rows:
+        if isinstance(row, Exception):
+            model, error = None, str(row)
+        else:
+            model, error = build(row)
+        if model is None:
+            failed += 1
+            if on_error is not None:
+                on_error(line_no, error)
+            continue
+        chunk.append(model)
+        imported += 1
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return imported, failed
+
+
+def validate_event(row):
+    # (form, None) when the row passes EventForm, else (None, errors)
+    form = EventForm(formdata=MultiDict(row), meta={'csrf': False})
+    if form.validate():
+        return form, None
+    return None, _errors(form)
+
+
+def event_from_form(form, organizer_id):
+    # Same fields as the create_event view
+    return Event(
+        title=form.title.data,
+        description=form.description.data,
+        date=datetime.combine(form.date.data, form.time.data),
+        time=form.time.data.strftime('%H:%M'),
+        location=form.location.data,
+        address=form.address.data,
+        category=form.category.data,
+        price=form.price.data,
+        capacity=form.capacity.data,
+        available_tickets=form.capacity.data,
+        organizer_id=organizer_id,
+        status='active'
+    )
+
+
+def import_events(rows, organizer_id, chunk_size=IMPORT_CHUNK_SIZE,
+                  on_error=None, dry_run=False):
+    def build(row):
+        form, error = validate_event(row)
+        if form is None:
+            return None, error
+        return event_from_form(form, organizer_id), None
+
+    return import_rows(rows, build, chunk_size, on_error, dry_run)
+
+
+class UserRow(Form):
+    email = StringField(validators=[DataRequired(), Email(), Length(max=120)])
+    name = StringField(validators=[Optional(), Length(max=100)])
+    phone = StringField(validators=[Optional(), Length(max=20)])
+    role = SelectField(choices=['attendee', 'organizer', 'admin'],
+                       validators=[Optional()])
+
+
+def import_users(rows, chunk_size=IMPORT_CHUNK_SIZE, on_error=None, dry_run=False):
+    seen = set()
+
+    def build(row):
+        form = UserRow(MultiDict(row))
+        if not form.validate():
+            return None, _errors(form)
+        email = form.email.data
+        if email in seen or User.query.filter_by(email=email).first():
+            return None, f'email: {email} is already registered.'
+        seen.add(email)
+        return User(email=email, name=form.name.data or None,
+                    phone=form.phone.data or None,
+                    role=form.role.data or 'attendee'), None
+
+    return import_rows(rows, build, chunk_size, on_error, dry_run)
+
+
+class BookingRow(Form):
+    booking_number = StringField(validators=[Optional(), Length(max=20)])
+    event_id = IntegerField(validators=[DataRequired()])
+    user_email = StringField(validators=[DataRequired(), Email()])
+    tickets_count = IntegerField(validators=[DataRequired(), NumberRange(min=1)])
+    total_amount = FloatField(validators=[Optional(), NumberRange(min=0)])
+    # Holds belong to a live checkout, so pending bookings aren't imported
+    status = SelectField(choices=['confirmed', 'cancelled', 'expired'],
+                         validators=[Optional()])
+    booking_date = DateTimeField(format=['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S',
+                                         '%Y-%m-%d %H:%M:%S'],
+                                 validators=[Optional()])
+
+
+def import_bookings(rows, chunk_size=IMPORT_CHUNK_SIZE, on_error=None,
+                    dry_run=False):
+    numbers = set()
+    user_ids = {}
+
+    def build(row):
+        form = BookingRow(MultiDict(row))
+        if not form.validate():
+            return None, _errors(form)
+        event = db.session.get(Event, form.event_id.data)
+        if event is None:
+            return None, f'event_id: no event {form.event_id.data}.'
+        email = form.user_email.data
+        if email not in user_ids:
+            user_ids[email] = db.session.scalar(select(User.id).where(User.email == email))
+        if user_ids[email] is None:
+            return None, f'user_email: no user {email}.'
+        number = form.booking_number.data or generate_booking_number()
+        if number in numbers or Booking.query.filter_by(booking_number=number).first():
+            return None, f'booking_number: {number} already exists.'
+
+        status = form.status.data or 'confirmed'
+        tickets_count = form.tickets_count.data
+        if status == 'confirmed' and not reserve_tickets(event.id, tickets_count):
+            return None, f'tickets_count: event {event.id} has not enough tickets left.'
+        numbers.add(number)
+        total_amount = form.total_amount.data
+        return Booking(
+            booking_number=number,
+            event_id=event.id,
+            user_id=user_ids[email],
+            tickets_count=tickets_count,
+            total_amount=event.price * tickets_count if total_amount is None else total_amount,
+            status=status,
+            booking_date=form.booking_date.data or datetime.utcnow()
+        ), None
+
+    def fulfil(bookings):
+        for booking in bookings:
+            if booking.status == 'confirmed':
+                queue_fulfilment(booking)
+
+    return import_rows(rows, build, chunk_size, on_error, dry_run, on_flush=fulfil)
+
+
+def import_options(command):
+    # Options shared by the *-import commands
+    for option in reversed([
+            click.argument('source', type=click.File('r', encoding='utf-8')),
+            click.option('--format', 'fmt', type=click.Choice(FORMATS),
+                         help='Input format (default: from the file extension).'),
+            click.option('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                         show_default=True),
+            click.option('--dry-run', is_flag=True, help='Validate only, insert nothing.')]):
+        command = option(command)
+    return command
+
+
+def run_import(importer, noun, source, fmt, dry_run, *args, **kwargs):
+    def report(line_no, error):
+        click.echo(f'line {line_no}: {error}', err=True)
+
+    rows = read_rows(source, detect_format(source.name, fmt))
+    imported, failed = importer(rows, *args, on_error=report, dry_run=dry_run, **kwargs)
+    verb = 'Validated' if dry_run else 'Imported'
+    click.echo(f'{verb} {imported} {noun}, {failed} rows rejected.')
+    if failed:
+        sys.exit(1)
+
+
+@click.command('events-import')
+@import_options
+@click.option('--organizer', 'organizer_email', required=True,
+              help='Email of the organizer who will own the events.')
+@with_appcontext
+def import_events_command(source, fmt, chunk_size, dry_run, organizer_email):
+    """Import events from a CSV or JSON Lines file ("-" for stdin)."""
+    organizer = User.query.filter_by(email=organizer_email).first()
+    if organizer is None or organizer.role not in ('organizer', 'admin'):
+        raise click.ClickException(f'{organizer_email} is not an organizer.')
+    run_import(import_events, 'events', source, fmt, dry_run, organizer.id,
+               chunk_size=chunk_size)
+
+
+@click.command('users-import')
+@import_options
+@with_appcontext
+def import_users_command(source, fmt, chunk_size, dry_run):
+    """Import users, without passwords, from a CSV or JSON Lines file."""
+    run_import(import_users, 'users', source, fmt, dry_run, chunk_size=chunk_size)
+
+
+@click.command('bookings-import')
+@import_options
+@with_appcontext
+def import_bookings_command(source, fmt, chunk_size, dry_run):
+    """Import bookings from a CSV or JSON Lines file ("-" for stdin)."""
+    run_import(import_bookings, 'bookings', source, fmt, dry_run, chunk_size=chunk_size)
+
+
+# Export
+
+def _events_query(since):
+    organizer = aliased(User)
+    query = (select(Event.id, Event.title, Event.description, Event.date,
+                    Event.time, Event.location, Event.address, Event.category,
+                    Event.price, Event.capacity, Event.available_tickets,
+                    Event.status, organizer.email.label('organizer_email'),
+                    Event.created_at)
+             .outerjoin(organizer, Event.organizer_id == organizer.id)
+             .order_by(Event.id))
+    if since is not None:
+        query = query.where(Event.created_at >= since)
+    return query
+
+
+def _bookings_query(since):
+    query = (select(Booking.id, Booking.booking_number, Booking.event_id,
+                    Event.title.label('event_title'), Booking.user_id,
+                    User.email.label('user_email'), Booking.tickets_count,
+                    Booking.total_amount, Booking.status, Booking.booking_date)
+             .join(Event, Booking.event_id == Event.id)
+             .join(User, Booking.user_id == User.id)
+             .order_by(Booking.id))
+    if since is not None:
+        query = query.where(Booking.booking_date >= since)
+    return query
+
+
+def _users_query(since):
+    # Never export password hashes
+    query = (select(User.id, User.email, User.name, User.phone, User.role,
+                    User.created_at)
+             .order_by(User.id))
+    if since is not None:
+        query = query.where(User.created_at >= since)
+    return query
+
+
+EXPORTS = {
+    'events': _events_query,
+    'bookings': _bookings_query,
+    'users': _users_query,
+}
+
+
+def export_rows(kind, since=None):
+    # (column names, row iterator); rows are fetched in batches
+    result = db.session.execute(
+        EXPORTS[kind](since).execution_options(yield_per=EXPORT_BATCH_SIZE))
+    columns = list(result.keys())
+    if kind == 'events':
+        # Split date and time like the import expects
+        date_index = columns.index('date')
+        rows = (row[:date_index] + (row[date_index].date(),) + row[date_index + 1:]
+                for row in result)
+        return columns, rows
+    return columns, iter(result)
+
+
+@click.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8', lazy=True),
+              default='-', help='Output file (default: stdout).')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS),
+              help='Output format (default: from the file extension).')
+@click.option('--since', type=click.DateTime(),
+              help='Only rows created (bookings: booked) on or after this time.')
+@with_appcontext
+def export_command(kind, output, fmt, since):
+    """Export events, bookings or users as CSV or JSON Lines."""
+    columns, rows = export_rows(kind, since)
+    count = write_rows(output, detect_format(output.name, fmt), columns, rows)
+    click.echo(f'Exported {count} {kind}.', err=True)
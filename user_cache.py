@@ -0,0 +1,143 @@
+# Per-process cache of logged-in users for Flask-Login.
+#
+# load_user runs on every authenticated request. Instead of a SELECT each
+# time it returns a read-only UserSnapshot of the user's columns from a
+# bounded LRU with a TTL. Anything the snapshot doesn't hold (relationships,
+# methods such as check_password) is read from the real User, loaded on
+# first use. Code that changes a user must load the User model itself;
+# changes are picked up here once they commit.
+#
+# The process that commits a change drops the user's snapshot right away.
+# Every change also bumps a shared generation counter (in stat_counter),
+# which each process reads along with a user, reloading one at most every
+# USER_CACHE_CHECK_INTERVAL seconds; if it moved, the whole cache is dropped. So a demoted admin or
+# deleted user is seen by every worker within that interval, not the TTL.
+
+import threading
+import time
+
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event as sa_event, select
+from sqlalchemy.orm import Session, object_session
+
+from app import db, stats
+from app.cache import LRUCache
+from app.models import StatCounter, User
+
+GENERATION_COUNTER = 'user_cache_generation'
+
+
+class UserSnapshot(UserMixin):
+    FIELDS = ('id', 'email', 'name', 'phone', 'role', 'created_at')
+
+    def __init__(self, user):
+        for field in self.FIELDS:
+            object.__setattr__(self, field, getattr(user, field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            f'UserSnapshot is read-only, load the User to change {name!r}')
+
+    @property
+    def model(self):
+        # The session identity map makes repeated calls free. None if the
+        # user was deleted since the snapshot was taken.
+        user = db.session.get(User, self.id)
+        if user is None:
+            invalidate(self.id)
+        return user
+
+    def __getattr__(self, name):
+        # Only called for attributes not set in __init__
+        if name.startswith('__'):
+            raise AttributeError(name)
+        user = self.model
+        if user is None:
+            raise AttributeError(f'User {self.id} no longer exists')
+        return getattr(user, name)
+
+    def __repr__(self):
+        return f'<UserSnapshot {self.id}>'
+
+
+class _Generation:
+    # The last generation this process saw, and when it looked
+    def __init__(self):
+        self.value = None
+        self.checked_at = float('-inf')
+        self.lock = threading.Lock()
+
+    def due(self, interval):
+        return time.monotonic() - self.checked_at >= interval
+
+    def update(self, value, cache):
+        # Drop every snapshot if another process changed a user since we
+        # last looked
+        with self.lock:
+            if value != self.value:
+                cache.clear()
+                self.value = value
+            self.checked_at = time.monotonic()
+
+
+def init_app(app):
+    size = app.config['USER_CACHE_SIZE']
+    app.extensions['user_cache'] = (
+        LRUCache(size, app.config['USER_CACHE_TTL']) if size else None)
+    app.extensions['user_cache_generation'] = _Generation()
+
+
+def load(user_id):
+    cache = current_app.extensions.get('user_cache')
+    if cache is None:
+        return db.session.get(User, user_id)
+
+    generation = current_app.extensions['user_cache_generation']
+    if not generation.due(current_app.config['USER_CACHE_CHECK_INTERVAL']):
+        snapshot = cache.get(user_id)
+        if snapshot is not None:
+            return snapshot
+
+    # The shared generation comes with the user, so checking it never
+    # costs a request more than the one query a cache miss does
+    shared = (select(StatCounter.value)
+              .where(StatCounter.name == GENERATION_COUNTER).scalar_subquery())
+    row = db.session.execute(select(User, shared).where(User.id == user_id)).one_or_none()
+    if row is None:
+        cache.delete(user_id)
+        return None
+    user, value = row
+    generation.update(value or 0, cache)
+    snapshot = UserSnapshot(user)
+    cache.set(user_id, snapshot)
+    return snapshot
+
+
+def invalidate(*user_ids):
+    cache = current_app.extensions.get('user_cache')
+    if cache is not None:
+        for user_id in user_ids:
+            cache.delete(user_id)
+
+
+def _user_changed(mapper, connection, target):
+    object_session(target).info.setdefault('user_cache_ids', set()).add(target.id)
+    # Commits or rolls back with the change itself
+    stats.increment(connection, StatCounter, {'name': GENERATION_COUNTER}, {'value': 1})
+
+
+sa_event.listen(User, 'after_update', _user_changed)
+sa_event.listen(User, 'after_delete', _user_changed)
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(db_session):
+    user_ids = db_session.info.pop('user_cache_ids', None)
+    if user_ids and has_app_context():
+        invalidate(*user_ids)
+
+
+@sa_event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(db_session):
+    db_session.info.pop('user_cache_ids', None)
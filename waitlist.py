@@ -0,0 +1,173 @@
+# Per-event waitlists.
+#
+# Users join the waitlist of a sold-out event and are served in entry id
+# order (FIFO) through the (event_id, status, id) index, so finding the
+# next users costs the same for 10 or 100k waiting. Whenever tickets come
+# back (a cancellation, a capacity increase, an expired hold) promote()
+# turns the next entries into holds with WAITLIST_HOLD_SECONDS to pay, a
+# batch of entries per transaction, and queues an email for each.
+# Promotion is strictly FIFO: it stops at the first entry that wants more
+# tickets than are left, rather than letting later, smaller ones jump it.
+
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app import db, jobs
+from app.booking import BOOKING_NUMBER_ATTEMPTS, BookingError, generate_booking_number, reserve_tickets
+from app.models import Booking, Event, WaitlistEntry
+
+
+class AlreadyWaiting(BookingError):
+    pass
+
+
+class _Conflict(Exception):
+    # Someone else promoted or booked at the same time; retry the batch
+    pass
+
+
+def init_app(app):
+    app.cli.add_command(promote_command)
+
+
+def has_waiting(event_id):
+    return db.session.scalar(
+        select(WaitlistEntry.id)
+        .where(WaitlistEntry.event_id == event_id, WaitlistEntry.status == 'waiting')
+        .limit(1)) is not None
+
+
+def waiting_entry(event_id, user_id):
+    return WaitlistEntry.query.filter_by(
+        event_id=event_id, user_id=user_id, status='waiting').first()
+
+
+def position(entry):
+    # 1 for the next in line; counts index entries, no table rows
+    return db.session.scalar(
+        select(func.count())
+        .where(WaitlistEntry.event_id == entry.event_id,
+               WaitlistEntry.status == 'waiting',
+               WaitlistEntry.id <= entry.id))
+
+
+def join(event, user_id, tickets_count=1):
+    # Adds the user to the end of the line and promotes right away if the
+    # tickets are there; returns the entry
+    if waiting_entry(event.id, user_id) is not None:
+        raise AlreadyWaiting('You are already on the waitlist for this event.')
+    entry = WaitlistEntry(event_id=event.id, user_id=user_id,
+                          tickets_count=tickets_count)
+    db.session.add(entry)
+    db.session.commit()
+    promote(event.id)
+    return entry
+
+
+def leave(event_id, user_id):
+    result = db.session.execute(
+        update(WaitlistEntry)
+        .where(WaitlistEntry.event_id == event_id,
+               WaitlistEntry.user_id == user_id,
+               WaitlistEntry.status == 'waiting')
+        .values(status='left')
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    return result.rowcount > 0
+
+
+def _promote_batch(event_id, batch_size):
+    # Promote up to batch_size entries in one transaction; returns how many
+    event = db.session.execute(
+        select(Event.available_tickets, Event.price)
+        .where(Event.id == event_id, Event.status == 'active')).one_or_none()
+    if event is None or not event.available_tickets:
+        db.session.rollback()
+        return 0
+
+    entries = db.session.execute(
+        select(WaitlistEntry.id, WaitlistEntry.user_id, WaitlistEntry.tickets_count)
+        .where(WaitlistEntry.event_id == event_id, WaitlistEntry.status == 'waiting')
+        .order_by(WaitlistEntry.id)
+        .limit(batch_size)
+        .with_for_update()).all()
+    chosen = []
+    tickets = 0
+    for entry in entries:
+        if tickets + entry.tickets_count > event.available_tickets:
+            break
+        chosen.append(entry)
+        tickets += entry.tickets_count
+    if not chosen:
+        db.session.rollback()
+        return 0
+
+    # Both conditional: nobody else may take these tickets or entries
+    if not reserve_tickets(event_id, tickets):
+        raise _Conflict()
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(WaitlistEntry)
+        .where(WaitlistEntry.id.in_([entry.id for entry in chosen]),
+               WaitlistEntry.status == 'waiting')
+        .values(status='promoted', promoted_at=now)
+        .execution_options(synchronize_session=False))
+    if claimed.rowcount != len(chosen):
+        raise _Conflict()
+
+    expires_at = now + timedelta(seconds=current_app.config['WAITLIST_HOLD_SECONDS'])
+    bookings = [Booking(booking_number=generate_booking_number(), event_id=event_id,
+                        user_id=entry.user_id, tickets_count=entry.tickets_count,
+                        total_amount=event.price * entry.tickets_count,
+                        status='pending', expires_at=expires_at)
+                for entry in chosen]
+    db.session.add_all(bookings)
+    db.session.flush()
+
+    table = WaitlistEntry.__table__
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('entry_id'))
+        .values(booking_id=bindparam('new_booking_id')),
+        [{'entry_id': entry.id, 'new_booking_id': booking.id}
+         for entry, booking in zip(chosen, bookings)])
+    jobs.enqueue_many('send_waitlist_offer',
+                      [{'booking_id': booking.id} for booking in bookings],
+                      [f'waitlist_offer:{booking.booking_number}' for booking in bookings])
+    db.session.commit()
+    return len(chosen)
+
+
+def promote(event_id, batch_size=None):
+    # Give freed tickets to the people waiting; returns how many were
+    # promoted. Call after the change that freed them has been committed.
+    batch_size = batch_size or current_app.config['WAITLIST_PROMOTE_BATCH_SIZE']
+    promoted = 0
+    attempts = 0
+    while True:
+        try:
+            count = _promote_batch(event_id, batch_size)
+        except (_Conflict, IntegrityError):
+            # Lost a race, or a booking number was taken
+            db.session.rollback()
+            attempts += 1
+            if attempts >= BOOKING_NUMBER_ATTEMPTS:
+                current_app.logger.warning(
+                    'Gave up promoting the waitlist of event %s', event_id)
+                return promoted
+            continue
+        promoted += count
+        if count < batch_size:
+            return promoted
+
+
+@click.command('waitlist-promote')
+@click.argument('event_id', type=int)
+@with_appcontext
+def promote_command(event_id):
+    """Promote waitlisted users into any free tickets of an event."""
+    click.echo(f'Promoted {promote(event_id)} waitlist entries.')
@@ -0,0 +1,222 @@
+# Weather enrichment for events.
+#
+# Forecasts are stored as JSON in Event.weather_data together with the time
+# they were fetched. Page renders only ever read that column: when it is
+# missing or older than WEATHER_TTL the event is queued for a background
+# refresh, and the refresh batches all queued events by (location, date) so
+# each pair costs one HTTP call. Lookups also go through an in-memory LRU
+# and a pooled requests.Session, created (and requests imported) on first use.
+# A failed lookup is remembered for WEATHER_FAILURE_TTL, so while the
+# provider is down stale pages don't each wait on it again.
+#
+# The provider is any HTTP endpoint at WEATHER_API_URL that answers
+# GET ?location=<text>&date=<YYYY-MM-DD>[&key=<WEATHER_API_KEY>] with JSON.
+
+import json
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import update
+
+from app import db
+from app.cache import LRUCache, event_tag, invalidate
+from app.models import Event
+
+# Cached in place of a forecast after a failed lookup
+_FAILED = object()
+
+
+class WeatherUnavailable(Exception):
+    pass
+
+
+class WeatherService:
+    def __init__(self, app):
+        self.app = app
+        self.url = app.config['WEATHER_API_URL']
+        self.api_key = app.config['WEATHER_API_KEY']
+        self.ttl = app.config['WEATHER_TTL']
+        self.failure_ttl = app.config['WEATHER_FAILURE_TTL']
+        self.timeout = app.config['WEATHER_TIMEOUT']
+        self.pool_size = app.config['WEATHER_POOL_SIZE']
+        self.lookahead = timedelta(days=app.config['WEATHER_LOOKAHEAD_DAYS'])
+
+        self._session = None
+        self.cache = LRUCache(app.config['WEATHER_CACHE_SIZE'], self.ttl)
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='weather')
+        self._queued = set()
+        self._draining = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.url)
+
+    @property
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=self.pool_size, pool_maxsize=self.pool_size,
+                    max_retries=Retry(total=2, backoff_factor=0.3,
+                                      status_forcelist=(502, 503, 504)))
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def wants_forecast(self, event, now=None):
+        now = now or datetime.utcnow()
+        return bool(event.location) and now <= event.date <= now + self.lookahead
+
+    def lookup(self, location, day):
+        # The forecast, or WeatherUnavailable if the provider failed now or
+        # within the last failure_ttl seconds
+        import requests
+
+        key = (location.strip().lower(), day.isoformat())
+        forecast = self.cache.get(key)
+        if forecast is _FAILED:
+            raise WeatherUnavailable(f'Weather lookup for {key} failed recently')
+        if forecast is None:
+            params = {'location': location, 'date': day.isoformat()}
+            if self.api_key:
+                params['key'] = self.api_key
+            try:
+                response = self.session.get(self.url, params=params, timeout=self.timeout)
+                response.raise_for_status()
+                forecast = response.json()
+            except (requests.RequestException, ValueError) as e:
+                self.app.logger.warning('Weather lookup for %s failed: %s', key, e)
+                if self.failure_ttl:
+                    self.cache.set(key, _FAILED, ttl=self.failure_ttl)
+                raise WeatherUnavailable(str(e)) from e
+            self.cache.set(key, forecast)
+        return forecast
+
+    def refresh(self, events):
+        # Fetch and store forecasts for the events, one call per unique
+        # (location, date); returns the number of events updated
+        groups = defaultdict(list)
+        for event in events:
+            if self.wants_forecast(event):
+                groups[(event.location, event.date.date())].append(event.id)
+        if not groups:
+            return 0
+
+        def fetch(key):
+            try:
+                return key, self.lookup(*key)
+            except WeatherUnavailable:
+                return key, None
+
+        with ThreadPoolExecutor(min(len(groups), self.pool_size)) as pool:
+            results = list(pool.map(fetch, groups))
+
+        fetched_at = datetime.utcnow().isoformat()
+        updated = []
+        for (location, day), forecast in results:
+            if forecast is None:
+                continue
+            ids = groups[(location, day)]
+            value = json.dumps({'fetched_at': fetched_at, 'location': location,
+                                'date': day.isoformat(), 'forecast': forecast})
+            db.session.execute(update(Event).where(Event.id.in_(ids))
+                               .values(weather_data=value)
+                               .execution_options(synchronize_session=False))
+            updated.extend(ids)
+        db.session.commit()
+
+        # Only the detail pages show weather, leave the catalog cache alone
+        invalidate(*[event_tag(event_id) for event_id in updated])
+        return len(updated)
+
+    def schedule(self, event_id):
+        # Queue a background refresh; events queued while one is running are
+        # picked up by the same drain loop
+        with self._lock:
+            self._queued.add(event_id)
+            if self._draining:
+                return
+            self._draining = True
+        self.executor.submit(self._drain)
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                ids = list(self._queued)
+                self._queued.clear()
+                if not ids:
+                    self._draining = False
+                    return
+            try:
+                with self.app.app_context():
+                    self.refresh(Event.query.filter(Event.id.in_(ids)).all())
+                    db.session.remove()
+            except Exception:
+                self.app.logger.exception('Background weather refresh failed')
+
+    def for_event(self, event):
+        # Stored forecast (possibly stale) or None; never touches the network
+        data = parse(event.weather_data)
+        if self.enabled and self.wants_forecast(event):
+            if data is None or is_stale(data, self.ttl):
+                self.schedule(event.id)
+        return data['forecast'] if data else None
+
+
+def parse(weather_data):
+    if not weather_data:
+        return None
+    try:
+        data = json.loads(weather_data)
+    except ValueError:
+        return None
+    if not isinstance(data, dict) or 'forecast' not in data:
+        return None
+    return data
+
+
+def is_stale(data, ttl):
+    try:
+        fetched_at = datetime.fromisoformat(data['fetched_at'])
+    except (KeyError, TypeError, ValueError):
+        return True
+    return datetime.utcnow() - fetched_at > timedelta(seconds=ttl)
+
+
+def init_app(app):
+    app.extensions['weather'] = WeatherService(app)
+    app.cli.add_command(refresh_command)
+
+
+def get_service():
+    return current_app.extensions['weather']
+
+
+def for_event(event):
+    return get_service().for_event(event)
+
+
+@click.command('weather-refresh')
+@with_appcontext
+def refresh_command():
+    """Fetch forecasts for all upcoming active events."""
+    service = get_service()
+    if not service.enabled:
+        raise click.ClickException('WEATHER_API_URL is not set.')
+    now = datetime.utcnow()
+    events = Event.query.filter(Event.status == 'active',
+                                Event.date >= now,
+                                Event.date <= now + service.lookahead).all()
+    click.echo(f'Updated weather for {service.refresh(events)} events.')